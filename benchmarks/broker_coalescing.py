@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Measures how much coalescing identical queries in the instrument broker
+helps when several clients poll the same measurement (the instrument is
+a simulated one taking a few milliseconds per command line)"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.broker import scpi_broker
+from scpi.transports import tcp, broker
+from scpi.emulators import simulated_instrument, tcp_server
+
+
+def measure(coalesce, clients, queries, processing_delay):
+    instrument = simulated_instrument()
+    instrument.processing_delay = processing_delay
+    instrument.add_command("MEASure:VOLTage?", lambda args: "+1.23450E+00")
+    server = tcp_server(instrument).start()
+    path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+    instrument_broker = scpi_broker(tcp(server.address[0], server.address[1]), path, coalesce).start()
+    devices = [scpi(broker(path)) for _ in range(clients)]
+    for dev in devices:
+        dev.command_timeout = 30
+
+    def worker(dev):
+        for _ in range(queries):
+            dev.ask_float("MEAS:VOLT?")
+
+    workers = [threading.Thread(target=worker, args=(dev,)) for dev in devices]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+    transactions = instrument_broker.transactions
+    for dev in devices:
+        dev.quit()
+    instrument_broker.stop()
+    server.stop()
+    os.rmdir(os.path.dirname(path))
+    return (elapsed, transactions)
+
+
+def run(clients=8, queries=25, processing_delay=0.005):
+    print("%d clients, %d queries each, %.1f ms per command line" % (clients, queries, processing_delay * 1e3))
+    for coalesce in (False, True):
+        elapsed, transactions = measure(coalesce, clients, queries, processing_delay)
+        print("  %-14s %4d instrument transactions, %6.0f client queries/s" % (
+            "coalesced" if coalesce else "not coalesced", transactions, clients * queries / elapsed))
+
+
+if __name__ == '__main__':
+    run()
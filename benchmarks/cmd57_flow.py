@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Runs the cmd57 high-level flow (configure_man, switch_to_man_btch and the
+burst, spectrum and BER measurements) against the simulated CMD57 and
+reports the time per flow, the commands it took and where the time went
+
+By default the instrument timing is scaled to zero so the numbers are the
+software and link overhead, --time-scale 1 gives ballpark real timing and
+--baudrate puts the instrument on an emulated serial line (like the 9600
+baud the real one is used at) instead of loopback TCP."""
+import argparse
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import serial as pyserial
+from scpi.devices.cmd57 import cmd57
+from scpi.transports import tcp, rs232
+from scpi.emulators import cmd57_instrument, tcp_server, serial_server
+
+
+def flow(dev, arfcn):
+    """One BTS measurement round, returns the results"""
+    dev.switch_to_none()
+    dev.configure_man(ccch_arfcn=arfcn, tch_arfcn=arfcn, tch_ts=2, tsc=7, expected_power=30, tch_tx_power=-60,
+                      tch_mode="PR9", tch_timing=0)
+    dev.switch_to_man_btch()
+    results = {
+        'power': dev.ask_burst_power_avg(),
+        'phase_rms': dev.fetch_phase_err_rms(),
+        'phase_peak': dev.fetch_phase_err_pk(),
+        'freq_error': dev.fetch_freq_err(),
+        'phase_freq_match': dev.ask_phase_freq_match(),
+        'spectrum_modulation': dev.ask_spectrum_modulation(),
+        'ber': dev.read_ber_test_result(),
+        'class_1b_events': dev.fetch_ber_class_1b_events(),
+    }
+    return results
+
+
+def run(flows=50, time_scale=0.0, baudrate=None):
+    instrument = cmd57_instrument(time_scale, seed=1)
+    if baudrate:
+        server = serial_server(instrument, baudrate).start()
+        transport = rs232(pyserial.Serial(server.port_name, baudrate, timeout=0))
+    else:
+        server = tcp_server(instrument).start()
+        transport = tcp(server.address[0], server.address[1])
+    dev = cmd57(transport)
+    try:
+        dev.scpi.enable_stats()
+        start = time.time()
+        cpu_start = time.process_time()
+        for index in range(flows):
+            results = flow(dev, 1 + index % 124)
+            assert results['ber'] in ("PASS", "FAIL"), results
+        elapsed = time.time() - start
+        cpu_used = time.process_time() - cpu_start
+        stats = dev.scpi.stats.as_dict()
+        commands = sum(header['commands'] for header in stats.values())
+        print("%d flows over %s, time scale %.2f" % (flows, "%d baud serial" % baudrate if baudrate else "TCP",
+                                                     time_scale))
+        print("  Per flow:     %.1f ms" % (elapsed / flows * 1e3))
+        print("  CPU per flow: %.1f ms" % (cpu_used / flows * 1e3))
+        print("  Commands:     %.1f per flow" % (float(commands) / flows))
+        print("  Mode switches %.1f per flow" % (float(instrument.mode_switches) / flows))
+        print("  Slowest headers (total time):")
+
+        def total(histogram):
+            return histogram.get('mean', 0) * histogram['count']
+
+        totals = []
+        for header, header_stats in stats.items():
+            if header == "SYST:ERR?":
+                # Counted in the error checks of the commands
+                continue
+            if header_stats['response']['count']:
+                totals.append((total(header_stats['response']), header))
+            else:
+                # Setting commands finish by the time their error check is answered
+                totals.append((total(header_stats['write']) + total(header_stats['error_check']), header))
+        for total, header in sorted(totals, reverse=True)[:5]:
+            print("    %-36s %.1f ms per flow" % (header, total / flows * 1e3))
+    finally:
+        dev.quit()
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flows", type=int, default=50)
+    parser.add_argument("--time-scale", type=float, default=0.0, help="Instrument timing multiplier")
+    parser.add_argument("--baudrate", type=int, help="Emulated serial line speed (default loopback TCP)")
+    args = parser.parse_args()
+    run(args.flows, args.time_scale, args.baudrate)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Reports the bytes on the wire the command compiler saves across the
+cmd57 command set and the per-command encoding cost with and without it
+
+The commands are collected from the cmd57 source (every string or
+"template" % value given to send_command or an ask_* method), templates
+are filled with typical values formatted the way cmd57 formats them."""
+import ast
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.compiler import command_compiler
+
+SOURCE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'scpi', 'devices', 'cmd57.py')
+LINE_TERMINATOR = "\r\n"
+BAUDRATE = 9600
+
+
+def fill_template(template):
+    """Fills the % placeholders with typical values"""
+    values = []
+    for piece in template.split('%')[1:]:
+        if piece.startswith('d'):
+            values.append(10)
+        elif piece.startswith('s'):
+            values.append("5.00,-10.00")
+        else:
+            values.append(5.0)
+    return template % tuple(values)
+
+
+def collect_commands():
+    with open(SOURCE) as source_file:
+        tree = ast.parse(source_file.read())
+    commands = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute) or not node.args:
+            continue
+        name = node.func.attr
+        if name != 'send_command' and not name.startswith('ask_'):
+            continue
+        arg = node.args[0]
+        if isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Mod):
+            arg = arg.left
+        if isinstance(arg, ast.BinOp) and isinstance(arg.op, ast.Add):
+            # "CONF:..." + "%s" split over two lines
+            parts = [arg.left, arg.right]
+            if all(isinstance(part, ast.Constant) and isinstance(part.value, str) for part in parts):
+                commands.append(fill_template(parts[0].value + parts[1].value))
+            continue
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            commands.append(fill_template(arg.value))
+    return commands
+
+
+def run(rounds=2000):
+    commands = collect_commands()
+    compiler = command_compiler(LINE_TERMINATOR)
+    long_bytes = sum(len((command + LINE_TERMINATOR).encode('utf-8')) for command in commands)
+    short_bytes = sum(len(compiler.encode(command)) for command in commands)
+    print("%d cmd57 commands" % len(commands))
+    print("  Long forms:  %d bytes (%.0f ms at %d baud)" % (long_bytes, long_bytes * 10e3 / BAUDRATE, BAUDRATE))
+    print("  Compiled:    %d bytes (%.0f ms at %d baud)" % (short_bytes, short_bytes * 10e3 / BAUDRATE, BAUDRATE))
+    print("  Saved:       %.1f %%" % (100.0 * (long_bytes - short_bytes) / long_bytes))
+    longest = max(commands, key=lambda command: len(command) - len(compiler.compile(command)))
+    print("  Largest win: %s -> %s" % (longest, compiler.compile(longest)))
+
+    start = time.time()
+    for _ in range(rounds):
+        for command in commands:
+            (command + LINE_TERMINATOR).encode('utf-8')
+    plain = (time.time() - start) / (rounds * len(commands))
+    start = time.time()
+    for _ in range(rounds):
+        for command in commands:
+            compiler.encode(command)
+    memoized = (time.time() - start) / (rounds * len(commands))
+    print("Encoding per command")
+    print("  Concatenate and encode: %.2f us" % (plain * 1e6))
+    print("  Compiler (memoized):    %.2f us" % (memoized * 1e6))
+
+
+if __name__ == '__main__':
+    run()
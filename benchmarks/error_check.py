@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Compares the error check methods (SYST:ERR? after every command vs the
+*STB? and *ESR? status register fast paths, see scpi.set_error_check()) on
+hp6632b and cmd57 setting sequences against the simulated instruments on
+an emulated serial line
+
+Reports the time and the bytes on the wire per checked command, and how
+many commands raised CommandError with a few injected errors (an error
+injected into the status query line is reported with the next command,
+several errors reported at once raise only once)."""
+import argparse
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import serial as pyserial
+from scpi.errors import CommandError
+from scpi.devices import hp6632b
+from scpi.devices.cmd57 import cmd57
+from scpi.transports import rs232
+from scpi.emulators import serial_server, hp6632b_instrument, cmd57_instrument
+
+METHODS = ('queue', 'stb', 'esr')
+
+
+def hp6632b_sequence(dev):
+    dev.set_voltage(5000)
+    dev.set_current(1000)
+    dev.set_measure_current_max(0.020)
+    dev.set_output(True)
+    dev.display_on(True)
+
+
+def cmd57_sequence(dev):
+    dev.set_io_used("I1O2")
+    dev.set_bts_ccch_arfcn(10)
+    dev.set_bts_tch_arfcn(20)
+    dev.set_bts_tch_ts(2)
+    dev.set_bts_tsc(7)
+    dev.set_bts_expected_power(30)
+    dev.set_bts_tch_tx_power(-60)
+    dev.set_bts_tch_mode("PR9")
+    dev.set_bts_tch_timing(0)
+
+
+def measure(name, make_device, instrument, sequence, commands, rounds, baudrate, error_rate):
+    print("%s, %d checked commands per method, %d baud" % (name, commands * rounds, baudrate))
+    for method in METHODS:
+        server = serial_server(instrument, baudrate, seed=1).start()
+        dev = make_device(server.port_name, baudrate)
+        try:
+            dev.scpi.set_error_check(method)
+            bytes_before = server.bytes_received + server.bytes_sent
+            start = time.time()
+            for _ in range(rounds):
+                sequence(dev)
+            elapsed = time.time() - start
+            wire_bytes = server.bytes_received + server.bytes_sent - bytes_before
+
+            server.error_rate = error_rate
+            raised = 0
+            for _ in range(rounds):
+                try:
+                    sequence(dev)
+                except CommandError:
+                    raised += 1
+            server.error_rate = 0.0
+            # The last injected error may still be in the queue
+            leftover = len(dev.scpi.pending_errors())
+            print("  %-5s  %6.2f ms per command, %5.1f bytes per command, %d injected errors, raised %d times "
+                  "(%d left over)" % (method, elapsed / (commands * rounds) * 1e3,
+                                      float(wire_bytes) / (commands * rounds), server.injected_errors, raised,
+                                      leftover))
+        finally:
+            dev.quit()
+            server.stop()
+
+
+def run(baudrate=9600, rounds=10, error_rate=0.05):
+    def make_hp6632b(port_name, baudrate):
+        dev = hp6632b.rs232(port_name)
+        dev.scpi.transport.serial_port.baudrate = baudrate
+        return dev
+
+    def make_cmd57(port_name, baudrate):
+        return cmd57(rs232(pyserial.Serial(port_name, baudrate, timeout=0)))
+
+    measure("hp6632b", make_hp6632b, hp6632b_instrument(), hp6632b_sequence, 5, rounds, baudrate, error_rate)
+    measure("cmd57", make_cmd57, cmd57_instrument(0.0), cmd57_sequence, 9, rounds, baudrate, error_rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baudrate", type=int, default=9600, help="Emulated serial line speed")
+    parser.add_argument("--rounds", type=int, default=10, help="Times to run each command sequence")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.baudrate, args.rounds, args.error_rate)
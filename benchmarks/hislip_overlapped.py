@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Compares query throughput of the HiSLIP transport in synchronized and
+overlapped modes, several threads share one scpi instance and the server
+adds a fixed latency to each response (as a network round trip would)"""
+import os
+import sys
+import threading
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.transports import hislip
+from scpi.emulators import simulated_instrument, hislip_server
+
+
+def measure(dev, threads, queries):
+    def worker():
+        for _ in range(queries):
+            dev.ask_float("MEASure:VOLTage?")
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return threads * queries / (time.time() - start)
+
+
+def run(latency=0.001, queries=200, thread_counts=(1, 4, 16)):
+    instrument = simulated_instrument()
+    instrument.add_command("MEASure:VOLTage?", lambda args: "+1.23450E+00")
+    server = hislip_server(instrument, response_latency=latency).start()
+    print("Response latency %.1f ms, %d queries per thread" % (latency * 1e3, queries))
+    for overlapped in (False, True):
+        dev = scpi(hislip(server.address[0], server.address[1], overlapped=overlapped))
+        for threads in thread_counts:
+            print("  %-12s %2d threads: %6.0f queries/s" % (
+                "overlapped" if overlapped else "synchronized", threads, measure(dev, threads, queries)))
+        dev.quit()
+    server.stop()
+
+
+if __name__ == '__main__':
+    run()
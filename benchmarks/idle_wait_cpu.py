@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Measures how much CPU the scpi core burns while waiting for slow responses
+
+Uses an in-process loopback transport that answers every query after a fixed
+delay, so the only thing being measured is the waiting in
+scpi.send_command_unchecked (and the added latency on top of the delay)"""
+import os
+import sys
+import threading
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.transports import base
+
+
+class delayed_loopback(base):
+    """Answers each query with "1" after response_delay seconds"""
+
+    def __init__(self, response_delay, *args, **kwargs):
+        super(delayed_loopback, self).__init__(*args, **kwargs)
+        self.response_delay = response_delay
+
+    def quit(self):
+        pass
+
+    def send_command(self, command):
+        if command.endswith('?'):
+            timer = threading.Timer(self.response_delay, self.message_received, ('1',))
+            timer.daemon = True
+            timer.start()
+
+    def incoming_data(self):
+        return False
+
+    def abort_command(self):
+        pass
+
+
+def run(queries=10, response_delay=0.2):
+    dev = scpi(delayed_loopback(response_delay))
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    for _ in range(queries):
+        dev.ask_int("*OPC?")
+    cpu_used = time.process_time() - cpu_start
+    wall_used = time.time() - wall_start
+    print("%d queries, %.0f ms response delay" % (queries, response_delay * 1000))
+    print("  CPU usage while waiting: %.2f %%" % (100.0 * cpu_used / wall_used))
+    print("  Added latency per query: %.3f ms" % ((wall_used / queries - response_delay) * 1000))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Compares the list backends of scpi.pop_float_list / pop_int_list
+
+Parses a reply shaped like the 669 value burst power array of the CMD57"""
+import os
+import random
+import sys
+import timeit
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.scpi import numpy
+from scpi.transports import base
+
+
+def run(values=669, rounds=200):
+    float_reply = ",".join("%.2f" % random.uniform(-80, 0) for _ in range(values - 1)) + ",NAN"
+    int_reply = ",".join("%d" % random.randint(-1000, 1000) for _ in range(values))
+    dev = scpi(base())
+    backends = ['list', 'array']
+    if numpy is not None:
+        backends.append('numpy')
+    print("%d values, best of 5 x %d rounds" % (values, rounds))
+    for backend in backends:
+        dev.set_list_backend(backend)
+        for name, reply, pop in (('float', float_reply, dev.pop_float_list),
+                                 ('int', int_reply, dev.pop_int_list)):
+            def parse():
+                dev.message_stack.append(reply)
+                pop()
+            best = min(timeit.repeat(parse, number=rounds, repeat=5)) / rounds
+            print("  %-6s %-6s %8.1f us/reply" % (backend, name, best * 1e6))
+
+
+if __name__ == '__main__':
+    run()
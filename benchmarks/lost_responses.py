@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Measures how long it takes to notice a lost response with the cmd57
+per-header timeouts (see scpi.set_header_timeouts()) where every command
+used to wait the 60 s command_timeout, and how a deadline bounds a whole
+high-level call (switch_to_man_btch() with the sync taking longer than the
+deadline)
+
+The simulated CMD57 drops the response to one query at a time."""
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.errors import TimeoutError
+from scpi.devices.cmd57 import cmd57
+from scpi.transports import tcp
+from scpi.emulators import cmd57_instrument, tcp_server
+
+OLD_TIMEOUT = 60  # Seconds
+
+
+def drop_next_response(instrument):
+    """Makes the instrument handle the next line without answering it"""
+    handle_line = instrument.handle_line
+
+    def dropping(line):
+        instrument.handle_line = handle_line
+        handle_line(line)
+        return None
+    instrument.handle_line = dropping
+
+
+def time_to_timeout(function):
+    start = time.time()
+    try:
+        function()
+    except TimeoutError:
+        return time.time() - start
+    raise RuntimeError("Did not time out")
+
+
+def run():
+    instrument = cmd57_instrument(0.0, seed=1)
+    server = tcp_server(instrument).start()
+    dev = cmd57(tcp(server.address[0], server.address[1]))
+    try:
+        dev.switch_to_man_btch()
+        print("Lost response noticed after (was %d s each):" % OLD_TIMEOUT)
+        # The READ comes first, FETCh needs its results
+        for name, function in (("CONF:CHAN:BTS:TSC?", dev.ask_bts_tsc),
+                               ("STATus:DEVice?", dev.ask_dev_state),
+                               ("READ:BURSt:POWer:AVERage?", dev.ask_burst_power_avg),
+                               ("FETCh:BURSt:POWer:AVERage?", dev.fetch_burst_power_avg)):
+            drop_next_response(instrument)
+            print("  %-28s %5.2f s" % (name, time_to_timeout(function)))
+        drop_next_response(instrument)
+        print("  %-28s %5.2f s" % ("CONF:CHAN:BTS:TSC? (0.1 s)", time_to_timeout(
+            lambda: dev.scpi.ask_int("CONF:CHAN:BTS:TSC?", timeout=0.1))))
+
+        # Real timing from here on, the BCCH sync takes 1.5 s
+        instrument.time_scale = 1.0
+        dev.switch_to_man_bidl()
+        print("switch_to_man_btch() with a 1 s deadline timed out after %.2f s" % time_to_timeout(
+            lambda: dev.switch_to_man_btch(timeout=1.0)))
+        # The simulated CMD57 ignores device clear, the recovery waits for the sync to finish
+        print("%d timeout recoveries, %d late messages discarded" % (dev.scpi.recoveries,
+                                                                     dev.scpi.discarded_messages))
+    finally:
+        dev.quit()
+        server.stop()
+
+
+if __name__ == '__main__':
+    run()
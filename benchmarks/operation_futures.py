@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Measures what overlapping long cmd57 measurements with each other and
+with host-side work (start() futures) saves over the blocking calls
+
+Two simulated CMD57s (ballpark real timing) each do a BCCH sync, a
+modulation spectrum and a BER test, the results of each take a while to
+process on the host. Blocking: one call after another. Overlapped: both
+instruments are started, the host processes results as they complete."""
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.devices.cmd57 import cmd57
+from scpi.transports import tcp
+from scpi.emulators import cmd57_instrument, tcp_server
+
+
+def process(result, seconds):
+    """Stands for the host-side work on a result"""
+    time.sleep(seconds)
+    return result
+
+
+def blocking(devices, processing):
+    for dev in devices:
+        dev.bcch_sync()
+    for dev in devices:
+        dev.set_sync_state("BTCH")
+    for dev in devices:
+        process(dev.ask_spectrum_modulation(), processing)
+        process(dev.read_ber_test_result(), processing)
+
+
+def overlapped(devices, processing):
+    for future in [dev.start_bcch_sync() for dev in devices]:
+        future.result()
+    for dev in devices:
+        dev.set_sync_state("BTCH")
+    futures = []
+    for dev in devices:
+        futures.append(dev.start_spectrum_modulation())
+        futures.append(dev.start_ber_test())
+    for future in futures:
+        process(future.result(), processing)
+
+
+def run(instruments=2, rounds=3, processing=0.3):
+    servers = [tcp_server(cmd57_instrument(1.0, seed=index)).start() for index in range(instruments)]
+    devices = [cmd57(tcp(server.address[0], server.address[1])) for server in servers]
+    try:
+        for dev in devices:
+            dev.switch_to_man()
+        print("%d instruments, %d rounds, %.0f ms host processing per result" % (
+            instruments, rounds, processing * 1e3))
+        for name, flow in (("Blocking", blocking), ("Overlapped", overlapped)):
+            start = time.time()
+            for _ in range(rounds):
+                for dev in devices:
+                    dev.set_sync_state("BIDL")
+                flow(devices, processing)
+            print("  %-11s %.2f s per round" % (name + ":", (time.time() - start) / rounds))
+    finally:
+        for dev in devices:
+            dev.quit()
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    run()
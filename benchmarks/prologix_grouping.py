@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Measures how many "++addr" switches and how much time grouping queued
+commands by GPIB address saves when several devices share one Prologix
+style adapter (emulated on a pty that drains at serial line speed, the
+grouping only kicks in once the pty buffer is full and writes block)"""
+import os
+import sys
+import threading
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import serial as pyserial
+from scpi import scpi
+from scpi.transports import prologix, prologix_adapter
+from scpi.emulators import simulated_instrument, prologix_server
+
+
+def measure(group_by_address, addresses, commands, baudrate):
+    instruments = {}
+    for address in addresses:
+        instruments[address] = simulated_instrument()
+        instruments[address].add_parameter("VOLTage", "0")
+    server = prologix_server(instruments, baudrate).start()
+    port = pyserial.Serial(server.port_name, 115200, timeout=0)
+    adapter = prologix_adapter(port, group_by_address=group_by_address)
+    devices = [scpi(prologix(adapter, address)) for address in addresses]
+    for dev in devices:
+        dev.command_timeout = 30
+
+    def worker(dev):
+        with dev.deferred_errors():
+            for value in range(commands):
+                dev.send_command("VOLT %d" % value)
+                # Working out the next setpoint lets the other threads in
+                time.sleep(0.0001)
+
+    workers = [threading.Thread(target=worker, args=(dev,)) for dev in devices]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+    switches = adapter.address_switches
+    for dev in devices:
+        dev.quit()
+    adapter.quit()
+    server.stop()
+    return (elapsed, switches)
+
+
+def run(addresses=(5, 6, 7, 8), commands=2000, baudrate=921600):
+    print("%d devices, %d set commands each, %d baud" % (len(addresses), commands, baudrate))
+    for group_by_address in (False, True):
+        elapsed, switches = measure(group_by_address, addresses, commands, baudrate)
+        print("  %-10s %5d address switches, %.3f s" % (
+            "grouped" if group_by_address else "in order", switches, elapsed))
+
+
+if __name__ == '__main__':
+    run()
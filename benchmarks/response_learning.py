@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Shows what waiting for the responses instead of the fixed 50 ms
+ask_default_wait hp6632b used to have saves, and how quickly a lost response
+is noticed with the learned per-header timeouts (see
+scpi.enable_response_learning()) compared to command_timeout
+
+Runs against the simulated HP 6632B on a pty, the measurements take the
+sweep time of the real supply (2048 points at 15.6 us). The learned profile
+is saved to a temporary directory and loaded by a second session."""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.errors import TimeoutError
+from scpi.devices import hp6632b
+from scpi.emulators import serial_server, hp6632b_instrument
+
+OLD_WAIT = 0.050  # Seconds
+
+
+def lost_response(dev, server):
+    """Seconds until the query whose response the instrument drops times out"""
+    def drop_once(data):
+        server.write = write
+    write = server.write
+    server.write = drop_once
+    start = time.time()
+    try:
+        dev.measure_voltage()
+    except TimeoutError:
+        pass
+    return time.time() - start
+
+
+def run(baudrate=None, queries=100, sample_interval=15.6e-6):
+    instrument = hp6632b_instrument(sample_interval=sample_interval)
+    server = serial_server(instrument, baudrate).start()
+    directory = tempfile.mkdtemp()
+    try:
+        dev = hp6632b.rs232(server.port_name)
+        dev.set_voltage(5000)
+        dev.set_output(True)
+        print("Baud rate %s, %d MEAS:VOLT? queries, %.1f ms sweep" % (
+            baudrate or "unlimited", queries, 2048 * sample_interval * 1e3))
+
+        print("  Lost response without learning noticed after %.0f ms" % (lost_response(dev, server) * 1e3))
+
+        dev.enable_response_learning(directory=directory)
+        latencies = []
+        for _ in range(queries):
+            start = time.time()
+            dev.measure_voltage()
+            latencies.append(time.time() - start)
+        elapsed = sum(latencies)
+        # The fixed wait was slept before looking for the response
+        old_elapsed = sum(max(OLD_WAIT, latency) for latency in latencies)
+        print("  Fixed %.0f ms wait: %.1f ms per query" % (OLD_WAIT * 1e3, old_elapsed / queries * 1e3))
+        print("  Waiting for it:    %.1f ms per query" % (elapsed / queries * 1e3))
+
+        learned = dev.scpi.response_profile.as_dict()["MEAS:SCAL:VOLT?"]
+        print("  Learned p50 %.1f ms, p99 %.1f ms, timeout %.0f ms (command_timeout %.0f ms)" % (
+            learned['p50'] * 1e3, learned['p99'] * 1e3,
+            dev.scpi.response_profile.timeout("MEAS:SCAL:VOLT?", dev.scpi.command_timeout) * 1e3,
+            dev.scpi.command_timeout * 1e3))
+        print("  Lost response noticed after %.0f ms" % (lost_response(dev, server) * 1e3))
+        dev.quit()
+
+        dev = hp6632b.rs232(server.port_name)
+        dev.enable_response_learning(directory=directory)
+        print("  Second session loaded %s, lost response noticed after %.0f ms" % (
+            os.listdir(directory), lost_response(dev, server) * 1e3))
+        dev.quit()
+    finally:
+        server.stop()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baudrate", type=int, help="Emulated serial line speed (default unlimited)")
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    run(args.baudrate, args.queries)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Measures receive throughput of transports_rs232 over a pty pair
+
+A writer thread pushes lines into the master side as fast as the pty takes
+them, the transport reads the slave side (via the reactor so no modem line
+ioctls are needed) and counts the messages. Reports bytes/s and CPU time per
+received kilobyte."""
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import serial as pyserial
+from scpi.transports import rs232
+from scpi.transports.reactor import reactor
+
+
+def run(lines=20000, line_length=100):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = pyserial.Serial(os.ttyname(slave), 115200, timeout=0)
+    line = b"1" * (line_length - 2) + b"\r\n"
+    payload = line * lines
+    done = threading.Event()
+    received = [0]
+
+    def message_received(message):
+        received[0] += 1
+        if received[0] == lines:
+            done.set()
+
+    io_reactor = reactor()
+    transport = rs232(port, reactor=io_reactor)
+    transport.set_message_callback(message_received)
+
+    def writer():
+        view = memoryview(payload)
+        while len(view):
+            view = view[os.write(master, view[:4096]):]
+
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    threading.Thread(target=writer, daemon=True).start()
+    done.wait(600)
+    cpu_used = time.process_time() - cpu_start
+    wall_used = time.time() - wall_start
+    transport.quit()
+    io_reactor.stop()
+    os.close(master)
+    kbytes = len(payload) / 1024.0
+    print("%d lines of %d bytes" % (received[0], line_length))
+    print("  Throughput:  %.0f bytes/s" % (len(payload) / wall_used))
+    print("  CPU per KiB: %.1f us" % (cpu_used / kbytes * 1e6))
+
+
+if __name__ == '__main__':
+    run()
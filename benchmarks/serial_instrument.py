@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Drives the real hp6632b + scpi + transports_rs232 stack against a
+simulated HP 6632B on a pty and reports round-trip latency, queries/s, CPU
+time per query, setting throughput (with the error check), array transfer
+throughput and how many injected errors were caught
+
+The simulated instrument runs in this process so the CPU times include its
+share too. With no baud rate the numbers are the software overhead, with
+one (like 9600, the hp6632b default) the serial line dominates."""
+import argparse
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.errors import CommandError
+from scpi.devices import hp6632b
+from scpi.emulators import serial_server, hp6632b_instrument
+
+
+def timed(function, count):
+    """Calls function count times, returns (latencies, wall seconds, CPU seconds)"""
+    latencies = []
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    for _ in range(count):
+        call_start = time.time()
+        function()
+        latencies.append(time.time() - call_start)
+    cpu_used = time.process_time() - cpu_start
+    latencies.sort()
+    return latencies, time.time() - wall_start, cpu_used
+
+
+def report(title, count, latencies, wall, cpu):
+    print("%d %s" % (count, title))
+    print("  Per second:  %.1f" % (count / wall))
+    print("  Latency p50: %.2f ms" % (latencies[len(latencies) // 2] * 1e3))
+    print("  Latency p99: %.2f ms" % (latencies[int(len(latencies) * 0.99)] * 1e3))
+    print("  CPU each:    %.1f us" % (cpu / count * 1e6))
+
+
+def run(baudrate=None, processing_delay=0.0, queries=100, settings=100, array_points=1024, array_reads=10,
+        error_rate=0.05):
+    instrument = hp6632b_instrument()
+    instrument.processing_delay = processing_delay
+    server = serial_server(instrument, baudrate, seed=1).start()
+    dev = hp6632b.rs232(server.port_name)
+    # Arrays take a while at low baud rates
+    dev.scpi.command_timeout = 60
+    try:
+        print("Baud rate %s, processing delay %.1f ms, ask_default_wait %.1f ms" % (
+            baudrate or "unlimited", processing_delay * 1e3, dev.scpi.ask_default_wait * 1e3))
+        dev.set_voltage(5000)
+        dev.set_current(1000)
+        dev.set_output(True)
+
+        report("MEAS:VOLT? queries", queries, *timed(dev.measure_voltage, queries))
+        report("SOUR:VOLT settings (with error check)", settings,
+               *timed(lambda: dev.set_voltage(5000), settings))
+
+        dev.scpi.send_command("SENS:SWE:POIN %d" % array_points)
+        for data_format in ("ASCii", "REAL,64"):
+            dev.set_data_format(data_format)
+            received_before = server.bytes_sent
+            if data_format == "ASCii":
+                read = lambda: dev.scpi.ask_float_list("MEAS:ARR:VOLT?")
+            else:
+                read = lambda: dev.scpi.ask_binary_list("MEAS:ARR:VOLT?")
+            latencies, wall, cpu = timed(read, array_reads)
+            received = server.bytes_sent - received_before
+            print("%d reads of %d point arrays, FORM %s" % (array_reads, array_points, data_format))
+            print("  Throughput:  %.0f bytes/s" % (received / wall))
+            print("  CPU per KiB: %.1f us" % (cpu / (received / 1024.0) * 1e6))
+        dev.set_data_format("ASCii")
+
+        server.error_rate = error_rate
+        injected_before = server.injected_errors
+        caught = [0]
+
+        def set_and_catch():
+            try:
+                dev.set_voltage(5000)
+            except CommandError:
+                caught[0] += 1
+
+        latencies, wall, cpu = timed(set_and_catch, settings)
+        server.error_rate = 0.0
+        report("settings with %.0f %% injected errors" % (error_rate * 100), settings, latencies, wall, cpu)
+        print("  Injected:    %d" % (server.injected_errors - injected_before))
+        print("  Caught:      %d" % caught[0])
+    finally:
+        dev.quit()
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baudrate", type=int, help="Emulated serial line speed (default unlimited)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Instrument processing delay per line (ms)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--points", type=int, default=1024, help="Array length")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.baudrate, args.delay / 1e3, args.queries, args.queries, args.points, error_rate=args.error_rate)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Measures what collecting per-command statistics costs: queries per second
+against a loopback TCP instrument with statistics disabled and enabled, and
+prints the collected latency percentiles"""
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.transports import tcp
+from scpi.emulators import simulated_instrument, tcp_server
+
+
+def measure(dev, queries):
+    start = time.time()
+    for _ in range(queries):
+        dev.ask_float("MEAS:VOLT?")
+    return queries / (time.time() - start)
+
+
+def run(queries=5000, rounds=3):
+    instrument = simulated_instrument()
+    instrument.add_command("MEASure:VOLTage?", lambda args: "+1.23450E+00")
+    server = tcp_server(instrument).start()
+    dev = scpi(tcp(server.address[0], server.address[1]))
+    try:
+        disabled = []
+        enabled = []
+        for _ in range(rounds):
+            dev.enable_stats(False)
+            disabled.append(measure(dev, queries))
+            dev.enable_stats()
+            enabled.append(measure(dev, queries))
+        print("%d queries, best of %d rounds" % (queries, rounds))
+        print("  Statistics disabled: %.0f queries/s" % max(disabled))
+        print("  Statistics enabled:  %.0f queries/s" % max(enabled))
+        stats = dev.stats.as_dict()["MEAS:VOLT?"]
+        for name in ('write', 'first_byte', 'response'):
+            print("  %-11s p50 %.1f us, p90 %.1f us, p99 %.1f us" % (
+                name, stats[name]['p50'] * 1e6, stats[name]['p90'] * 1e6, stats[name]['p99'] * 1e6))
+    finally:
+        dev.quit()
+        server.stop()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Measures round trip latency and throughput of the raw TCP transport
+against the loopback simulated instrument"""
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi
+from scpi.transports import tcp
+from scpi.emulators import simulated_instrument, tcp_server
+
+
+def run(queries=2000, array_len=10000, array_reads=50):
+    instrument = simulated_instrument()
+    trace = ",".join("%.3f" % (i * 0.001) for i in range(array_len))
+    instrument.add_command("TRACe?", lambda args: trace)
+    server = tcp_server(instrument).start()
+    dev = scpi(tcp(server.address[0], server.address[1]))
+
+    latencies = []
+    start = time.time()
+    for _ in range(queries):
+        query_start = time.time()
+        dev.ask_int("*OPC?")
+        latencies.append(time.time() - query_start)
+    elapsed = time.time() - start
+    latencies.sort()
+    print("%d *OPC? queries" % queries)
+    print("  Queries/s:   %.0f" % (queries / elapsed))
+    print("  Latency p50: %.1f us" % (latencies[len(latencies) // 2] * 1e6))
+    print("  Latency p99: %.1f us" % (latencies[int(len(latencies) * 0.99)] * 1e6))
+
+    start = time.time()
+    for _ in range(array_reads):
+        dev.ask_float_list("TRACe?")
+    elapsed = time.time() - start
+    print("%d reads of %d value arrays" % (array_reads, array_len))
+    print("  Throughput:  %.0f bytes/s" % (array_reads * (len(trace) + 1) / elapsed))
+
+    dev.quit()
+    server.stop()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Shows what a late response does to the answers that follow a timeout
+with and without the timeout recovery (see scpi.set_timeout_recovery()) and
+how long the recovery takes
+
+The simulated HP 6632B on a pty takes its real sweep time (32 ms) for the
+measurements, every round one measurement is asked with a 10 ms timeout and
+then a few setting queries whose answers are known are checked."""
+import argparse
+import os
+import sys
+import time
+
+# Make the benchmark runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi.errors import TimeoutError
+from scpi.devices import hp6632b
+from scpi.emulators import serial_server, hp6632b_instrument
+
+CHECKS = (("SOUR:VOLT?", 5.0), ("SOUR:CURR?", 0.25), ("SENS:SWE:POIN?", 2048.0))
+
+
+def measure(recovery, rounds, baudrate):
+    server = serial_server(hp6632b_instrument(sample_interval=15.6e-6), baudrate).start()
+    dev = hp6632b.rs232(server.port_name)
+    try:
+        dev.scpi.set_timeout_recovery(recovery)
+        dev.set_voltage(5000)
+        dev.set_current(250)
+        wrong = 0
+        failed = 0
+        timeout_handling = 0.0
+        for _ in range(rounds):
+            start = time.time()
+            try:
+                dev.scpi.ask_float("MEAS:VOLT?", timeout=0.010)
+            except TimeoutError:
+                pass
+            except Exception:
+                # The error check after the timeout got someone else's answer
+                failed += 1
+            timeout_handling += time.time() - start - 0.010
+            for query, expected in CHECKS:
+                try:
+                    if dev.scpi.ask_float(query) != expected:
+                        wrong += 1
+                except Exception:
+                    failed += 1
+        print("  %-17s %3d wrong answers, %3d failed queries of %d, %.1f ms per timeout after it expired" % (
+            "With recovery:" if recovery else "Without recovery:", wrong, failed, rounds * len(CHECKS),
+            timeout_handling / rounds * 1e3))
+        if recovery:
+            print("  %d recoveries, %d failed, %d late messages discarded" % (
+                dev.scpi.recoveries, dev.scpi.failed_recoveries, dev.scpi.discarded_messages))
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def run(rounds=20, baudrate=None):
+    print("%d timeouts, baud rate %s" % (rounds, baudrate or "unlimited"))
+    measure(False, rounds, baudrate)
+    measure(True, rounds, baudrate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--baudrate", type=int, help="Emulated serial line speed (default unlimited)")
+    args = parser.parse_args()
+    run(args.rounds, args.baudrate)
@@ -2,4 +2,5 @@
    devices may extend it. transports are separate from devices
    (so you can use for example hp6632b with either serial port or GPIB)"""
 from .scpi import scpi, scpi_device
+from .aio import scpi_async, scpi_device_async
 from .errors import *
@@ -0,0 +1,359 @@
+"""asyncio flavour of the scpi and scpi_device classes, the parsing helpers
+   are shared with the blocking versions, only the methods that talk to the
+   transport are coroutines"""
+import asyncio
+import time
+
+from .errors import TimeoutError, CommandError
+from .scpi import scpi_base, STATUS_QUERIES, ESR_ERRORS
+
+
+class scpi_async(scpi_base):
+    """Sends commands to the transport and parses return values, the send_*,
+       check_error, drain_errors and ask_* methods are coroutines. The
+       features built on threads (start(), deferred_errors(), deadline(),
+       the timeout recovery and the statistics) are only in scpi, use
+       asyncio.ensure_future() and asyncio.wait_for() instead. Works with
+       any transport, messages received from other threads are handed over
+       to the event loop. Create it in the running loop (or pass loop)"""
+
+    def __init__(self, transport, loop=None, *args, **kwargs):
+        super(scpi_async, self).__init__(transport, *args, **kwargs)
+        self.loop = loop or asyncio.get_running_loop()
+        self.transport_lock = asyncio.Lock()
+        self.transport.set_message_callback(self.message_received)
+
+    def message_received(self, message):
+        """Hands the message to the oldest outstanding query (in the event
+           loop thread)"""
+        self.loop.call_soon_threadsafe(self._deliver_message, message)
+
+    def _deliver_message(self, message):
+        while self.pending_responses:
+            future = self.pending_responses.popleft()
+            if not future.done():
+                future.set_result(message)
+                return
+        self.unsolicited.append(message)
+
+    def pop_unsolicited(self):
+        """Pops the oldest unsolicited message, returns None if there are
+           none"""
+        if not self.unsolicited:
+            return None
+        return self.unsolicited.popleft()
+
+    async def send_command_unchecked(self, command, expect_response=True,
+                                     force_wait=None, timeout=None):
+        """Sends the command and if response is expected waits for it to
+           arrive. The response is pushed to message_stack and also
+           returned. The force_wait and timeout parameters are in seconds,
+           see scpi.send_command_unchecked()"""
+        profile = self.response_profile
+        if profile is not None and self.header_timeout_listed(command):
+            # Their response times depend on the parameters, not learned
+            profile = None
+        async with self.transport_lock:
+            if force_wait is None:
+                force_wait = self.ask_default_wait
+            future = None
+            if expect_response:
+                if len(self.pending_responses) >= self.max_pending_responses:
+                    raise RuntimeError("Too many outstanding queries (%d)" %
+                                       len(self.pending_responses))
+                future = self.loop.create_future()
+                self.pending_responses.append(future)
+            try:
+                self._send(command)
+                if future is None:
+                    if force_wait:
+                        await asyncio.sleep(force_wait)
+                    return None
+                written = time.time()
+                learned = False
+                if timeout is None:
+                    timeout = self.header_timeout(command)
+                    if profile is not None:
+                        timeout = profile.timeout(command, timeout)
+                        learned = True
+                if force_wait:
+                    timeout += force_wait
+                try:
+                    message = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    if learned:
+                        profile.record_timeout(command)
+                    raise TimeoutError(command, timeout)
+                if profile is not None:
+                    profile.record(command, time.time() - written)
+            finally:
+                # If we gave up waiting a late response will go to the next
+                # query or the unsolicited channel
+                if future is not None and future in self.pending_responses:
+                    self.pending_responses.remove(future)
+        self.message_stack.append(message)
+        return message
+
+    async def send_command(self, command, expect_response=False,
+                           force_wait=None, timeout=None):
+        """Sends the command and makes sure it did not trigger errors,
+           in case of timeout checks if there was another underlying error
+           and raises that instead"""
+        try:
+            await self.send_command_unchecked(command, expect_response,
+                                              force_wait, timeout)
+        except TimeoutError:
+            await self._check_error_after_timeout(command, timeout)
+            raise
+        await self.check_error(command, timeout)
+        if self.parameter_cache is not None and not expect_response:
+            self.parameter_cache.command_succeeded(command)
+
+    async def check_error(self, command_was, timeout=None):
+        """Checks the last error code and raises CommandError if the code is
+           not 0 ("No error"), see scpi.check_error()"""
+        if timeout is None:
+            timeout = self.header_timeout(command_was)
+        if self.error_check_method != 'queue':
+            errors = await self.pending_errors(timeout)
+            if errors:
+                raise CommandError(command_was, *errors[0])
+            return 0
+        await self.send_command_unchecked("SYST:ERR?", True, None, timeout)
+        code, errstr = self.parse_error(self.message_stack.pop())
+        if code != 0:
+            raise CommandError(command_was, code, errstr)
+        return code
+
+    async def _check_error_after_timeout(self, command_was, timeout=None):
+        try:
+            await self.check_error(command_was, timeout)
+        except TimeoutError:
+            pass
+
+    async def drain_errors(self, timeout=None):
+        """Reads the error queue until "No error" (or max_error_queue
+           entries), returns list of (code, errstr) tuples, oldest first"""
+        errors = []
+        while len(errors) < self.max_error_queue:
+            await self.send_command_unchecked("SYST:ERR?", True, None,
+                                              timeout)
+            timeout = None
+            code, errstr = self.parse_error(self.message_stack.pop())
+            if code == 0:
+                break
+            errors.append((code, errstr))
+        return errors
+
+    async def pending_errors(self, timeout=None):
+        """Returns list of (code, errstr) tuples of the errors in the queue
+           (emptying it), see scpi.pending_errors()"""
+        if self.error_check_method == 'queue':
+            return await self.drain_errors(timeout)
+        query, error_bits = STATUS_QUERIES[self.error_check_method]
+        if self.error_check_method == 'esr':
+            status = await self.take_esr_bits(error_bits, timeout)
+        else:
+            await self.send_command_unchecked(query, True, None, timeout)
+            status = int(float(self.message_stack.pop())) & error_bits
+        if not status:
+            return []
+        errors = await self.drain_errors()
+        if not errors and self.error_check_method == 'esr':
+            errors = [(code, errstr) for bit, code, errstr in ESR_ERRORS
+                      if status & bit][:1]
+        return errors
+
+    async def take_esr_bits(self, mask, timeout=None):
+        """Reads the event status register (*ESR?) and returns the bits in
+           mask, see scpi.take_esr_bits()"""
+        await self.send_command_unchecked("*ESR?", True, None, timeout)
+        value = int(float(self.message_stack.pop()))
+        with self._esr_lock:
+            self._esr_bits |= value
+            taken = self._esr_bits & mask
+            self._esr_bits &= ~mask
+        return taken
+
+    async def _ask_no_pop(self, command, force_wait=None, timeout=None):
+        """Sends the command (checking for errors on timeout), but does NOT
+           pop the value"""
+        if self.parameter_cache is not None:
+            cached = self.parameter_cache.lookup(command)
+            if cached is not None:
+                self.message_stack.append(cached)
+                return
+        try:
+            await self.send_command_unchecked(command, True, force_wait,
+                                              timeout)
+        except TimeoutError:
+            # This will raise the correct error in case we got a timeout
+            # waiting for the input
+            await self._check_error_after_timeout(command, timeout)
+            # If there was not error, re-raise the timeout
+            raise
+        if self.parameter_cache is not None:
+            self.parameter_cache.store(command, self.message_stack[-1])
+
+    # NOTE: there must be no await between _ask_no_pop() and the pop_*()
+    # call, all coroutines of the loop share the same message_stack
+
+    async def ask_str(self, command, force_wait=None, timeout=None):
+        """Sends the command, returning reply as a string"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_str()
+
+    async def ask_decimal(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as Decimal"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_decimal()
+
+    async def ask_int(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as int"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_int()
+
+    async def ask_int_onoff(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as int or an on/off
+           value"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_int_onoff()
+
+    async def ask_float(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as float"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_float()
+
+    async def ask_float_onoff(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as float or an on/off
+           value"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_float_onoff()
+
+    async def ask_bool(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as boolean"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_bool()
+
+    async def ask_str_list(self, command, force_wait=None, timeout=None):
+        """Sends the command, returning reply as a list of strings"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_str_list()
+
+    async def ask_decimal_list(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as a list of Decimals"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_decimal_list()
+
+    async def ask_int_list(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as a list of ints"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_int_list()
+
+    async def ask_float_list(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as a list of floats"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_float_list()
+
+    async def ask_bool_list(self, command, force_wait=None, timeout=None):
+        """Sends the command, then parses the reply as a list of booleans"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_bool_list()
+
+    async def ask_block(self, command, force_wait=None, timeout=None):
+        """Sends the command, returning the binary block reply as a
+           memoryview"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_block()
+
+    async def ask_binary_list(self, command, typecode='d', big_endian=True,
+                              force_wait=None, timeout=None):
+        """Sends the command, then parses the binary block reply as an array
+           of values, see pop_binary_list()"""
+        await self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_binary_list(typecode, big_endian)
+
+    async def ask_many(self, queries, force_wait=None, timeout=None):
+        """Sends all the queries on a single line (checking for errors once
+           at the end) and returns the list of parsed values, see
+           scpi.ask_many()"""
+        command = self._join_queries(queries)
+        await self._ask_no_pop(command, force_wait, timeout)
+        values = self._pop_many(queries, command)
+        await self.check_error(command, timeout)
+        return values
+
+
+class scpi_device_async(object):
+    """asyncio version of scpi_device, remember to await reset() after
+       creating the instance (in the running loop, or pass loop)"""
+
+    def __init__(self, transport, loop=None, *args, **kwargs):
+        """Initializes a device for the given transport"""
+        super(scpi_device_async, self).__init__(*args, **kwargs)
+        self.scpi = scpi_async(transport, loop)
+
+    def quit(self):
+        """Shuts down any background threads that might be active"""
+        self.scpi.quit()
+
+    async def reset(self):
+        """Resets the device to known state (with *RST) and clears the
+           error log"""
+        return await self.scpi.send_command_unchecked("*RST;*CLS", False)
+
+    def abort(self):
+        """Tells the transport layer to issue "Device clear" to abort the
+           command currently hanging"""
+        return self.scpi.abort_command()
+
+    async def measure_voltage(self, extra_params=""):
+        """Returns the measured (scalar) actual output voltage (in volts),
+           pass extra_params string to append to the command (like ":ACDC")"""
+        return await self.scpi.ask_float("MEAS:SCAL:VOLT%s?" % extra_params)
+
+    async def measure_current(self, extra_params=""):
+        """Returns the measured (scalar) actual output current (in amps),
+           pass extra_params string to append to the command (like ":ACDC")"""
+        return await self.scpi.ask_float("MEAS:SCAL:CURR%s?" % extra_params)
+
+    async def set_measure_current_max(self, amps):
+        """Sets the upper bound (in amps) of current to measure"""
+        return await self.scpi.send_command("SENS:CURR:RANG %f" % amps, False)
+
+    async def query_measure_current_max(self):
+        """Returns the upper bound (in amps) of current to measure"""
+        return await self.scpi.ask_float("SENS:CURR:RANG?")
+
+    async def set_voltage(self, millivolts, extra_params=""):
+        """Sets the desired output voltage (but does not auto-enable
+           outputs) in millivolts"""
+        return await self.scpi.send_command(
+            "SOUR:VOLT%s %f MV" % (extra_params, millivolts), False)
+
+    async def query_voltage(self, extra_params=""):
+        """Returns the set output voltage (in volts)"""
+        return await self.scpi.ask_float("SOUR:VOLT%s?" % extra_params)
+
+    async def set_current(self, milliamps, extra_params=""):
+        """Sets the desired output current (but does not auto-enable
+           outputs) in milliamps"""
+        return await self.scpi.send_command(
+            "SOUR:CURR%s %f MA" % (extra_params, milliamps), False)
+
+    async def query_current(self, extra_params=""):
+        """Returns the set output current (in amps)"""
+        return await self.scpi.ask_float("SOUR:CURR%s?" % extra_params)
+
+    async def set_output(self, state):
+        """Enables/disables output"""
+        return await self.scpi.send_command("OUTP:STAT %d" % state, False)
+
+    async def query_output(self):
+        """Returns the output state"""
+        return await self.scpi.ask_bool("OUTP:STAT?")
+
+    async def identify(self):
+        """Returns the identification data, standard order is Manufacturer,
+           Model no, Serial no (or 0), Firmware version"""
+        return await self.scpi.ask_str_list("*IDN?")
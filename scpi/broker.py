@@ -0,0 +1,358 @@
+"""Instrument broker, owns the transport (serial port etc) of one instrument
+   and serves it to many local processes over a Unix domain socket.
+
+   Clients use transports.broker so the device classes work unchanged. Each
+   client command is run as a transaction (the command and reading the
+   instrument error queue) so errors go to the client that caused them, the
+   clients' SYSTem:ERRor? queries are answered from their own error queue
+   and the error bits of their *ESR? and *STB? answers follow it.
+   Identical queries from several clients at the same time are sent to the
+   instrument only once. A client's "!abort" (transports.broker
+   abort_command()) fails its commands that have not been started and
+   sends device clear between the transactions.
+
+   Run as: python -m scpi.broker /dev/ttyUSB0 /tmp/cmd57.sock"""
+import os
+import socket
+import threading
+from collections import deque
+
+from .scpi import scpi
+from .errors import TimeoutError
+
+# Error queue queries the broker answers itself
+ERROR_QUERIES = ("SYST:ERR?", "SYSTEM:ERROR?", "SYST:ERR:NEXT?",
+                 "SYSTEM:ERROR:NEXT?")
+# Status register queries the broker answers per client, see client_status()
+STATUS_QUERIES = ("*ESR?", "*STB?")
+# Event status register bits of the command, execution, device-specific and
+# query errors, and the status byte error/event queue bit
+ESR_ERROR_BITS = 0x3c
+STB_ERROR_BIT = 0x04
+# Reported to the client when the instrument did not answer its query
+NO_RESPONSE_ERROR = (-365, "Time out error")
+
+
+def esr_error_bit(code):
+    """Returns the event status register bit the SCPI error code sets"""
+    if -200 < code <= -100:
+        return 0x20  # Command error
+    if -300 < code <= -200:
+        return 0x10  # Execution error
+    if code <= -400:
+        return 0x04  # Query error
+    return 0x08  # Device-specific error
+
+
+class broker_transaction(object):
+    """A command being run on the instrument, coalesced queries wait for
+       the same transaction to complete"""
+
+    def __init__(self, command):
+        self.command = command
+        self.response = None
+        self.errors = []
+        self.done = threading.Event()
+
+
+class broker_client(object):
+    """State of one connected client"""
+
+    def __init__(self, conn, max_errors):
+        self.conn = conn
+        # (line, aborted) waiting for the client's worker thread, see
+        # scpi_broker.client_worker()
+        self.lines = deque()
+        self.lines_condition = threading.Condition()
+        self.connected = True
+        self.errors = deque(maxlen=max_errors)
+        # The client's view of the event status register
+        self.esr = 0
+        self.status_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+    def add_errors(self, errors):
+        """Queues the errors caused by the client and sets their event status
+           bits"""
+        with self.status_lock:
+            self.errors.extend(errors)
+            for code, errstr in errors:
+                self.esr |= esr_error_bit(code)
+
+    def clear_status(self):
+        """*CLS of the client"""
+        with self.status_lock:
+            self.errors.clear()
+            self.esr = 0
+
+
+class scpi_broker(object):
+    """Serves the transport to clients connecting to the Unix socket at
+       path"""
+
+    def __init__(self, transport, path, coalesce=True):
+        self.scpi = scpi(transport)
+        self.path = path
+        self.coalesce = coalesce
+        # Commands and their error queue readout must not be interleaved
+        self.transaction_lock = threading.Lock()
+        # Query -> broker_transaction of the queries queued or in progress
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        self.transactions = 0
+        self.coalesced_queries = 0
+        self.clients = []
+        self.server_alive = False
+        self.server_thread = None
+        if os.path.exists(path):
+            # Stale socket from an earlier run
+            os.unlink(path)
+        self.listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listen_socket.bind(path)
+
+    def start(self):
+        """Starts accepting clients in a background thread"""
+        self.listen_socket.listen(16)
+        self.server_alive = True
+        self.server_thread = threading.Thread(target=self.accept_loop)
+        self.server_thread.setDaemon(1)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        """Disconnects the clients, removes the socket and shuts down the
+           transport"""
+        self.server_alive = False
+        try:
+            self.listen_socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listen_socket.close()
+        for client in list(self.clients):
+            try:
+                client.conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        if self.server_thread is not None:
+            self.server_thread.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.scpi.quit()
+
+    def accept_loop(self):
+        while self.server_alive:
+            try:
+                conn, peer = self.listen_socket.accept()
+            except socket.error:
+                break
+            client = broker_client(conn, self.scpi.max_error_queue)
+            self.clients.append(client)
+            thread = threading.Thread(target=self.client_loop, args=(client,))
+            thread.setDaemon(1)
+            thread.start()
+
+    def client_loop(self, client):
+        """Reads the lines of the client, the commands are run in order by
+           client_worker() so the control messages (like "!abort") are seen
+           while a command of the client is running"""
+        worker = threading.Thread(target=self.client_worker, args=(client,))
+        worker.setDaemon(1)
+        worker.start()
+        buf = b""
+        try:
+            while self.server_alive:
+                data = client.conn.recv(65536)
+                if not data:
+                    break
+                buf += data
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    line = line.decode('utf-8')
+                    if line.startswith("!"):
+                        self.handle_control(client, line)
+                        continue
+                    with client.lines_condition:
+                        client.lines.append((line, False))
+                        client.lines_condition.notify()
+        except socket.error:
+            pass
+        finally:
+            with client.lines_condition:
+                client.connected = False
+                client.lines_condition.notify()
+            worker.join()
+            self.clients.remove(client)
+            client.conn.close()
+
+    def client_worker(self, client):
+        """Runs the commands of the client one at a time"""
+        while True:
+            with client.lines_condition:
+                while not client.lines and client.connected:
+                    client.lines_condition.wait()
+                if not client.connected:
+                    return
+                line, aborted = client.lines.popleft()
+            if not aborted:
+                self.handle_line(client, line)
+            elif '?' in line:
+                # Every query gets an answer, the client matches them in
+                # order
+                client.add_errors([NO_RESPONSE_ERROR])
+                self.respond(client, bytearray())
+
+    def handle_control(self, client, line):
+        """Handles the broker control messages"""
+        if line != "!abort":
+            return
+        # The commands of the client that have not been started fail, the
+        # one running completes
+        with client.lines_condition:
+            client.lines = deque((queued, True) for queued, aborted in client.lines)
+        # Device clear between the transactions, never in the middle of
+        # someone else's
+        with self.transaction_lock:
+            try:
+                self.scpi.transport.abort_command()
+            except NotImplementedError:
+                pass
+
+    def handle_line(self, client, line):
+        header = line.upper().lstrip(':')
+        if header in ERROR_QUERIES:
+            with client.status_lock:
+                if client.errors:
+                    code, errstr = client.errors.popleft()
+                else:
+                    code, errstr = (0, "No error")
+            self.respond(client, '%d,"%s"' % (code, errstr))
+            return
+        if header in STATUS_QUERIES:
+            self.respond(client, "%d" % self.client_status(client, header))
+            return
+        if header == "*CLS":
+            client.clear_status()
+        query = '?' in line
+        transaction = None
+        leader = True
+        if query and self.coalesce and all('?' in part for part in line.split(';')):
+            with self.in_flight_lock:
+                transaction = self.in_flight.get(line)
+                if transaction is not None:
+                    leader = False
+                    self.coalesced_queries += 1
+                else:
+                    transaction = broker_transaction(line)
+                    self.in_flight[line] = transaction
+        if transaction is None:
+            transaction = broker_transaction(line)
+            self.run_transaction(transaction, query)
+        elif leader:
+            try:
+                self.run_transaction(transaction, query)
+            finally:
+                with self.in_flight_lock:
+                    del self.in_flight[line]
+        else:
+            transaction.done.wait()
+        client.add_errors(transaction.errors)
+        if not query:
+            return
+        if transaction.response is None:
+            # Zero length block, the client gets its error from SYST:ERR?
+            self.respond(client, bytearray())
+            return
+        self.respond(client, transaction.response)
+
+    def client_status(self, client, query):
+        """Answers *ESR? or *STB? for the client. The error bits follow the
+           client's own errors (the broker reads the instrument error queue
+           after every command, so the instrument's error bits could be
+           anybody's), the other bits are the instrument's. Reading *ESR?
+           clears the instrument register so its other bits (like operation
+           complete) are passed to all the clients"""
+        transaction = broker_transaction(query)
+        self.run_transaction(transaction, True)
+        client.add_errors(transaction.errors)
+        value = 0
+        if transaction.response is not None:
+            value = int(float(transaction.response))
+        if query == "*STB?":
+            value &= ~STB_ERROR_BIT
+            with client.status_lock:
+                if client.errors:
+                    value |= STB_ERROR_BIT
+            return value
+        shared_bits = value & ~ESR_ERROR_BITS
+        for other in list(self.clients):
+            if other is not client:
+                with other.status_lock:
+                    other.esr |= shared_bits
+        with client.status_lock:
+            value = client.esr | shared_bits
+            client.esr = 0
+        return value
+
+    def run_transaction(self, transaction, query):
+        """Sends the command and reads the errors it caused"""
+        try:
+            with self.transaction_lock:
+                self.transactions += 1
+                try:
+                    transaction.response = self.scpi.send_command_unchecked(
+                        transaction.command, query)
+                    if query:
+                        self.scpi.message_stack.pop()
+                except TimeoutError:
+                    transaction.errors.append(NO_RESPONSE_ERROR)
+                transaction.errors[:0] = self.scpi.drain_errors()
+        finally:
+            transaction.done.set()
+
+    def respond(self, client, message):
+        """Sends the response line (or definite length block) to the
+           client"""
+        if isinstance(message, bytearray):
+            length = str(len(message))
+            data = b"#%d%s%s\n" % (len(length), length.encode('ascii'),
+                                   bytes(message))
+        else:
+            data = (message + "\n").encode('utf-8')
+        try:
+            with client.send_lock:
+                client.conn.sendall(data)
+        except socket.error:
+            pass
+
+
+def main():
+    import argparse
+    import time
+    import serial as pyserial
+    from .transports import rs232
+
+    parser = argparse.ArgumentParser(
+        description="Share a serial port instrument with local processes")
+    parser.add_argument("port", help="Serial port device")
+    parser.add_argument("path", help="Unix socket to listen on")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--rtscts", action="store_true")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="Seconds to wait for the instrument to respond")
+    args = parser.parse_args()
+
+    port = pyserial.Serial(args.port, args.baudrate, timeout=0,
+                           rtscts=args.rtscts)
+    broker = scpi_broker(rs232(port), args.path)
+    broker.scpi.command_timeout = args.timeout
+    broker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    broker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Read-through cache for instrument settings, so repeated queries for a
+   setting that only changes when we set it do not go to the instrument"""
+from threading import Lock
+
+from .compiler import short_header, number_regex
+
+# Commands that change (possibly) every setting of the instrument
+DEFAULT_INVALIDATING_HEADERS = ("*RST", "*RCL", "SYST:PRES")
+
+
+class parameter_cache(object):
+    """Caches the responses to setting queries keyed by the short form of
+       the header. Only headers starting with one of the prefixes (short
+       forms, like "CONF:") are cached, None caches everything.
+       Successful setter commands with a single numeric value update the
+       cached value, any other command touching a cached header just drops
+       it. The invalidating headers clear the whole cache."""
+
+    def __init__(self, prefixes=None, invalidating_headers=()):
+        if prefixes is not None:
+            prefixes = tuple(self.key(prefix) for prefix in prefixes)
+        self.prefixes = prefixes
+        self.invalidating_headers = set(
+            self.key(header) for header in
+            DEFAULT_INVALIDATING_HEADERS + tuple(invalidating_headers))
+        self.values = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def key(self, header):
+        """Returns the cache key for header (with or without the '?')"""
+        return short_header(header.strip().lstrip(':').rstrip('?')).upper()
+
+    def cacheable(self, key):
+        if self.prefixes is None:
+            return True
+        return key.startswith(self.prefixes)
+
+    def lookup(self, command):
+        """Returns the cached response to the query or None"""
+        if ';' in command or not command.endswith('?'):
+            # Compound commands and queries with parameters go to the
+            # instrument
+            return None
+        key = self.key(command)
+        if not self.cacheable(key):
+            return None
+        with self.lock:
+            value = self.values.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def store(self, command, response):
+        """Stores the response to the query"""
+        if ';' in command or not command.endswith('?'):
+            return
+        if not isinstance(response, str):
+            return
+        key = self.key(command)
+        if not self.cacheable(key):
+            return
+        with self.lock:
+            self.values[key] = response
+
+    def part_keys(self, command):
+        """Yields (part, keys) for each part of the (compound) command, keys
+           has the key of the header as resolved against the path of the
+           previous part (SCPI: "SOUR:VOLT 1;CURR 2" sets SOUR:CURR) and the
+           key as an absolute header, in case the device does not follow
+           the rule"""
+        path = ''
+        for part in command.split(';'):
+            header = part.strip().split(' ', 1)[0]
+            key = self.key(header)
+            keys = [key]
+            if header.startswith('*'):
+                # Common commands do not change the path
+                yield part, keys
+                continue
+            if path and not header.startswith(':'):
+                keys.insert(0, path + key)
+            resolved = keys[0]
+            path = resolved.rpartition(':')[0]
+            if path:
+                path += ':'
+            yield part, keys
+
+    def command_sent(self, command):
+        """Called for every command sent, drops the values the command might
+           change (or all of them)"""
+        for part, keys in self.part_keys(command):
+            if keys[-1] in self.invalidating_headers:
+                self.clear()
+                continue
+            if part.strip().endswith('?'):
+                continue
+            with self.lock:
+                for key in keys:
+                    if self.values.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def command_succeeded(self, command):
+        """Called when a setter command was checked to have succeeded,
+           caches its value if it is a plain number"""
+        if ';' in command or ' ' not in command.strip():
+            return
+        header, value = command.strip().split(' ', 1)
+        value = value.strip()
+        key = self.key(header)
+        if not self.cacheable(key) or not number_regex.match(value):
+            return
+        with self.lock:
+            self.values[key] = value
+
+    def clear(self):
+        """Drops all the cached values"""
+        with self.lock:
+            if self.values:
+                self.invalidations += 1
+            self.values = {}
@@ -0,0 +1,113 @@
+"""Command compiler, rewrites commands to use as few bytes on the wire as
+   possible: mixed-case mnemonics (like "CALCulate") are reduced to their
+   short forms ("CALC") and numbers to their shortest exact representation
+   ("5.000000" -> "5", integers are kept integers). The encoded results are memoized."""
+import re
+import decimal
+
+# Mnemonic like "SENSe1" -> short form "SENS1", only mixed-case mnemonics
+# tell their short form, all uppercase ones are left as they are
+node_regex = re.compile(r"^([A-Z*]+)[a-z]+(\d*)$")
+number_regex = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+
+
+def short_node(node):
+    """Returns the short form of a header node"""
+    match = node_regex.match(node)
+    if not match:
+        return node
+    return match.group(1) + match.group(2)
+
+
+def short_header(header):
+    """Returns header with all its nodes in short form, query suffix and
+       leading colon are kept"""
+    query = header.endswith('?')
+    nodes = header.rstrip('?').split(':')
+    return ':'.join(short_node(node) for node in nodes) + ('?' if query else '')
+
+
+def shortest_number(token):
+    """Returns the shortest representation of the decimal number in token
+       that has exactly the same value. Integers stay integers, a device
+       may not take "1E3" for an integer parameter, only tokens with a
+       decimal point or an exponent can become exponent form"""
+    if '.' not in token and 'e' not in token and 'E' not in token:
+        return str(int(token))
+    value = decimal.Decimal(token)
+    if value.is_zero():
+        return "0"
+    value = value.normalize()
+    plain = format(value, 'f')
+    sign, digits, exponent = value.as_tuple()
+    mantissa = ''.join(str(digit) for digit in digits)
+    if len(mantissa) > 1:
+        mantissa = mantissa[0] + '.' + mantissa[1:]
+    scientific = "%s%sE%d" % ('-' if sign else '', mantissa,
+                              exponent + len(digits) - 1)
+    if len(scientific) < len(plain):
+        return scientific
+    return plain
+
+
+class command_compiler(object):
+    """Compiles and encodes commands, see module docstring"""
+
+    def __init__(self, line_terminator=None):
+        """If line_terminator is given encode() appends it"""
+        self.line_terminator = line_terminator
+        self._terminator_bytes = (line_terminator or "").encode('ascii')
+        # Header -> short header
+        self._header_cache = {}
+        # Command -> encoded bytes
+        self._command_cache = {}
+        # Commands are mostly the same handful of queries and settings, the
+        # caches are simply cleared if there are more than this many
+        self.max_cache_size = 1024
+
+    def compile_header(self, header):
+        """Memoized short_header()"""
+        compiled = self._header_cache.get(header)
+        if compiled is None:
+            if len(self._header_cache) >= self.max_cache_size:
+                self._header_cache = {}
+            compiled = short_header(header)
+            self._header_cache[header] = compiled
+        return compiled
+
+    def compile_part(self, part):
+        """Compiles a single command (no ';' separators)"""
+        part = part.strip()
+        if ' ' not in part:
+            return self.compile_header(part)
+        header, args = part.split(' ', 1)
+        if '"' in args or "'" in args:
+            # Leave string data alone
+            return self.compile_header(header) + ' ' + args
+        compiled_args = []
+        for arg in args.split(','):
+            arg = arg.strip()
+            if number_regex.match(arg):
+                arg = shortest_number(arg)
+            compiled_args.append(arg)
+        return self.compile_header(header) + ' ' + ','.join(compiled_args)
+
+    def compile(self, command):
+        """Returns the compiled command string"""
+        if '"' in command or "'" in command:
+            # A quoted string might contain ';', only touch the first header
+            parts = command.split(' ', 1)
+            parts[0] = self.compile_header(parts[0])
+            return ' '.join(parts)
+        return ';'.join(self.compile_part(part) for part in command.split(';'))
+
+    def encode(self, command):
+        """Returns the compiled command as bytes with the line terminator,
+           repeated commands are served from the cache"""
+        encoded = self._command_cache.get(command)
+        if encoded is None:
+            if len(self._command_cache) >= self.max_cache_size:
+                self._command_cache = {}
+            encoded = self.compile(command).encode('utf-8') + self._terminator_bytes
+            self._command_cache[command] = encoded
+        return encoded
@@ -1,6 +1,10 @@
 """ROHDE&SCHWARZ CMD57 specific device implementation and helpers"""
 
+from contextlib import contextmanager
+
 from scpi import scpi_device
+from scpi.compiler import short_header, short_node
+from scpi.errors import CommandError, TimeoutError
 
 ######################################
 # Helper functions
@@ -26,15 +30,102 @@ def _format_onoff(val):
 class cmd57(scpi_device):
     """Adds the ROHDE&SCHWARZ CMD57 specific SCPI commands as methods"""
 
+    # Configuration only changes when we set it, see enable_parameter_cache()
+    cacheable_prefixes = ("CONF:", "CALC:LIM:", "SENS1:CORR:", "SENS2:CORR:", "SOUR1:CORR:", "SOUR2:CORR:",
+                          "ROUT:IOC", "PROC:SET:POW:BAND")
+    # Switching the test mode changes the configuration
+    cache_invalidating_headers = ("PROC:SEL",)
+    # "0" instead of '0,"No error"' after every command, it adds up at 9600 baud
+    error_check_method = 'esr'
+    # Device clear and resynchronize after timeouts, a late response would throw the responses off by one
+    timeout_recovery = True
+    # Timeouts of the slow commands (see scpi.set_header_timeouts()), the rest are answered at once and use
+    # command_timeout. The measurements wait for the bursts and READ:BER for the whole test (CONF:BER:FRAM frames),
+    # pass a timeout for longer tests
+    header_timeouts = (
+        ("CONF:", 2),
+        ("CALC:", 2),
+        ("FETC:", 2),
+        ("FETC:ARR:", 10),
+        ("READ:", 20),
+        ("READ:BER:", 60),
+        ("PROC:SEL", 10),
+        ("PROC:SYNC", 20),
+        ("PROC:BTSS", 20),
+    )
+    # Seconds, the timeout of the other commands (see set_timeout())
+    default_timeout = 5
+    # The measurements are only valid in some test modes and device states, when one fails (or times out) the
+    # state we assume may be wrong
+    state_dependent_prefixes = ("READ:", "FETC:", "CALC:")
+
     def __init__(self, transport, *args, **kwargs):
         """Initializes a device for the given transport"""
+        # What we know of the test mode and the device state (short forms), None when unknown. Kept up to date
+        # from our own commands so the switch_to_* methods need not ask, see resync_state()
+        self._test_mode = None
+        self._dev_state = None
+        # Bumped by every change of them, a start_bcch_sync() completing after another change must not overwrite it
+        self._state_generation = 0
         super(cmd57, self).__init__(transport, *args, **kwargs)
-        self.scpi.command_timeout = 60  # Seconds
+        self.scpi.command_timeout = self.default_timeout
         self.scpi.ask_default_wait = 0  # Seconds
+        # The long forms cost a lot of time at 9600 baud
+        self.scpi.set_command_compiler()
+        self.scpi.set_failure_callback(self._command_failed)
+
+    def reset(self):
+        """Resets the device, the test mode and device state are unknown after that"""
+        self.invalidate_state()
+        return super(cmd57, self).reset()
+
+    def invalidate_state(self):
+        """Forgets the test mode and device state, they are asked from the device when next needed"""
+        self._state_generation += 1
+        self._test_mode = None
+        self._dev_state = None
+
+    @contextmanager
+    def _state_change(self):
+        """Wraps the commands that change (or ask) the test mode or device state, if they fail (or time out) we
+        do not know where the device ended up. Yields the state generation of the change"""
+        self._state_generation += 1
+        try:
+            yield self._state_generation
+        except (CommandError, TimeoutError):
+            self.invalidate_state()
+            raise
+
+    def _command_failed(self, command, error):
+        """Forgets the test mode and device state when a state dependent command fails, see
+        scpi.set_failure_callback()"""
+        for part in command.split(';'):
+            header = short_header(part.strip().split(' ', 1)[0].lstrip(':')).upper()
+            if header.startswith(self.state_dependent_prefixes):
+                self.invalidate_state()
+                return
+
+    def resync_state(self):
+        """Asks the test mode and device state from the device (use after errors or if someone else might have
+        changed them), returns (test mode, device state)"""
+        self.invalidate_state()
+        test_mode = self.ask_test_mode()
+        dev_state = None
+        if test_mode != "NONE":
+            dev_state = self.ask_dev_state()
+        return (test_mode, dev_state)
 
     def set_timeout(self, command_timeout=10):
+        """Sets the timeout of the commands, returns the old one. A timeout longer than default_timeout also
+        raises the shorter ones in header_timeouts to it, so raising it for a long BER test works like it always
+        did, and setting the old one back restores them. For single calls use their timeout arguments or
+        scpi.deadline() instead"""
         old = self.scpi.command_timeout
         self.scpi.command_timeout = command_timeout
+        timeouts = self.header_timeouts
+        if command_timeout > self.default_timeout:
+            timeouts = [(prefix, max(seconds, command_timeout)) for prefix, seconds in timeouts]
+        self.scpi.set_header_timeouts(timeouts)
         return old
 
     ######################################
@@ -319,7 +410,9 @@ class cmd57(scpi_device):
         """ 2.4 Test mode
             See set_test_mode() for the list of supported modes
         """
-        return self.scpi.ask_str("PROCedure:SEL?")
+        with self._state_change():
+            self._test_mode = self.scpi.ask_str("PROCedure:SEL?")
+        return self._test_mode
 
     def set_test_mode(self, mode):
         """ 2.4 Test mode
@@ -333,11 +426,40 @@ class cmd57(scpi_device):
               RFGenerator - RF generator (same as RFM?)
               IQSPec      - IQ spectrum (requires option K43)
         """
-        return self.scpi.send_command("PROCedure:SEL %s" % str(mode), False)
-
-    def bcch_sync(self):
+        # Unknown until the command is known to have succeeded, the device state changes with the mode
+        self.invalidate_state()
+        with self._state_change():
+            ret = self.scpi.send_command("PROCedure:SEL %s" % str(mode), False)
+            self._test_mode = short_node(str(mode)).upper()
+        return ret
+
+    def bcch_sync(self, timeout=None):
         """ 3 Perform Synchronization with BCCH or Wired Sync """
-        return self.scpi.send_command("PROCedure:SYNChronize", False)
+        self._dev_state = None
+        with self._state_change():
+            ret = self.scpi.send_command("PROCedure:SYNChronize", False, timeout=timeout)
+            self._dev_state = "BBCH"
+        return ret
+
+    def start_bcch_sync(self, timeout=None):
+        """ 3 Perform Synchronization with BCCH or Wired Sync without waiting
+            for it, returns a future resolving to None when synchronized
+            (see scpi.start()) """
+        self._dev_state = None
+        with self._state_change() as generation:
+            future = self.scpi.start("PROCedure:SYNChronize", timeout=timeout)
+
+        def synchronized(future):
+            if self._state_generation != generation:
+                # Something else has changed the state since
+                return
+            if future.exception() is None:
+                self._dev_state = "BBCH"
+            else:
+                self.invalidate_state()
+
+        future.add_done_callback(synchronized)
+        return future
 
     def ask_sync_state(self):
         """ 3 Selected Measurement State
@@ -353,8 +475,12 @@ class cmd57(scpi_device):
               BTCH      - TCH measurements
               BEXTernal - BER measurements with RS232 / IEEE488
         """
-        return self.scpi.send_command("PROCedure:BTSState %s" % str(state),
-                                      False)
+        self._dev_state = None
+        with self._state_change():
+            ret = self.scpi.send_command("PROCedure:BTSState %s" % str(state),
+                                         False)
+            self._dev_state = short_node(str(state)).upper()
+        return ret
 
     #
     # 7.2 BER
@@ -534,26 +660,26 @@ class cmd57(scpi_device):
     # 7.2.4 BER Measurement
     #
 
-    def read_ber_class_1b_ber(self):
+    def read_ber_class_1b_ber(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-Ib BER
             Supported values: 0 to 100 %
             Valid in: BTCH  """
-        return self.scpi.ask_float("READ:BER:CLIB:BER?")
+        return self.scpi.ask_float("READ:BER:CLIB:BER?", timeout=timeout)
 
-    def read_ber_class_1b_events(self):
+    def read_ber_class_1b_events(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-Ib events
             Supported values: 0 to 100,000
             Valid in: BTCH  """
-        return self.scpi.ask_int("READ:BER:CLIB:EVENts?")
+        return self.scpi.ask_int("READ:BER:CLIB:EVENts?", timeout=timeout)
 
-    def read_ber_class_1b_rber(self):
+    def read_ber_class_1b_rber(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-Ib RBER
             Supported values: 0 to 100 %
             Valid in: BTCH  """
-        return self.scpi.ask_float("READ:BER:CLIB:RBER?")
+        return self.scpi.ask_float("READ:BER:CLIB:RBER?", timeout=timeout)
 
     def fetch_ber_class_1b_ber(self):
         """ 7.2.4 Fetch measured value of Class-Ib BER
@@ -573,26 +699,26 @@ class cmd57(scpi_device):
             Valid in: BTCH  """
         return self.scpi.ask_float("FETCh:BER:CLIB:RBER?")
 
-    def read_ber_class_2_ber(self):
+    def read_ber_class_2_ber(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-II BER
             Supported values: 0 to 100 %
             Valid in: BTCH  """
-        return self.scpi.ask_float("READ:BER:CLII:BER?")
+        return self.scpi.ask_float("READ:BER:CLII:BER?", timeout=timeout)
 
-    def read_ber_class_2_events(self):
+    def read_ber_class_2_events(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-II events
             Supported values: 0 to 100,000
             Valid in: BTCH  """
-        return self.scpi.ask_int("READ:BER:CLII:EVENts?")
+        return self.scpi.ask_int("READ:BER:CLII:EVENts?", timeout=timeout)
 
-    def read_ber_class_2_rber(self):
+    def read_ber_class_2_rber(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Class-II RBER
             Supported values: 0 to 100 %
             Valid in: BTCH  """
-        return self.scpi.ask_float("READ:BER:CLII:RBER?")
+        return self.scpi.ask_float("READ:BER:CLII:RBER?", timeout=timeout)
 
     def fetch_ber_class_2_ber(self):
         """ 7.2.4 Fetch measured value of Class-II BER
@@ -612,19 +738,19 @@ class cmd57(scpi_device):
             Valid in: BTCH  """
         return self.scpi.ask_float("FETCh:BER:CLII:RBER?")
 
-    def read_ber_erased_fer(self):
+    def read_ber_erased_fer(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Erased Frames FER
             Supported values: 0 to 100 %
             Valid in: BTCH  """
-        return self.scpi.ask_float("READ:BER:EFRames:FER?")
+        return self.scpi.ask_float("READ:BER:EFRames:FER?", timeout=timeout)
 
-    def read_ber_erased_events(self):
+    def read_ber_erased_events(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of
             Erased Frames events
             Supported values: 0 to 50,000
             Valid in: BTCH  """
-        return self.scpi.ask_int("READ:BER:EFRames:EVENts?")
+        return self.scpi.ask_int("READ:BER:EFRames:EVENts?", timeout=timeout)
 
     def fetch_ber_erased_fer(self):
         """ 7.2.4 Fetch measured value of Erased Frames FER
@@ -638,11 +764,11 @@ class cmd57(scpi_device):
             Valid in: BTCH  """
         return self.scpi.ask_int("FETCh:BER:EFRames:EVENts?")
 
-    def read_ber_crc_errors(self):
+    def read_ber_crc_errors(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured value of CRC Errors
             Supported values: 0 to (number of frames sent)/4
             Valid in: MCE  """
-        return self.scpi.ask_int("READ:BER:CRC:ERRor?")
+        return self.scpi.ask_int("READ:BER:CRC:ERRor?", timeout=timeout)
 
     def fetch_ber_crc_errors(self):
         """ 7.2.4 Fetch measured value of CRC Errors
@@ -650,7 +776,7 @@ class cmd57(scpi_device):
             Valid in: MCE  """
         return self.scpi.ask_int("FETCh:BER:CRC:ERRor?")
 
-    def read_ber_test_result(self):
+    def read_ber_test_result(self, timeout=None):
         """ 7.2.4 Execute new measurement and Read measured Total Result of a
             BER Measurement
             Supported values:
@@ -662,7 +788,7 @@ class cmd57(scpi_device):
                 TLOW   - BS signal level is too low, results are not valid
                 IMP    - No measurement possible, results are not valid
             Valid in: BTCH  """
-        return self.scpi.ask_str("READ:BER:TRESult?")
+        return self.scpi.ask_str("READ:BER:TRESult?", timeout=timeout)
 
     def fetch_ber_test_result(self):
         """ 7.2.4 Fetch measured Total Result of a BER Measurement
@@ -677,6 +803,15 @@ class cmd57(scpi_device):
             Valid in: BTCH  """
         return self.scpi.ask_str("FETCh:BER:TRESult?")
 
+    def start_ber_test(self, timeout=None):
+        """ 7.2.4 Execute new BER measurement without waiting for it, returns
+            a future resolving to the read_ber_test_result() result (see
+            scpi.start()), read the other results with the fetch_ber_*()
+            methods after that
+            Valid in: BTCH  """
+        return self.scpi.start("READ:BER:TRESult?", self.scpi.pop_str,
+                               timeout)
+
     #
     # 7.3.2 Power Tolerance Measurement
     #
@@ -1017,9 +1152,17 @@ class cmd57(scpi_device):
             Returns 23 frequency offsets (see
             fetch_spectrum_modulation_offsets() for a list)
             Valid in: BTCH, MOD  """
-        # TODO: LONG operation
+        # LONG operation, see start_spectrum_modulation()
         return self.scpi.ask_float_list("READ:ARRay:SPECtrum:MODulation?")
 
+    def start_spectrum_modulation(self, timeout=None):
+        """ 7.5.3 Executing Spectrum Measurement (Modulation) without waiting
+            for it, returns a future resolving to the
+            ask_spectrum_modulation() result (see scpi.start())
+            Valid in: BTCH, MOD  """
+        return self.scpi.start("READ:ARRay:SPECtrum:MODulation?",
+                               self.scpi.pop_float_list, timeout)
+
     def fetch_spectrum_modulation(self):
         """ 7.5.3 Executing Spectrum Measurement (Modulation)
             Returns 23 frequency offsets (see
@@ -1037,9 +1180,17 @@ class cmd57(scpi_device):
             Returns 9 frequency offsets (see
             fetch_spectrum_switching_offsets() for a list)
             Valid in: BTCH, MOD  """
-        # TODO: LONG operation
+        # LONG operation, see start_spectrum_switching()
         return self.scpi.ask_float_list("READ:ARRay:SPECtrum:BTS:SWITching?")
 
+    def start_spectrum_switching(self, timeout=None):
+        """ 7.5.3 Executing Spectrum Measurement (Switching) without waiting
+            for it, returns a future resolving to the
+            ask_spectrum_switching() result (see scpi.start())
+            Valid in: BTCH, MOD  """
+        return self.scpi.start("READ:ARRay:SPECtrum:BTS:SWITching?",
+                               self.scpi.pop_float_list, timeout)
+
     def fetch_spectrum_switching(self):
         """ 7.5.3 Executing Spectrum Measurement (Switching)
             Returns 9 frequency offsets (see
@@ -1061,7 +1212,9 @@ class cmd57(scpi_device):
 
     def ask_dev_state(self):
         """ 9.1 Current Device State """
-        return self.scpi.ask_str("STATus:DEVice?")
+        with self._state_change():
+            self._dev_state = self.scpi.ask_str("STATus:DEVice?")
+        return self._dev_state
 
     ######################################
     # High level functions
@@ -1072,42 +1225,67 @@ class cmd57(scpi_device):
     #
 
     def configure_mod(self, expected_power=None, arfcn=None, tsc=None,
-                      decode=None, input_bandwidth=None, trigger_mode=None):
-        if expected_power is not None:
-            self.set_ban_expected_power(expected_power)
-        if arfcn is not None:
-            self.set_ban_arfcn(arfcn)
-        if tsc is not None:
-            self.set_ban_tsc(tsc)
-        if decode is not None:
-            self.set_phase_decoding_mode(decode)
-        if input_bandwidth is not None:
-            self.set_ban_input_bandwidth(input_bandwidth)
-        if trigger_mode is not None:
-            self.set_ban_trigger_mode(trigger_mode)
+                      decode=None, input_bandwidth=None, trigger_mode=None,
+                      timeout=None):
+        """ Configures the module test parameters that are not None, errors
+            are checked once at the end, all of it within timeout seconds
+            (see scpi.deadline()) """
+        with self.scpi.deadline(timeout), self.scpi.deferred_errors(pinpoint=True):
+            if expected_power is not None:
+                self.set_ban_expected_power(expected_power)
+            if arfcn is not None:
+                self.set_ban_arfcn(arfcn)
+            if tsc is not None:
+                self.set_ban_tsc(tsc)
+            if decode is not None:
+                self.set_phase_decoding_mode(decode)
+            if input_bandwidth is not None:
+                self.set_ban_input_bandwidth(input_bandwidth)
+            if trigger_mode is not None:
+                self.set_ban_trigger_mode(trigger_mode)
 
     def configure_man(self, ccch_arfcn=None, tch_arfcn=None, tch_ts=None,
                       tsc=None, expected_power=None, tch_tx_power=None,
                       tch_mode=None, tch_timing=None,
-                      tch_input_bandwidth=None):
-        if ccch_arfcn is not None:
-            self.set_bts_ccch_arfcn(ccch_arfcn)
-        if tch_arfcn is not None:
-            self.set_bts_tch_arfcn(tch_arfcn)
-        if tch_ts is not None:
-            self.set_bts_tch_ts(tch_ts)
-        if tsc is not None:
-            self.set_bts_tsc(tsc)
-        if expected_power is not None:
-            self.set_bts_expected_power(expected_power)
-        if tch_tx_power is not None:
-            self.set_bts_tch_tx_power(tch_tx_power)
-        if tch_mode is not None:
-            self.set_bts_tch_mode(tch_mode)
-        if tch_timing is not None:
-            self.set_bts_tch_timing(tch_timing)
-        if tch_input_bandwidth is not None:
-            self.set_bts_tch_input_bandwidth(tch_input_bandwidth)
+                      tch_input_bandwidth=None, timeout=None):
+        """ Configures the manual test parameters that are not None, errors
+            are checked once at the end, all of it within timeout seconds
+            (see scpi.deadline()) """
+        with self.scpi.deadline(timeout), self.scpi.deferred_errors(pinpoint=True):
+            if ccch_arfcn is not None:
+                self.set_bts_ccch_arfcn(ccch_arfcn)
+            if tch_arfcn is not None:
+                self.set_bts_tch_arfcn(tch_arfcn)
+            if tch_ts is not None:
+                self.set_bts_tch_ts(tch_ts)
+            if tsc is not None:
+                self.set_bts_tsc(tsc)
+            if expected_power is not None:
+                self.set_bts_expected_power(expected_power)
+            if tch_tx_power is not None:
+                self.set_bts_tch_tx_power(tch_tx_power)
+            if tch_mode is not None:
+                self.set_bts_tch_mode(tch_mode)
+            if tch_timing is not None:
+                self.set_bts_tch_timing(tch_timing)
+            if tch_input_bandwidth is not None:
+                self.set_bts_tch_input_bandwidth(tch_input_bandwidth)
+
+    def ask_man_config(self, timeout=None):
+        """ Reads the manual test mode configuration in a single round trip
+            Returns: (ccch_arfcn, tch_arfcn, tch_ts, expected_power,
+                      tch_tx_power, tch_mode, tch_timing,
+                      tch_input_bandwidth)  """
+        return tuple(self.scpi.ask_many([
+            ("CONF:CHAN:BTS:CCCH:ARFCN?", int),
+            ("CONF:CHAN:BTS:TCH:ARFCN?", int),
+            ("CONF:CHAN:BTS:TCH:SLOT?", int),
+            ("CONF:BTS:POWer:EXPected?", float),
+            ("CONF:CHANnel:BTS?", float),
+            ("CONF:SPEech:MODE?", str),
+            ("CONF:BTS:TRANsmit:TIMing?", int),
+            ("PROCedure:SET:POWer:BANDwidth:INPut?", str),
+        ], timeout=timeout))
 
     def configure_spectrum_modulation(self, burst_num=None):
         if burst_num is not None:
@@ -1150,45 +1328,63 @@ class cmd57(scpi_device):
     # Switching between test modes
     #
 
-    def _switch_to_x(self, mode):
-        cur_mode = self.ask_test_mode()
-        if cur_mode != mode:
-            if cur_mode != "NONE":
-                self.set_test_mode("NONE")
-            self.set_test_mode(mode)
-
-    def switch_to_none(self):
-        self._switch_to_x("NONE")
-
-    def switch_to_idle(self):
-        self.switch_to_none()
-
-    def switch_to_mod(self):
-        self._switch_to_x("MOD")
-
-    def switch_to_ban(self):
-        self._switch_to_x("BAN")
-
-    def switch_to_man(self):
-        self._switch_to_x("MAN")
-
-    def switch_to_man_bidl(self):
-        self.switch_to_man()
-        if self.ask_dev_state() != "BIDL":
-            self.set_sync_state("BIDL")
-
-    def switch_to_man_bbch(self):
-        self.switch_to_man()
-        if self.ask_dev_state() != "BBCH":
-            self.bcch_sync()
-
-    def switch_to_man_btch(self):
-        self.switch_to_man()
-        dev_state = self.ask_dev_state()
-        if dev_state != "BTCH":
-            if dev_state != "BBCH":
+    def _current_test_mode(self):
+        """Test mode from the shadow state, asked from the device only if unknown"""
+        if self._test_mode is None:
+            return self.ask_test_mode()
+        return self._test_mode
+
+    def _current_dev_state(self):
+        """Device state from the shadow state, asked from the device only if unknown"""
+        if self._dev_state is None:
+            return self.ask_dev_state()
+        return self._dev_state
+
+    # The switch_to_* methods take a timeout (seconds) for the whole switch, see scpi.deadline()
+
+    def _switch_to_x(self, mode, timeout=None):
+        with self.scpi.deadline(timeout):
+            cur_mode = self._current_test_mode()
+            if cur_mode != mode:
+                if cur_mode != "NONE" and mode != "NONE":
+                    self.set_test_mode("NONE")
+                self.set_test_mode(mode)
+
+    def switch_to_none(self, timeout=None):
+        self._switch_to_x("NONE", timeout)
+
+    def switch_to_idle(self, timeout=None):
+        self.switch_to_none(timeout)
+
+    def switch_to_mod(self, timeout=None):
+        self._switch_to_x("MOD", timeout)
+
+    def switch_to_ban(self, timeout=None):
+        self._switch_to_x("BAN", timeout)
+
+    def switch_to_man(self, timeout=None):
+        self._switch_to_x("MAN", timeout)
+
+    def switch_to_man_bidl(self, timeout=None):
+        with self.scpi.deadline(timeout):
+            self.switch_to_man()
+            if self._current_dev_state() != "BIDL":
+                self.set_sync_state("BIDL")
+
+    def switch_to_man_bbch(self, timeout=None):
+        with self.scpi.deadline(timeout):
+            self.switch_to_man()
+            if self._current_dev_state() != "BBCH":
                 self.bcch_sync()
-            self.set_sync_state("BTCH")
+
+    def switch_to_man_btch(self, timeout=None):
+        with self.scpi.deadline(timeout):
+            self.switch_to_man()
+            dev_state = self._current_dev_state()
+            if dev_state != "BTCH":
+                if dev_state != "BBCH":
+                    self.bcch_sync()
+                self.set_sync_state("BTCH")
 
 
 def rs232(port, **kwargs):
@@ -30,18 +30,17 @@ class cmd57_console(cmd57.cmd57):
         print("RF input/output port: %s" % self.ask_io_used())
 
     def print_man_config(self):
+        (ccch_arfcn, tch_arfcn, tch_ts, expected_power, tch_tx_power,
+         tch_mode, tch_timing, tch_input_bandwidth) = self.ask_man_config()
         print("Manual BTS test - Synchronized mode (no signaling)")
-        print("  CCCH ARFCN:       %s" % format_int(self.ask_bts_ccch_arfcn()))
-        print("  TCH ARFCN:        %s" % format_int(self.ask_bts_tch_arfcn()))
-        print("  TCH timeslot:     %s" % format_int(self.ask_bts_tch_ts()))
-        print("  Expected power:   %s dBm" %
-              format_float(self.ask_bts_expected_power()))
-        print("  Used TS power:    %s dBm" %
-              format_float(self.ask_bts_tch_tx_power()))
-        print("  Mode:             %s" % self.ask_bts_tch_mode())
-        print("  Timing advance:   %s qbits" %
-              format_int(self.ask_bts_tch_timing()))
-        print("  Input bandwidth:  %s" % self.ask_bts_tch_input_bandwidth())
+        print("  CCCH ARFCN:       %s" % format_int(ccch_arfcn))
+        print("  TCH ARFCN:        %s" % format_int(tch_arfcn))
+        print("  TCH timeslot:     %s" % format_int(tch_ts))
+        print("  Expected power:   %s dBm" % format_float(expected_power))
+        print("  Used TS power:    %s dBm" % format_float(tch_tx_power))
+        print("  Mode:             %s" % tch_mode)
+        print("  Timing advance:   %s qbits" % format_int(tch_timing))
+        print("  Input bandwidth:  %s" % tch_input_bandwidth)
 
     def print_man_bidl_info(self):
         print("Manual BTS test - Synchronized mode (no signaling)")
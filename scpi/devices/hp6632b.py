@@ -12,11 +12,15 @@ from scpi import scpi_device
 class hp6632b(scpi_device):
     """Adds the HP/Agilent 3362B specific SCPI commands as methods"""
 
-    def __init__(self, transport, *args, **kwargs):
-        """Initializes a device for the given transport"""
-        super(hp6632b, self).__init__(transport, *args, **kwargs)
-        # Average aquisition time is 30ms + 20ms processing time
-        self.scpi.ask_default_wait = 0.050
+    # The error bits of *ESR? are quicker to check than SYST:ERR? on RS232
+    error_check_method = 'esr'
+    # Device clear (break) and resynchronize after timeouts, a late response would throw the RS232 stream off
+    timeout_recovery = True
+
+    # Measurements take about 30ms aquisition + 20ms processing time, the
+    # queries wait for the response so there is no need for a fixed
+    # ask_default_wait (see enable_response_learning() for timeouts that
+    # follow the actual response times)
 
     def set_low_current_mode(self, state):
         """The low-current mode is enabled by setting the range to (max) 20mA, anything over that is high-current mode. This model has max 5A output"""
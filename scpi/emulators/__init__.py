@@ -0,0 +1,8 @@
+"""Emulated instruments and transport peers for testing and benchmarking without hardware"""
+from .instrument import simulated_instrument
+from .tcp_server import tcp_server
+from .hislip_server import hislip_server
+from .prologix import prologix_server
+from .serial_server import serial_server
+from .hp6632b import hp6632b_instrument
+from .cmd57 import cmd57_instrument
@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+
+"""Simulated ROHDE&SCHWARZ CMD57 measuring a GSM BTS, for exercising devices.cmd57 without hardware
+
+Covers the command tree devices.cmd57 uses: the I/O and BTS/burst analysis configuration, the test modes
+(PROCedure:SELect) and the manual test states (BIDL, BBCH, BTCH), and the READ/FETCh results of the burst (power,
+phase and frequency error), spectrum, peak power and BER measurements.
+
+READ starts a new measurement and answers when it is done, FETCh answers right away with the result of the last
+one. Measurements, mode switches and synchronizing take time like they do on the real box (see timing, the values
+are ballpark figures, time_scale 0 makes everything instant for tests). Like on the real box the instrument does
+not handle anything else while it is busy.
+"""
+import random
+import time
+
+from .instrument import simulated_instrument, parse_node
+
+# Test modes (short forms) and the device state right after selecting them
+TEST_MODES = {
+    "NONE": "IDLE",
+    "MAN": "BIDL",
+    "SIGN": "BIDL",
+    "MOD": "MOD",
+    "BAN": "BAN",
+    "RFM": "RFM",
+    "RFG": "RFG",
+    "IQSP": "IQSP",
+}
+
+# Seconds (before time_scale)
+DEFAULT_TIMING = {
+    # PROCedure:SELect
+    'mode_switch': 0.5,
+    # PROCedure:SYNChronize, synchronizing to the BCCH
+    'sync': 1.5,
+    # Setting up the TCH (PROCedure:BTSState BTCH)
+    'tch_setup': 0.8,
+    # Analysing a burst
+    'burst': 0.15,
+    # Peak power
+    'peak_power': 0.05,
+    # Per burst averaged in the spectrum measurements (plus the burst time)
+    'spectrum_per_burst': 0.0046,
+    # Per frame in the BER test (plus the hold-off time)
+    'ber_per_frame': 0.02,
+    # Answering a FETCh
+    'fetch': 0.002,
+}
+
+# Offsets (kHz) and typical levels (dB relative to the carrier) of the spectrum measurements, the devices.cmd57
+# fetch_spectrum_*_offsets() give the same offsets
+SPECTRUM_MODULATION = [
+    (-1800, -76.0), (-1600, -75.0), (-1400, -75.0), (-1200, -74.0), (-1000, -73.0), (-800, -72.0), (-600, -70.0),
+    (-400, -65.0), (-250, -38.0), (-200, -35.0), (-100, -1.0), (0, 0.0), (100, -1.0), (200, -35.0), (250, -38.0),
+    (400, -65.0), (600, -70.0), (800, -72.0), (1000, -73.0), (1200, -74.0), (1400, -75.0), (1600, -75.0),
+    (1800, -76.0)]
+SPECTRUM_SWITCHING = [
+    (-1800, -78.0), (-1200, -75.0), (-600, -68.0), (-400, -60.0), (0, 0.0), (400, -60.0), (600, -68.0),
+    (1200, -75.0), (1800, -78.0)]
+
+# Default relative modulation spectrum tolerances at 100, 200, 250, 400, 600, 800, 1000, 1200, 1400 and 1600 kHz
+DEFAULT_MODULATION_TOLERANCE_REL = [0.5, -30.0, -33.0, -60.0, -60.0, -60.0, -60.0, -63.0, -63.0, -63.0]
+# ...and the switching ones at 400, 600, 1200 and 1800 kHz
+DEFAULT_SWITCHING_TOLERANCE_REL = [-57.0, -67.0, -74.0, -74.0]
+
+# Bits per speech frame in the BER classes
+CLASS_1B_BITS = 78
+CLASS_2_BITS = 132
+
+# Which measurement each result belongs to and the device states it is valid in
+MEASUREMENTS = {
+    'burst': ("BBCH", "BTCH", "BAN", "MOD"),
+    'spectrum_modulation': ("BTCH", "MOD"),
+    'spectrum_switching': ("BTCH", "MOD"),
+    'peak_power': ("BIDL", "BBCH", "BTCH", "BAN", "MOD"),
+    'ber': ("BTCH",),
+}
+
+
+def format_float(value):
+    return "%.2f" % value
+
+
+def format_one_decimal(value):
+    return "%.1f" % value
+
+
+def format_float_list(values):
+    return ",".join("%.2f" % value for value in values)
+
+
+def int_range(low, high):
+    """Parser accepting integers low - high"""
+    def parse(args):
+        value = int(args)
+        if not low <= value <= high:
+            raise ValueError(args)
+        return value
+    return parse
+
+
+def float_range(low, high):
+    """Parser accepting numbers low - high"""
+    def parse(args):
+        value = float(args)
+        if not low <= value <= high:
+            raise ValueError(args)
+        return value
+    return parse
+
+
+def float_or_off(low, high):
+    """Parser accepting numbers low - high or OFF (None)"""
+    parse_float = float_range(low, high)
+
+    def parse(args):
+        if args.strip().upper() == "OFF":
+            return None
+        return parse_float(args)
+    return parse
+
+
+def format_float_or_off(value):
+    if value is None:
+        return "OFF"
+    return "%.1f" % value
+
+
+def float_list(count, low, high):
+    """Parser accepting count comma separated numbers low - high"""
+    parse_float = float_range(low, high)
+
+    def parse(args):
+        values = [parse_float(value) for value in args.split(',')]
+        if len(values) != count:
+            raise ValueError(args)
+        return values
+    return parse
+
+
+def choice(*values):
+    """Parser accepting the values (written like "NARRow"), in short or long form, returns the short form"""
+    forms = {}
+    for value in values:
+        short, long_form = parse_node(value)
+        forms[short] = short
+        forms[long_form] = short
+
+    def parse(args):
+        value = forms.get(args.strip().upper())
+        if value is None:
+            raise ValueError(args)
+        return value
+    return parse
+
+
+def parse_onoff(args):
+    args = args.strip().upper()
+    if args in ("1", "ON"):
+        return 1
+    if args in ("0", "OFF"):
+        return 0
+    raise ValueError(args)
+
+
+def parse_ber_set(args):
+    args = args.strip().upper()
+    if len(args) != 4 or not args.startswith("BER") or args[3] not in "1234567":
+        raise ValueError(args)
+    return args
+
+
+class cmd57_instrument(simulated_instrument):
+    def __init__(self, time_scale=1.0, seed=None):
+        """Initializes the CMD57 with a well behaving BTS connected, the bts_* attributes describe the BTS (change
+        them to simulate a bad one). time_scale multiplies the timing, seed makes the measurement noise
+        repeatable"""
+        super(cmd57_instrument, self).__init__("Rohde&Schwarz,CMD57,0,3.30 (emulated)")
+        self.time_scale = time_scale
+        self.timing = dict(DEFAULT_TIMING)
+        self.options = "B4,K30,K43"
+        self.random = random.Random(seed)
+        # The BTS being measured
+        self.bts_power = 30.0  # dBm
+        self.bts_phase_error_rms = 1.2  # degrees
+        self.bts_phase_error_peak = 4.5  # degrees
+        self.bts_freq_error = 12  # Hz
+        self.bts_ber = 0.001  # Of the bits
+        self.bts_fer = 0.0005  # Of the frames
+        self.bts_mcc = 1
+        self.bts_mnc = 1
+        self.bts_bsic = 63
+        self.test_mode = "NONE"
+        self.dev_state = "IDLE"
+        # Measurement -> results of the last one
+        self.results = {}
+        # Counters for benchmarks
+        self.mode_switches = 0
+        self.measurements = 0
+
+        self.add_command("*OPT?", lambda args: self.options)
+        self.add_command("STATus:DEVice?", lambda args: self.dev_state)
+        self.add_command("PROCedure:SELect", self._select_test_mode)
+        self.add_command("PROCedure:SELect?", lambda args: self.test_mode)
+        self.add_command("PROCedure:SYNChronize", lambda args: self._synchronize())
+        # PROCedure:BTSState? is not there, the real one answers -113 too
+        self.add_command("PROCedure:BTSState", self._set_bts_state)
+
+        # 2.1 Inputs and outputs
+        self.add_parameter("ROUTe:IOConnector", "I1O1", choice("I1O1", "I1O2", "I2O1", "I2O2"))
+        self.add_parameter("CONFigure:NETWork:TYPE", "GSM900", choice("GSM900", "GSM1800", "GSM1900", "GSM850"))
+        for header in ("SENSe1:CORRection:LOSS", "SOURce1:CORRection:LOSS", "SENSe2:CORRection:LOSS",
+                       "SOURce2:CORRection:LOSS"):
+            self.add_parameter(header, 0.0, float_range(-50.0, 90.0), format_float)
+
+        # 2.2 BTS signaling
+        self.add_command("SENSe:SIGNaling:IDENtity:MCC?", lambda args: "%d" % self.bts_mcc)
+        self.add_command("SENSe:SIGNaling:IDENtity:MNC?", lambda args: "%d" % self.bts_mnc)
+        self.add_command("SENSe:SIGNaling:BSIC?", lambda args: "%d" % self.bts_bsic)
+        self.add_parameter("CONFigure:CHANnel:BTS:CCCH:ARFCn", 1, int_range(0, 1023))
+        self.add_parameter("CONFigure:CHANnel:BTS:TCH:ARFCn", 1, int_range(0, 1023))
+        self.add_parameter("CONFigure:CHANnel:BTS:TCH:SLOT", 2, int_range(0, 7))
+        self.add_parameter("CONFigure:CHANnel:BTS:TSC", 0, int_range(0, 7))
+        self.add_parameter("CONFigure:BTS:POWer:EXPected", 10.0, float_range(-60.0, 53.0), format_float)
+        self.add_parameter("CONFigure:CHANnel:BTS", -60.0, float_range(-127.0, -27.0), format_float)
+        self.add_parameter("CONFigure:SPEech:MODE", "PR15",
+                           choice("ECHO", "LOOP", "PR9", "PR11", "PR15", "PR16", "HANDset"))
+        self.add_parameter("CONFigure:BTS:TRANsmit:TIMing", 0, int_range(0, 63))
+        self.add_parameter("PROCedure:SET:POWer:BANDwidth:INPut", "NARR", choice("NARRow", "WIDE"))
+
+        # 2.3 Burst analysis
+        self.add_parameter("CONFigure:CHANnel:BANalysis:ARFCn", 1, int_range(0, 1023))
+        self.add_parameter("CONFigure:CHANnel:BANalysis:TSC", 0, int_range(0, 7))
+        self.add_parameter("CONFigure:BANalysis:POWer:EXPected", 10.0, float_range(-60.0, 53.0), format_float)
+        self.add_parameter("CONFigure:BANalysis:POWer:BANDwidth:INPut1", "NARR", choice("NARRow", "WIDE"))
+        self.add_parameter("CONFigure:BANalysis:TRIGger:MODE", "POW", choice("POWer", "FREerun"))
+        self.add_parameter("CONFigure:DECoding:MODE", "STAN", choice("STANdard", "GATBits"))
+
+        # 7.2 BER
+        self.add_parameter("CONFigure:BER:SELect", "BER1", parse_ber_set)
+        self.add_parameter("CALCulate:LIMit:BER:CLIB:MEVents", 100, int_range(0, 100000))
+        self.add_parameter("CALCulate:LIMit:BER:CLII:MEVents", 100, int_range(0, 100000))
+        self.add_parameter("CALCulate:LIMit:BER:EFRames:MEVents", 10, int_range(0, 50000))
+        self.add_parameter("CONFigure:BER:POWer:USED", -80.0, float_range(-127.0, -27.0), format_one_decimal)
+        self.add_parameter("CONFigure:BER:POWer:UNUSed", None, float_or_off(-20.0, 30.0), format_float_or_off)
+        self.add_parameter("CONFigure:BER:FRAMestosend", 100, int_range(1, 50000))
+        self.add_parameter("CONFigure:BER:SCONdition", "ASAM", choice("ALIMits", "ASAMples", "FLIMit"))
+        self.add_parameter("CONFigure:BER:HOLDoff:TIME", 0.1, float_range(0.1, 100.0), format_one_decimal)
+        self.add_command("CONFigure:BER:CLIB:MSAMples?", lambda args: "%d" % (self._frames() * CLASS_1B_BITS))
+        self.add_command("CONFigure:BER:CLII:MSAMples?", lambda args: "%d" % (self._frames() * CLASS_2_BITS))
+        self.add_command("CONFigure:BER:EFRames:MSAMples?", lambda args: "%d" % self._frames())
+        self.add_command("CONFigure:BER:TEST:TIME?", lambda args: "%.2f" % (self._frames() * 0.02))
+        for result, name in (("CLIB:BER", 'class_1b_ber'), ("CLIB:EVENts", 'class_1b_events'),
+                             ("CLIB:RBER", 'class_1b_rber'), ("CLII:BER", 'class_2_ber'),
+                             ("CLII:EVENts", 'class_2_events'), ("CLII:RBER", 'class_2_rber'),
+                             ("EFRames:FER", 'fer'), ("EFRames:EVENts", 'erased_events'),
+                             ("CRC:ERRor", 'crc_errors'), ("TRESult", 'test_result')):
+            self._add_result("BER:" + result, 'ber', name)
+
+        # 7.3 - 7.4 Burst power, phase and frequency errors
+        self._add_result("BURSt:POWer:AVERage", 'burst', 'power')
+        self._add_result("ARRay:BURSt:POWer", 'burst', 'power_array')
+        self._add_result("BURSt:PHASe:ERRor:RMS", 'burst', 'phase_rms')
+        self._add_result("BURSt:PHASe:ERRor:PEAK", 'burst', 'phase_peak')
+        self._add_result("ARRay:BURSt:PHASe:ERRor", 'burst', 'phase_array')
+        self._add_result("BURSt:FREQuency:ERRor", 'burst', 'freq_error')
+        self._add_result("POWer", 'peak_power', 'power')
+        self.add_command("CALCulate:LIMit:POWer:MATChing?", lambda args: self._match('burst', 'power_match'))
+        self.add_command("CALCulate:LIMit:PHFR:TOLerance:MATChing?",
+                         lambda args: self._match('burst', 'phfr_match'))
+        self.add_command("CALCulate:LIMit:PHFR:TOLerance:MATChing:AVERage?",
+                         lambda args: self._match('burst', 'phfr_match'))
+        self.add_command("CALCulate:LIMit:PHFR:TOLerance:MATChing:MAXimum?",
+                         lambda args: self._match('burst', 'phfr_match'))
+
+        # 7.5 Spectrum
+        self.add_parameter("CALCulate:LIMit:SPECtrum:MODulation:ABSolute", [-57.0, -57.0],
+                           float_list(2, -100.0, 5.0), format_float_list)
+        self.add_parameter("CALCulate:LIMit:SPECtrum:MODulation:RELative", DEFAULT_MODULATION_TOLERANCE_REL,
+                           float_list(10, -100.0, 5.0), format_float_list)
+        self.add_parameter("CALCulate:LIMit:SPECtrum:SWITching:ABSolute", [-36.0, -36.0, -36.0, -36.0],
+                           float_list(4, -100.0, 5.0), format_float_list)
+        self.add_parameter("CALCulate:LIMit:SPECtrum:SWITching:RELative", DEFAULT_SWITCHING_TOLERANCE_REL,
+                           float_list(4, -100.0, 5.0), format_float_list)
+        self.add_command("CALCulate:LIMit:SPECtrum:MODulation:CLEar",
+                         lambda args: self._clear_limits("CALC:LIM:SPEC:MOD:"))
+        self.add_command("CALCulate:LIMit:SPECtrum:SWITching:CLEar",
+                         lambda args: self._clear_limits("CALC:LIM:SPEC:SWIT:"))
+        self.add_command("CALCulate:LIMit:SPECtrum:MODulation:MATChing?",
+                         lambda args: self._match('spectrum_modulation', 'match'))
+        # The real one always answers INV
+        self.add_command("CALCulate:LIMit:SPECtrum:SWITching:MATChing?", lambda args: "INV")
+        self.add_parameter("CONFigure:SPECtrum:MODulation:AVERage", 10, int_range(1, 2000))
+        self.add_parameter("CONFigure:SPECtrum:SWITching:AVERage", 10, int_range(1, 2000))
+        self.add_parameter("CONFigure:SPECtrum:SWITching:NOISe:CORRection", 0, parse_onoff)
+        self._add_result("ARRay:SPECtrum:MODulation", 'spectrum_modulation', 'levels')
+        self._add_result("ARRay:SPECtrum:BTS:SWITching", 'spectrum_switching', 'levels')
+
+    def reset(self):
+        """*RST, back to the NONE test mode with the default configuration"""
+        super(cmd57_instrument, self).reset()
+        self.test_mode = "NONE"
+        self.dev_state = "IDLE"
+        self.results = {}
+
+    def busy(self, name, extra=0.0):
+        """Takes the time the operation takes"""
+        seconds = (self.timing[name] + extra) * self.time_scale
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _select_test_mode(self, args):
+        mode = choice("NONE", "MANual", "SIGNal", "MODultest", "BANalysis", "RFM", "RFGenerator", "IQSPec")(args)
+        if mode == self.test_mode:
+            return
+        if self.test_mode != "NONE" and mode != "NONE":
+            # Test modes are switched via NONE
+            self.push_error(-221, "Settings conflict;%s active" % self.test_mode)
+            return
+        self.busy('mode_switch')
+        self.mode_switches += 1
+        self.test_mode = mode
+        self.dev_state = TEST_MODES[mode]
+        self.results = {}
+
+    def _synchronize(self):
+        if self.test_mode not in ("MAN", "SIGN"):
+            self.push_error(-221, "Settings conflict;not in MAN")
+            return
+        self.busy('sync')
+        self.dev_state = "BBCH"
+        self.results = {}
+
+    def _set_bts_state(self, args):
+        state = choice("BIDL", "BBCH", "BTCH", "BEXTernal")(args)
+        if self.test_mode not in ("MAN", "SIGN"):
+            self.push_error(-221, "Settings conflict;not in MAN")
+            return
+        if state == "BBCH":
+            self._synchronize()
+            return
+        if state == "BTCH":
+            if self.dev_state not in ("BBCH", "BTCH"):
+                self.push_error(-221, "Settings conflict;not synchronized")
+                return
+            if self.dev_state != "BTCH":
+                self.busy('tch_setup')
+                # Set to default when entering BTCH
+                self.parameters["PROC:SET:POW:BAND:INP"] = "NARR"
+        elif state == "BEXT" and self.dev_state != "BTCH":
+            self.push_error(-221, "Settings conflict;not in BTCH")
+            return
+        self.dev_state = state
+        self.results = {}
+
+    def _frames(self):
+        return self.parameters["CONF:BER:FRAM"]
+
+    def _add_result(self, header, measurement, name):
+        """Registers READ:<header>? (measures) and FETCh:<header>? (last result)"""
+        self.add_command("READ:%s?" % header, lambda args: self._read(measurement, name))
+        self.add_command("FETCh:%s?" % header, lambda args: self._fetch(measurement, name))
+
+    def _read(self, measurement, name):
+        if self.dev_state not in MEASUREMENTS[measurement]:
+            self.push_error(-221, "Settings conflict;not valid in %s" % self.dev_state)
+            return "NAN"
+        self.results[measurement] = getattr(self, "measure_" + measurement)()
+        self.measurements += 1
+        return self.results[measurement][name]
+
+    def _fetch(self, measurement, name):
+        self.busy('fetch')
+        results = self.results.get(measurement)
+        if results is None:
+            self.push_error(-230, "Data corrupt or stale")
+            return "NAN"
+        return results[name]
+
+    def _match(self, measurement, name):
+        results = self.results.get(measurement)
+        if results is None:
+            return "INV"
+        return results[name]
+
+    def _clear_limits(self, prefix):
+        for key, value in self._defaults.items():
+            if key.startswith(prefix):
+                self.parameters[key] = value
+
+    def _expected_power(self):
+        if self.test_mode in ("MOD", "BAN"):
+            return self.parameters["CONF:BAN:POW:EXP"]
+        return self.parameters["CONF:BTS:POW:EXP"]
+
+    def _noise(self, sigma):
+        return self.random.gauss(0.0, sigma)
+
+    def measure_burst(self):
+        self.busy('burst')
+        power = self.bts_power + self._noise(0.05)
+        phase_rms = abs(self.bts_phase_error_rms + self._noise(0.1))
+        phase_peak = max(phase_rms, abs(self.bts_phase_error_peak + self._noise(0.3)))
+        freq_error = int(round(self.bts_freq_error + self._noise(3.0)))
+        # 1/4 bit steps from bit -10 to bit 157, ramping up and down around the useful part (bits 0 - 147)
+        power_array = []
+        for step in range(669):
+            bit = step / 4.0 - 10.0
+            if 0.0 <= bit <= 147.0:
+                level = self._noise(0.05)
+            elif -3.0 < bit < 0.0:
+                level = bit * 10.0
+            elif 147.0 < bit < 150.0:
+                level = (147.0 - bit) * 10.0
+            else:
+                level = -70.0 + self._noise(0.5)
+            power_array.append(level)
+        phase_array = [self._noise(phase_rms) for _ in range(147)]
+        power_match = "MATC"
+        if abs(power - self._expected_power()) > 10.0:
+            power_match = "NMAT"
+        phfr_match = ",".join(["MATC" if phase_peak <= 20.0 else "NMAT", "MATC" if phase_rms <= 5.0 else "NMAT",
+                               "MATC" if abs(freq_error) <= 90 else "NMAT"])
+        return {
+            'power': format_float(power),
+            'power_array': format_float_list(power_array),
+            'phase_rms': format_float(phase_rms),
+            'phase_peak': format_float(phase_peak),
+            'phase_array': format_float_list(phase_array),
+            'freq_error': "%d" % freq_error,
+            'power_match': power_match,
+            'phfr_match': phfr_match,
+        }
+
+    def _measure_spectrum(self, mask, bursts):
+        self.busy('spectrum_per_burst', self.timing['spectrum_per_burst'] * (bursts - 1))
+        return [level + self._noise(0.3) if offset else level for offset, level in mask]
+
+    def measure_spectrum_modulation(self):
+        levels = self._measure_spectrum(SPECTRUM_MODULATION, self.parameters["CONF:SPEC:MOD:AVER"])
+        limits = dict(zip((100, 200, 250, 400, 600, 800, 1000, 1200, 1400, 1600),
+                          self.parameters["CALC:LIM:SPEC:MOD:REL"]))
+        match = "MATC"
+        for (offset, mask_level), level in zip(SPECTRUM_MODULATION, levels):
+            if abs(offset) in limits and level > limits[abs(offset)]:
+                match = "NMAT"
+        return {
+            'levels': format_float_list(levels),
+            'match': match,
+        }
+
+    def measure_spectrum_switching(self):
+        levels = self._measure_spectrum(SPECTRUM_SWITCHING, self.parameters["CONF:SPEC:SWIT:AVER"])
+        return {
+            'levels': format_float_list(levels),
+        }
+
+    def measure_peak_power(self):
+        self.busy('peak_power')
+        return {
+            'power': format_float(self.bts_power + 1.5 + self._noise(0.05)),
+        }
+
+    def measure_ber(self):
+        frames = self._frames()
+        self.busy('ber_per_frame', self.timing['ber_per_frame'] * (frames - 1) +
+                  self.parameters["CONF:BER:HOLD:TIME"])
+
+        def events(bits, rate):
+            return max(0, int(round(bits * rate * self.random.uniform(0.8, 1.2))))
+
+        class_1b_events = events(frames * CLASS_1B_BITS, self.bts_ber)
+        class_2_events = events(frames * CLASS_2_BITS, self.bts_ber)
+        erased_events = events(frames, self.bts_fer)
+        good_frames = max(1, frames - erased_events)
+        test_result = "PASS"
+        if (class_1b_events > self.parameters["CALC:LIM:BER:CLIB:MEV"] or
+                class_2_events > self.parameters["CALC:LIM:BER:CLII:MEV"] or
+                erased_events > self.parameters["CALC:LIM:BER:EFR:MEV"]):
+            test_result = "FAIL"
+        return {
+            'class_1b_ber': "%.4f" % (100.0 * class_1b_events / (frames * CLASS_1B_BITS)),
+            'class_1b_events': "%d" % class_1b_events,
+            'class_1b_rber': "%.4f" % (100.0 * class_1b_events / (good_frames * CLASS_1B_BITS)),
+            'class_2_ber': "%.4f" % (100.0 * class_2_events / (frames * CLASS_2_BITS)),
+            'class_2_events': "%d" % class_2_events,
+            'class_2_rber': "%.4f" % (100.0 * class_2_events / (good_frames * CLASS_2_BITS)),
+            'fer': "%.4f" % (100.0 * erased_events / frames),
+            'erased_events': "%d" % erased_events,
+            'crc_errors': "0",
+            'test_result': test_result,
+        }
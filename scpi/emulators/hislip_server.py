@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Minimal HiSLIP (IVI-6.1) server front-end for a simulated instrument
+
+Implements what transports.hislip needs: session initialization on both channels, Data/DataEnd, device clear and
+the overlapped/synchronized mode negotiation. Locking, triggers and SRQ are not supported.
+"""
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from ..transports.hislip import (INITIALIZE, INITIALIZE_RESPONSE, FATAL_ERROR, DATA, DATA_END,
+                                 DEVICE_CLEAR_COMPLETE, DEVICE_CLEAR_ACKNOWLEDGE, ASYNC_MAXIMUM_MESSAGE_SIZE,
+                                 ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE, ASYNC_INITIALIZE, ASYNC_INITIALIZE_RESPONSE,
+                                 ASYNC_DEVICE_CLEAR, ASYNC_DEVICE_CLEAR_ACKNOWLEDGE, PROTOCOL_VERSION,
+                                 pack_message, recv_message)
+
+
+class hislip_session(object):
+    def __init__(self, session_id, sync_conn, overlapped):
+        self.session_id = session_id
+        self.sync_conn = sync_conn
+        self.overlapped = overlapped
+        # (due time, message bytes) waiting for the emulated latency to pass
+        self.outgoing = deque()
+        self.outgoing_condition = threading.Condition()
+        self.alive = True
+
+
+class hislip_server(object):
+    def __init__(self, instrument, host="127.0.0.1", port=0, overlapped=False, response_latency=0.0,
+                 vendor_id=b"PS"):
+        """Initializes the server for the instrument, port 0 picks a free port (see address). overlapped is the
+        mode the server prefers (clients may switch it with device clear), response_latency (seconds) delays
+        each response without holding up the processing of the next message, as a network round trip would"""
+        self.instrument = instrument
+        self.overlapped = overlapped
+        self.response_latency = response_latency
+        self.vendor_id = vendor_id
+        self.max_message_size = 1 << 20
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind((host, port))
+        self.address = self.listen_socket.getsockname()
+        self.sessions = {}
+        self.next_session_id = 1
+        self.connections = []
+        self.server_alive = False
+        self.server_thread = None
+
+    def start(self):
+        """Starts accepting connections in a background thread"""
+        self.listen_socket.listen(5)
+        self.server_alive = True
+        self.server_thread = threading.Thread(target=self.accept_loop)
+        self.server_thread.setDaemon(1)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        """Closes the listening socket and all connections"""
+        self.server_alive = False
+        try:
+            self.listen_socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listen_socket.close()
+        for session in list(self.sessions.values()):
+            with session.outgoing_condition:
+                session.alive = False
+                session.outgoing_condition.notify_all()
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            conn.close()
+        if self.server_thread is not None:
+            self.server_thread.join()
+
+    def accept_loop(self):
+        while self.server_alive:
+            try:
+                conn, peer = self.listen_socket.accept()
+            except socket.error:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.append(conn)
+            thread = threading.Thread(target=self.connection_loop, args=(conn,))
+            thread.setDaemon(1)
+            thread.start()
+
+    def connection_loop(self, conn):
+        """The first message tells which channel the connection is"""
+        try:
+            message_type, control_code, parameter, payload = recv_message(conn)
+            if message_type == INITIALIZE:
+                session = hislip_session(self.next_session_id, conn, self.overlapped)
+                self.next_session_id += 1
+                self.sessions[session.session_id] = session
+                conn.sendall(pack_message(INITIALIZE_RESPONSE, int(self.overlapped),
+                                          (PROTOCOL_VERSION << 16) | session.session_id))
+                sender = threading.Thread(target=self.sender_loop, args=(session,))
+                sender.setDaemon(1)
+                sender.start()
+                self.sync_loop(session)
+            elif message_type == ASYNC_INITIALIZE and parameter in self.sessions:
+                conn.sendall(pack_message(ASYNC_INITIALIZE_RESPONSE, 0,
+                                          struct.unpack(">H", self.vendor_id)[0]))
+                self.async_loop(self.sessions[parameter], conn)
+            else:
+                conn.sendall(pack_message(FATAL_ERROR, 0, 0, b"Expected Initialize"))
+        except (EOFError, IOError, socket.error):
+            pass
+        finally:
+            if conn in self.connections:
+                self.connections.remove(conn)
+            conn.close()
+
+    def sync_loop(self, session):
+        buf = bytearray()
+        try:
+            while self.server_alive:
+                message_type, control_code, parameter, payload = recv_message(session.sync_conn)
+                if message_type == DATA:
+                    buf += payload
+                elif message_type == DATA_END:
+                    buf += payload
+                    line = buf.decode('utf-8').rstrip('\r\n')
+                    buf = bytearray()
+                    response = self.instrument.handle_line(line)
+                    if response is not None:
+                        self.respond(session, pack_message(DATA_END, 0, parameter,
+                                                           (response + "\n").encode('utf-8')))
+                elif message_type == DEVICE_CLEAR_COMPLETE:
+                    buf = bytearray()
+                    session.overlapped = bool(control_code & 0x01)
+                    self.respond(session, pack_message(DEVICE_CLEAR_ACKNOWLEDGE,
+                                                       int(session.overlapped)), clear=True)
+        finally:
+            with session.outgoing_condition:
+                session.alive = False
+                session.outgoing_condition.notify_all()
+            self.sessions.pop(session.session_id, None)
+
+    def async_loop(self, session, conn):
+        while self.server_alive and session.alive:
+            message_type, control_code, parameter, payload = recv_message(conn)
+            if message_type == ASYNC_MAXIMUM_MESSAGE_SIZE:
+                conn.sendall(pack_message(ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE, 0, 0,
+                                          struct.pack(">Q", self.max_message_size)))
+            elif message_type == ASYNC_DEVICE_CLEAR:
+                conn.sendall(pack_message(ASYNC_DEVICE_CLEAR_ACKNOWLEDGE, int(self.overlapped)))
+
+    def respond(self, session, message, clear=False):
+        """Queues the message to be sent after the emulated latency, clear drops responses not sent yet"""
+        with session.outgoing_condition:
+            if clear:
+                session.outgoing.clear()
+            session.outgoing.append((time.time() + self.response_latency, message))
+            session.outgoing_condition.notify_all()
+
+    def sender_loop(self, session):
+        try:
+            while True:
+                with session.outgoing_condition:
+                    while session.alive and not session.outgoing:
+                        session.outgoing_condition.wait()
+                    if not session.alive:
+                        return
+                    due, message = session.outgoing[0]
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                with session.outgoing_condition:
+                    if not session.outgoing or session.outgoing[0][1] is not message:
+                        # Device clear dropped it
+                        continue
+                    session.outgoing.popleft()
+                session.sync_conn.sendall(message)
+        except socket.error:
+            pass
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""Simulated HP/Agilent 6632B power supply driving a resistive load, for exercising devices.hp6632b without
+hardware"""
+import re
+import struct
+import time
+
+from .instrument import simulated_instrument
+
+# Number with an optional unit like "5000.000000 MV"
+value_regex = re.compile(r"^\s*([+-]?[0-9.]+(?:[eE][+-]?\d+)?)\s*([A-Za-z]*)\s*$")
+unit_multipliers = {
+    '': 1.0,
+    'V': 1.0,
+    'A': 1.0,
+    'MV': 1e-3,
+    'MA': 1e-3,
+    'UA': 1e-6,
+}
+
+
+def parse_value(args):
+    """Returns the value in volts/amps"""
+    match = value_regex.match(args)
+    if not match or match.group(2).upper() not in unit_multipliers:
+        raise ValueError(args)
+    return float(match.group(1)) * unit_multipliers[match.group(2).upper()]
+
+
+def parse_onoff(args):
+    args = args.strip().upper()
+    if args in ("1", "ON"):
+        return 1
+    if args in ("0", "OFF"):
+        return 0
+    raise ValueError(args)
+
+
+def parse_format(args):
+    parts = [part.strip().upper() for part in args.split(',')]
+    if parts[0] in ("ASC", "ASCII"):
+        return "ASC"
+    if parts[0] == "REAL" and parts[1:] in ([], ["64"]):
+        return "REAL,64"
+    raise ValueError(args)
+
+
+def parse_byte_order(args):
+    args = args.strip().upper()
+    if args in ("NORM", "NORMAL"):
+        return "NORM"
+    if args in ("SWAP", "SWAPPED"):
+        return "SWAP"
+    raise ValueError(args)
+
+
+def format_number(value):
+    """Formats the value the way the supply does, like "+1.23450E+00" """
+    return "%+.5E" % value
+
+
+class hp6632b_instrument(simulated_instrument):
+    def __init__(self, load_resistance=10.0, sample_interval=0.0):
+        """Initializes the supply with the output connected to load_resistance ohms, the measurements take
+        SENSe:SWEep:POINts times sample_interval seconds (15.6 us on the real supply, 32 ms with the default 2048
+        points)"""
+        super(hp6632b_instrument, self).__init__("HEWLETT-PACKARD,6632B,0,A.00.00")
+        self.load_resistance = load_resistance
+        self.sample_interval = sample_interval
+        self.remote_mode = "LOC"
+        self.add_parameter("SOURce:VOLTage", 0.0, parse_value, format_number)
+        self.add_parameter("SOURce:CURRent", 0.0, parse_value, format_number)
+        self.add_parameter("SENSe:CURRent:RANGe", 5.0, parse_value, format_number)
+        self.add_parameter("SENSe:SWEep:POINts", 2048, int)
+        self.add_parameter("OUTPut:STATe", 0, parse_onoff)
+        self.add_parameter("FORMat", "ASC", parse_format)
+        self.add_parameter("FORMat:BORDer", "NORM", parse_byte_order)
+        self.add_parameter("DISPlay", 1, parse_onoff)
+        self.add_parameter("DISPlay:MODE", "NORM", lambda args: args.strip().upper())
+        self.add_parameter("DISPlay:TEXT", '""')
+        for header in ("MEASure:VOLTage?", "MEASure:SCALar:VOLTage?"):
+            self.add_command(header, lambda args: format_number(self.acquire(self.output_voltage())))
+        for header in ("MEASure:CURRent?", "MEASure:SCALar:CURRent?"):
+            self.add_command(header, lambda args: format_number(self.acquire(self.output_current())))
+        self.add_command("MEASure:ARRay:VOLTage?", lambda args: self.format_array(self.acquire(self.output_voltage())))
+        self.add_command("MEASure:ARRay:CURRent?", lambda args: self.format_array(self.acquire(self.output_current())))
+        self.add_command("SYSTem:REMote", lambda args: self._set_remote_mode("REM"))
+        self.add_command("SYSTem:LOCal", lambda args: self._set_remote_mode("LOC"))
+        self.add_command("SYSTem:RWLock", lambda args: self._set_remote_mode("RWL"))
+
+    def _set_remote_mode(self, mode):
+        self.remote_mode = mode
+
+    def acquire(self, value):
+        """Takes the time of a measurement sweep, returns value"""
+        if self.sample_interval:
+            time.sleep(self.parameters["SENS:SWE:POIN"] * self.sample_interval)
+        return value
+
+    def output_current(self):
+        """The current through the load, limited by the current setting"""
+        if not self.parameters["OUTP:STAT"]:
+            return 0.0
+        current = self.parameters["SOUR:VOLT"] / self.load_resistance
+        return min(current, self.parameters["SOUR:CURR"])
+
+    def output_voltage(self):
+        """The voltage over the load, drops when the supply is current limited"""
+        if not self.parameters["OUTP:STAT"]:
+            return 0.0
+        return min(self.parameters["SOUR:VOLT"], self.output_current() * self.load_resistance)
+
+    def format_array(self, value):
+        """Returns a sweep of SENSe:SWEep:POINts samples in the current data format"""
+        points = self.parameters["SENS:SWE:POIN"]
+        # Sawtooth ripple so the samples are not all the same
+        samples = [value + (index % 16) * 1e-4 for index in range(points)]
+        if self.parameters["FORM"] == "ASC":
+            return ",".join(format_number(sample) for sample in samples)
+        byte_order = '>'
+        if self.parameters["FORM:BORD"] == "SWAP":
+            byte_order = '<'
+        payload = struct.pack("%s%dd" % (byte_order, points), *samples)
+        length = str(len(payload))
+        return ("#%d%s" % (len(length), length)).encode('ascii') + payload
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""Minimal SCPI command parser and instrument state for emulating instruments without hardware
+
+The instrument only deals with complete command lines, the emulator front-ends (TCP server etc) take care of
+getting the lines in and the responses out.
+"""
+import re
+import time
+from collections import deque
+from threading import RLock
+
+# Node like "SENSe1" -> short form "SENS1", long form "SENSE1"
+node_regex = re.compile(r"^([A-Z*]+)[a-z]*(\d*)$")
+
+
+def parse_node(node):
+    """Returns (short, long) uppercase forms of a header node as written in the command tree"""
+    match = node_regex.match(node)
+    if not match:
+        return (node.upper(), node.upper())
+    return (match.group(1) + match.group(2), node.upper())
+
+
+class simulated_instrument(object):
+    def __init__(self, idn="python-scpi,simulated instrument,0,0.1"):
+        """Initializes the instrument with the IEEE 488.2 common commands and SYSTem:ERRor?"""
+        self.idn = idn
+        # Seconds to sleep before handling each command line
+        self.processing_delay = 0
+        # The command lines handled so far, see record_lines()
+        self.received_lines = None
+        # Lines are handled one at a time even if there are many front-ends
+        self.lock = RLock()
+        self.error_queue = deque()
+        self.max_error_queue = 10
+        self.esr = 0
+        self.ese = 0
+        # Parameters added with add_parameter(), short header -> value
+        self.parameters = {}
+        self._defaults = {}
+        # [([(short, long), ...], is_query, handler), ...]
+        self._commands = []
+        self._lookup_cache = {}
+        self.add_command("*IDN?", lambda args: self.idn)
+        self.add_command("*RST", lambda args: self.reset())
+        self.add_command("*CLS", lambda args: self.clear_status())
+        self.add_command("*OPC", lambda args: self.operation_complete())
+        self.add_command("*OPC?", lambda args: "1")
+        self.add_command("*WAI", lambda args: None)
+        self.add_command("*ESR?", lambda args: str(self.read_esr()))
+        self.add_command("*ESE", self._set_ese)
+        self.add_command("*ESE?", lambda args: str(self.ese))
+        self.add_command("*STB?", lambda args: str(self.status_byte()))
+        self.add_command("SYSTem:ERRor?", lambda args: self.pop_error())
+        self.add_command("SYSTem:ERRor:NEXT?", lambda args: self.pop_error())
+
+    def add_command(self, header, handler):
+        """Registers handler(args) for the header (written like "CONFigure:NETWork:TYPE?"), for queries the
+        handler must return the response string (or bytes for binary blocks). Handlers may raise ValueError for
+        bad parameters"""
+        query = header.endswith('?')
+        nodes = [parse_node(node) for node in header.rstrip('?').lstrip(':').split(':')]
+        self._commands.append((nodes, query, handler))
+        self._lookup_cache = {}
+
+    def add_parameter(self, header, value, parser=str, formatter=str):
+        """Registers a settable parameter, "HEADer <value>" stores parser(value) and "HEADer?" returns
+        formatter(value)"""
+        key = self.short_header(header)
+        self.parameters[key] = value
+        self._defaults[key] = value
+
+        def set_value(args):
+            self.parameters[key] = parser(args)
+
+        def get_value(args):
+            return formatter(self.parameters[key])
+
+        self.add_command(header, set_value)
+        self.add_command(header + "?", get_value)
+
+    def record_lines(self, enabled=True):
+        """Starts (or stops) keeping the command lines the instrument gets in received_lines, for checking what
+        actually went over the wire"""
+        self.received_lines = [] if enabled else None
+
+    def short_header(self, header):
+        """Returns the short uppercase form of the header"""
+        return ":".join(parse_node(node)[0] for node in header.lstrip(':').split(':'))
+
+    def reset(self):
+        """*RST, restores the parameters to their initial values"""
+        self.parameters.update(self._defaults)
+
+    def clear_status(self):
+        """*CLS, clears the error queue and event status register"""
+        self.error_queue.clear()
+        self.esr = 0
+
+    def operation_complete(self):
+        """*OPC, there is nothing pending so sets the OPC bit immediately"""
+        self.esr |= 0x01
+
+    def read_esr(self):
+        esr = self.esr
+        self.esr = 0
+        return esr
+
+    def _set_ese(self, args):
+        self.ese = int(args)
+
+    def status_byte(self):
+        """Returns the status byte, bit 2 is error/event queue not empty and bit 5 is the event status bit"""
+        stb = 0
+        if self.error_queue:
+            stb |= 0x04
+        if self.esr & self.ese:
+            stb |= 0x20
+        return stb
+
+    def push_error(self, code, message):
+        """Adds an error to the queue and sets the matching event status bit"""
+        if len(self.error_queue) >= self.max_error_queue:
+            self.error_queue[-1] = (-350, "Queue overflow")
+        else:
+            self.error_queue.append((code, message))
+        if -200 < code <= -100:
+            self.esr |= 0x20  # Command error
+        elif -300 < code <= -200:
+            self.esr |= 0x10  # Execution error
+        elif -400 < code <= -300 or code > 0:
+            self.esr |= 0x08  # Device dependent error
+        elif code <= -400:
+            self.esr |= 0x04  # Query error
+
+    def pop_error(self):
+        if not self.error_queue:
+            return '0,"No error"'
+        return '%d,"%s"' % self.error_queue.popleft()
+
+    def find_command(self, nodes, query):
+        """Finds the handler for the parsed header, returns None if there is no such command"""
+        cache_key = (tuple(nodes), query)
+        if cache_key in self._lookup_cache:
+            return self._lookup_cache[cache_key]
+        found = None
+        for command_nodes, command_query, handler in self._commands:
+            if command_query != query or len(command_nodes) != len(nodes):
+                continue
+            if all(node in forms for node, forms in zip(nodes, command_nodes)):
+                found = handler
+                break
+        self._lookup_cache[cache_key] = found
+        return found
+
+    def handle_line(self, line):
+        """Handles a complete command line, returns the response line (None if there were no queries)"""
+        with self.lock:
+            if self.received_lines is not None:
+                self.received_lines.append(line)
+            if self.processing_delay:
+                time.sleep(self.processing_delay)
+            responses = []
+            path = []
+            for unit in line.split(';'):
+                unit = unit.strip()
+                if not unit:
+                    continue
+                parts = unit.split(None, 1)
+                header = parts[0]
+                args = parts[1].strip() if len(parts) > 1 else ""
+                query = header.endswith('?')
+                nodes = header.rstrip('?').upper().split(':')
+                if not header.startswith((':', '*')) and path:
+                    # Relative to the previous header, fall back to absolute for sloppy clients
+                    handler = self.find_command(path + nodes, query)
+                    if handler is not None:
+                        nodes = path + nodes
+                    else:
+                        handler = self.find_command(nodes, query)
+                else:
+                    nodes = [node for node in nodes if node]
+                    handler = self.find_command(nodes, query)
+                if not header.startswith('*'):
+                    path = nodes[:-1]
+                if handler is None:
+                    self.push_error(-113, "Undefined header;%s" % header)
+                    continue
+                try:
+                    response = handler(args)
+                except ValueError as e:
+                    self.push_error(-224, "Illegal parameter value;%s" % e)
+                    continue
+                if query:
+                    responses.append(response)
+            if not responses:
+                return None
+            if any(isinstance(response, bytes) for response in responses):
+                # Binary block responses
+                return b";".join(response if isinstance(response, bytes) else response.encode('utf-8')
+                                 for response in responses)
+            return ";".join(responses)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""Prologix style GPIB adapter emulator on a pty, with simulated instruments on the "bus"
+
+Open port_name with pyserial and give it to transports.prologix.prologix_adapter like a real adapter.
+"""
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+
+class prologix_server(object):
+    def __init__(self, instruments, baudrate=None):
+        """Initializes the adapter for instruments (dict of GPIB address -> simulated_instrument). If baudrate is
+        given the host to adapter data is consumed no faster than a serial line of that speed (10 bits per byte)
+        would carry it, so the writes on the host side block once the pty buffer is full"""
+        self.instruments = instruments
+        self.baudrate = baudrate
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        self.address = None
+        # GPIB address -> response waiting to be read with "++read"
+        self.output = {}
+        # Counters for benchmarks
+        self.adapter_commands = {}
+        self.server_alive = False
+        self.server_thread = None
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def start(self):
+        """Starts handling the adapter traffic in a background thread"""
+        self.server_alive = True
+        self.server_thread = threading.Thread(target=self.adapter_loop)
+        self.server_thread.setDaemon(1)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread and closes the pty"""
+        self.server_alive = False
+        os.write(self._wakeup_write, b"\0")
+        if self.server_thread is not None:
+            self.server_thread.join()
+        for fd in (self.master, self.slave, self._wakeup_read, self._wakeup_write):
+            os.close(fd)
+
+    def adapter_loop(self):
+        line = bytearray()
+        escaped = False
+        read_size = 65536
+        if self.baudrate:
+            read_size = 64
+        while self.server_alive:
+            rd, wd, ed = select.select([self.master, self._wakeup_read], [], [])
+            if not self.server_alive:
+                break
+            try:
+                data = os.read(self.master, read_size)
+            except OSError:
+                break
+            for byte in bytearray(data):
+                if escaped:
+                    line.append(byte)
+                    escaped = False
+                elif byte == 0x1b:
+                    # Escaped bytes are data, not adapter commands or line ends
+                    line.append(byte)
+                    escaped = True
+                elif byte in (0x0d, 0x0a):
+                    if line:
+                        self.handle_line(line)
+                    line = bytearray()
+                else:
+                    line.append(byte)
+            if self.baudrate:
+                time.sleep(len(data) * 10.0 / self.baudrate)
+
+    def handle_line(self, line):
+        if line.startswith(b"++"):
+            self.handle_adapter_command(line[2:].decode('ascii').split())
+            return
+        instrument = self.instruments.get(self.address)
+        if instrument is None:
+            # Nobody listening, a real adapter would time out
+            return
+        command = line.replace(b"\x1b", b"").decode('utf-8')
+        response = instrument.handle_line(command)
+        if response is not None:
+            self.output[self.address] = response
+
+    def handle_adapter_command(self, words):
+        if not words:
+            return
+        name = words[0]
+        self.adapter_commands[name] = self.adapter_commands.get(name, 0) + 1
+        if name == "addr":
+            if len(words) > 1:
+                self.address = int(words[1])
+            else:
+                self.write("%d" % self.address)
+        elif name == "read":
+            response = self.output.pop(self.address, None)
+            if response is not None:
+                self.write(response)
+        elif name == "clr":
+            self.output.pop(self.address, None)
+        elif name == "ver":
+            self.write("Prologix GPIB-USB Controller version 6.107 (emulated)")
+
+    def write(self, text):
+        """Sends a line to the host, the instruments terminate with LF"""
+        data = memoryview((text + "\n").encode('utf-8'))
+        while len(data):
+            data = data[os.write(self.master, data):]
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Serial port front-end for a simulated instrument on a pty
+
+Open port_name with pyserial and give it to transports.rs232 like a real serial port.
+"""
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+
+class serial_server(object):
+    def __init__(self, instrument, baudrate=None, line_terminator="\r\n", error_rate=0.0, seed=None):
+        """Initializes the port for the instrument. If baudrate is given data moves no faster in either direction
+        than a serial line of that speed (10 bits per byte) would carry it. error_rate is the probability
+        (0.0 - 1.0) of a command line leaving injected_error in the error queue after it has been handled, seed
+        makes the injected errors repeatable. The instrument's own processing_delay applies as usual"""
+        self.instrument = instrument
+        self.baudrate = baudrate
+        self.line_terminator = line_terminator
+        self.error_rate = error_rate
+        self.injected_error = (-310, "System error;injected")
+        self.random = random.Random(seed)
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        # Counters for benchmarks
+        self.lines_handled = 0
+        self.injected_errors = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.server_alive = False
+        self.server_thread = None
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def start(self):
+        """Starts handling the port traffic in a background thread"""
+        self.server_alive = True
+        self.server_thread = threading.Thread(target=self.serial_loop)
+        self.server_thread.setDaemon(1)
+        self.server_thread.start()
+        return self
+
+    def stop(self):
+        """Stops the thread and closes the pty"""
+        self.server_alive = False
+        os.write(self._wakeup_write, b"\0")
+        if self.server_thread is not None:
+            self.server_thread.join()
+        for fd in (self.master, self.slave, self._wakeup_read, self._wakeup_write):
+            os.close(fd)
+
+    def serial_loop(self):
+        line = bytearray()
+        read_size = 65536
+        if self.baudrate:
+            read_size = 64
+        while self.server_alive:
+            rd, wd, ed = select.select([self.master, self._wakeup_read], [], [])
+            if not self.server_alive:
+                break
+            try:
+                data = os.read(self.master, read_size)
+            except OSError:
+                break
+            self.bytes_received += len(data)
+            if self.baudrate:
+                time.sleep(len(data) * 10.0 / self.baudrate)
+            line += data
+            while True:
+                end = line.find(b"\n")
+                if end < 0:
+                    break
+                command = bytes(line[:end]).rstrip(b"\r")
+                del line[:end + 1]
+                if command:
+                    self.handle_line(command.decode('utf-8'))
+
+    def handle_line(self, command):
+        self.lines_handled += 1
+        response = self.instrument.handle_line(command)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.injected_errors += 1
+            self.instrument.push_error(*self.injected_error)
+        if response is None:
+            return
+        if not isinstance(response, bytes):
+            response = response.encode('utf-8')
+        self.write(response + self.line_terminator.encode('ascii'))
+
+    def write(self, data):
+        """Sends data to the host, at the emulated line speed if there is one"""
+        data = memoryview(data)
+        chunk_size = len(data)
+        if self.baudrate:
+            chunk_size = 64
+        while len(data):
+            written = os.write(self.master, data[:chunk_size])
+            self.bytes_sent += written
+            data = data[written:]
+            if self.baudrate:
+                time.sleep(written * 10.0 / self.baudrate)
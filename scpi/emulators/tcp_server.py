@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Raw socket (port 5025 style) front-end for a simulated instrument"""
+import socket
+import threading
+
+
+class tcp_server(object):
+    def __init__(self, instrument, host="127.0.0.1", port=0, control_port=None):
+        """Initializes the server for the instrument, port 0 picks a free port (see address). If control_port is
+        given (0 picks a free one, see control_address) "DCL" lines sent to it are counted in device_clears, the
+        instrument handles the lines as they come so there is nothing else to clear"""
+        self.instrument = instrument
+        self.line_terminator = "\n"
+        self.listen_socket = self._listen(host, port)
+        self.address = self.listen_socket.getsockname()
+        self.control_socket = None
+        self.control_address = None
+        if control_port is not None:
+            self.control_socket = self._listen(host, control_port)
+            self.control_address = self.control_socket.getsockname()
+        self.device_clears = 0
+        self.connections = []
+        self.server_alive = False
+        self.server_thread = None
+        self.control_thread = None
+
+    def _listen(self, host, port):
+        listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_socket.bind((host, port))
+        return listen_socket
+
+    def start(self):
+        """Starts accepting connections in a background thread"""
+        self.listen_socket.listen(5)
+        self.server_alive = True
+        self.server_thread = threading.Thread(target=self.accept_loop, args=(self.listen_socket, self.connection_loop))
+        self.server_thread.setDaemon(1)
+        self.server_thread.start()
+        if self.control_socket is not None:
+            self.control_socket.listen(5)
+            self.control_thread = threading.Thread(target=self.accept_loop,
+                                                   args=(self.control_socket, self.control_loop))
+            self.control_thread.setDaemon(1)
+            self.control_thread.start()
+        return self
+
+    def stop(self):
+        """Closes the listening socket and all connections"""
+        self.server_alive = False
+        for listen_socket in (self.listen_socket, self.control_socket):
+            if listen_socket is None:
+                continue
+            try:
+                listen_socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            listen_socket.close()
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            conn.close()
+        for thread in (self.server_thread, self.control_thread):
+            if thread is not None:
+                thread.join()
+
+    def accept_loop(self, listen_socket, handler):
+        while self.server_alive:
+            try:
+                conn, peer = listen_socket.accept()
+            except socket.error:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections.append(conn)
+            thread = threading.Thread(target=handler, args=(conn,))
+            thread.setDaemon(1)
+            thread.start()
+
+    def connection_loop(self, conn):
+        buf = b""
+        terminator = self.line_terminator.encode('ascii')
+        try:
+            while self.server_alive:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                buf += data
+                while terminator in buf:
+                    line, buf = buf.split(terminator, 1)
+                    response = self.instrument.handle_line(line.decode('utf-8').rstrip('\r'))
+                    if response is not None:
+                        if not isinstance(response, bytes):
+                            response = response.encode('utf-8')
+                        conn.sendall(response + terminator)
+        except socket.error:
+            pass
+        finally:
+            if conn in self.connections:
+                self.connections.remove(conn)
+            conn.close()
+
+    def control_loop(self, conn):
+        """Counts the device clears sent to the control port"""
+        buf = b""
+        try:
+            while self.server_alive:
+                data = conn.recv(1024)
+                if not data:
+                    break
+                buf += data
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    if line.strip().upper() == b"DCL":
+                        self.device_clears += 1
+        except socket.error:
+            pass
+        finally:
+            if conn in self.connections:
+                self.connections.remove(conn)
+            conn.close()
@@ -22,3 +22,28 @@ class CommandError(RuntimeError):
 
     def __str__(self):
         return "'%s' returned error %d: %s" % (self.command, self.code, self.message)
+
+
+class AbortedError(RuntimeError):
+    def __init__(self, command, reason, *args, **kwargs):
+        self.command = command
+        self.reason = reason
+        super(AbortedError, self).__init__(str(self), *args, **kwargs)
+
+    def __str__(self):
+        return "'%s' was aborted: %s" % (self.command, self.reason)
+
+
+class DeferredCommandError(CommandError):
+    def __init__(self, errors, *args, **kwargs):
+        """errors is a list of (command, code, message) tuples, the first one
+           is used for the command, code and message attributes"""
+        self.errors = errors
+        command, code, message = errors[0]
+        super(DeferredCommandError, self).__init__(command, code, message, *args, **kwargs)
+
+    def __str__(self):
+        extra = ""
+        if len(self.errors) > 1:
+            extra = " (and %d more errors)" % (len(self.errors) - 1)
+        return super(DeferredCommandError, self).__str__() + extra
@@ -0,0 +1,171 @@
+"""Learned per-command response times, see scpi.enable_response_learning()
+
+   The quantiles of the response time of each header are tracked with
+   exponentially weighted estimates so recent behaviour counts most, the
+   memory use does not grow with the number of commands and the profile
+   can be saved to (and loaded from) a JSON file."""
+import json
+import os
+from threading import Lock
+
+# Tracked quantiles, the timeouts are based on the highest one
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class quantile_estimator(object):
+    """Exponentially weighted estimate of a quantile of a stream of values,
+       moves towards each new value by a step that follows the typical
+       deviation of the values so it settles at the same speed whatever
+       the scale is"""
+
+    def __init__(self, quantile, alpha=0.05):
+        self.quantile = quantile
+        self.alpha = alpha
+        self.value = None
+        self.deviation = None
+
+    def add(self, value):
+        if self.value is None:
+            self.value = value
+            self.deviation = value / 2.0
+            return
+        self.deviation += self.alpha * (abs(value - self.value) -
+                                        self.deviation)
+        step = 4 * self.alpha * max(self.deviation, 1e-6)
+        if value > self.value:
+            self.value += step * self.quantile
+        else:
+            self.value = max(0.0, self.value - step * (1 - self.quantile))
+
+    def scale(self, factor):
+        self.value *= factor
+        self.deviation *= factor
+
+
+class header_profile(object):
+    """The learned response time quantiles of one header"""
+
+    def __init__(self, alpha=0.05):
+        self.count = 0
+        self.timeouts = 0
+        self.estimators = [quantile_estimator(quantile, alpha)
+                           for quantile in QUANTILES]
+
+    def add(self, seconds):
+        self.count += 1
+        for estimator in self.estimators:
+            estimator.add(seconds)
+
+    def quantile(self, quantile):
+        """Returns the estimate of a tracked quantile, None if there is no
+           data"""
+        return self.estimators[QUANTILES.index(quantile)].value
+
+    def as_dict(self):
+        result = {'count': self.count, 'timeouts': self.timeouts}
+        if self.count:
+            for estimator in self.estimators:
+                result['p%d' % round(estimator.quantile * 100)] = \
+                    estimator.value
+                result['d%d' % round(estimator.quantile * 100)] = \
+                    estimator.deviation
+        return result
+
+    def load(self, values):
+        self.count = values.get('count', 0)
+        self.timeouts = values.get('timeouts', 0)
+        if not self.count:
+            return
+        for estimator in self.estimators:
+            name = "%d" % round(estimator.quantile * 100)
+            estimator.value = float(values['p' + name])
+            estimator.deviation = float(values['d' + name])
+
+
+class response_profile(object):
+    """Per-header response times (from the end of sending the query to the
+       complete response) and the timeouts based on them. A header with at
+       least min_samples responses times out after timeout_margin times its
+       99th percentile (but at least min_timeout and at most the default
+       timeout), a header that does time out has its estimates doubled so
+       a device that got slower is learned quickly"""
+
+    def __init__(self, alpha=0.05, min_samples=20, timeout_margin=5.0,
+                 min_timeout=0.25):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.timeout_margin = timeout_margin
+        self.min_timeout = min_timeout
+        self.headers = {}
+        self.lock = Lock()
+
+    def _header(self, command):
+        header = command.split(' ', 1)[0]
+        try:
+            return self.headers[header]
+        except KeyError:
+            profile = header_profile(self.alpha)
+            self.headers[header] = profile
+            return profile
+
+    def record(self, command, seconds):
+        """Adds the response time of the command"""
+        with self.lock:
+            self._header(command).add(seconds)
+
+    def record_timeout(self, command):
+        """Notes that the command timed out"""
+        with self.lock:
+            profile = self._header(command)
+            profile.timeouts += 1
+            if profile.count:
+                for estimator in profile.estimators:
+                    estimator.scale(2.0)
+
+    def expected(self, command, quantile=0.5):
+        """Returns the learned response time quantile (one of QUANTILES) of
+           the command, None if there is not enough data yet"""
+        profile = self.headers.get(command.split(' ', 1)[0])
+        if profile is None or profile.count < self.min_samples:
+            return None
+        return profile.quantile(quantile)
+
+    def timeout(self, command, default):
+        """Returns the timeout for the command, default if nothing has been
+           learned of it"""
+        slowest = self.expected(command, QUANTILES[-1])
+        if slowest is None:
+            return default
+        return min(default, max(self.min_timeout,
+                                slowest * self.timeout_margin))
+
+    def reset(self):
+        with self.lock:
+            self.headers = {}
+
+    def as_dict(self):
+        with self.lock:
+            return dict((header, profile.as_dict())
+                        for header, profile in self.headers.items())
+
+    def save(self, path):
+        """Writes the profile to a JSON file (replaced atomically)"""
+        data = {'version': 1, 'headers': self.as_dict()}
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        """Reads a profile written by save(), replaces what has been learned
+           of the headers in it"""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != 1:
+            raise ValueError("Unknown response profile version in '%s'" %
+                             path)
+        with self.lock:
+            for header, values in data['headers'].items():
+                profile = header_profile(self.alpha)
+                profile.load(values)
+                self.headers[header] = profile
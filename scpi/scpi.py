@@ -1,36 +1,140 @@
 """Generic SCPI commands, allow sending and reading of raw data,
    helpers to parse information"""
+import os
 import time
 import re
+import random
 
 # from exceptions import RuntimeError, ValueError
-from .errors import TimeoutError, CommandError
+from .errors import (TimeoutError, CommandError, DeferredCommandError,
+                     AbortedError)
+from .compiler import command_compiler, short_header
+from .cache import parameter_cache
+from .stats import scpi_stats
+from .learning import response_profile
 import decimal
+import sys
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import Future
 
-from threading import Lock
+from threading import Lock, Condition, Thread, Event, local
+from collections import deque
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The value SCPI devices use for "not a number"
+SCPI_NAN = 9.91e37
+
+# Status register queries for the set_error_check() fast paths and the bits
+# that mean there are errors to read
+STATUS_QUERIES = {
+    'stb': ("*STB?", 0x04),  # Error/event queue not empty
+    'esr': ("*ESR?", 0x3c),  # Command, execution, device and query error
+}
+# Resynchronizes the responses after a timeout, see set_timeout_recovery().
+# Answers with the old event status enable register value and the two
+# (random) markers, nothing else is taken for the answer
+RECOVERY_SENTINEL = "*ESE?;*ESE %d;*ESE?;*ESE %d;*ESE?"
+# Event status register error bits and the generic errors they stand for
+ESR_ERRORS = (
+    (0x20, -100, "Command error"),
+    (0x10, -200, "Execution error"),
+    (0x08, -300, "Device-specific error"),
+    (0x04, -400, "Query error"),
+)
+
+
+class response_slot(object):
+    """Holds the response to a single outstanding query, slots are filled
+       in the order the queries were sent"""
+
+    def __init__(self, command):
+        self.command = command
+        self.message = None
+        # Set instead of the message if the query was given up on
+        self.error = None
+        # What the transport returned for the query, see
+        # transports_base.response_abandoned()
+        self.token = None
+        # Sent with start(), the queries after it wait for its response
+        self.started = False
+        # Timed out waiting behind a started query, its response is
+        # discarded when it arrives
+        self.abandoned = False
+        # Only filled in when collecting statistics
+        self.first_byte_time = None
+        self.received_time = None
 
-class scpi(object):
-    """Sends commands to the transport and parses return values"""
+
+class scpi_base(object):
+    """The parts of scpi that do not depend on how the responses are
+       waited for: parsing, the error check settings, header timeouts,
+       the compiler and the parameter cache. scpi (threads) and scpi_async
+       (asyncio) add the methods that talk to the transport, and register
+       message_received() with it once their state is set up"""
 
     def __init__(self, transport, *args, **kwargs):
-        super(scpi, self).__init__(*args, **kwargs)
+        super(scpi_base, self).__init__(*args, **kwargs)
         self.transport = transport
-        self.transport.set_message_callback(self.message_received)
-        self.message_stack = []
+        # Queries waiting for their response, oldest first
+        self.pending_responses = deque()
+        self.max_pending_responses = 16
+        # Messages that arrive with no query outstanding end up here, oldest
+        # are dropped when the channel is full. A late response to a query
+        # that timed out is only told apart by transports that match the
+        # responses to the queries (see transports_base.response_abandoned())
+        # or by the timeout recovery (see set_timeout_recovery()), otherwise
+        # it goes to the next query
+        self.unsolicited = deque(maxlen=64)
+        # Each thread gets its own stack of received responses, see
+        # message_stack
+        self.message_stack_size = 16
+        self._thread_local = local()
+        # Upper bound for reading the error queue in drain_errors()
+        self.max_error_queue = 32
+        # See set_error_check()
+        self.error_check_method = 'queue'
+        # Event status register bits read but not yet taken, see
+        # take_esr_bits()
+        self._esr_bits = 0
+        self._esr_lock = Lock()
+        # See set_list_backend()
+        self.list_backend = 'list'
+        # See set_command_compiler()
+        self.compiler = None
+        # See set_parameter_cache()
+        self.parameter_cache = None
+        # See enable_response_learning()
+        self.response_profile = None
+        self.response_profile_path = None
         self.error_format_regex = re.compile(r"([+-]?\d+),\"(.*?)\"")
         self.command_timeout = 1.5  # Seconds
+        # See set_header_timeouts()
+        self.header_timeouts = ()
+        self._header_timeout_cache = {}
         self.ask_default_wait = 0  # Seconds
-        self.transport_lock = Lock()
 
     def quit(self):
-        """Shuts down any background threads that might be active"""
+        """Shuts down any background threads that might be active (and
+           saves the learned response profile if it has a path)"""
+        if self.response_profile is not None and self.response_profile_path:
+            self.save_response_profile()
         self.transport.quit()
 
-    def message_received(self, message):
-        # print " *** Got message '%s' ***" % message
-        self.message_stack.append(message)
-        pass
+    @property
+    def message_stack(self):
+        """Responses received for the queries sent from the current thread,
+           the pop_* methods take the last one"""
+        try:
+            return self._thread_local.message_stack
+        except AttributeError:
+            stack = deque(maxlen=self.message_stack_size)
+            self._thread_local.message_stack = stack
+            return stack
 
     def parse_error(self, message):
         """Parses given message for error code and string, raises error if
@@ -44,56 +148,40 @@ class scpi(object):
         errstr = match.group(2)
         return (code, errstr)
 
-    def send_command_unchecked(self, command, expect_response=True,
-                               force_wait=None):
-        """Sends the command, waits for all data to complete (and if response
-           is expected for new entry to message stack).
-           The force_wait parameter is in seconds, if we know the device is
-           going to take a while processing the request we can use this to
-           avoid nasty race conditions"""
-        self.transport_lock.acquire()
-        try:
-            if force_wait is None:
-                force_wait = self.ask_default_wait
-            stack_size_start = len(self.message_stack)
-            self.transport.send_command(command)
-            time.sleep(force_wait)
-            timeout_start = time.time()
-            while (self.transport.incoming_data() or (expect_response and len(
-                    self.message_stack) < stack_size_start + 1)):
-                time.sleep(0)
-                if ((time.time() - timeout_start) > self.command_timeout):
-                    raise TimeoutError(command, self.command_timeout)
-                    # PONDER: We might want to auto-call abort_command() ? or
-                    # maybe it's better handled by a decorator or something ??
-        finally:
-            self.transport_lock.release()
+    def _send(self, command):
+        """Hands the command to the transport (through the compiler if
+           enabled), returns the transport's token for it (see
+           transports_base.response_abandoned()). The caller holds
+           transport_lock"""
+        if self.parameter_cache is not None:
+            self.parameter_cache.command_sent(command)
+        if self.compiler is None:
+            return self.transport.send_command(command)
+        if self.compiler.line_terminator is None:
+            return self.transport.send_command(self.compiler.compile(command))
+        return self.transport.send_bytes(self.compiler.encode(command))
 
-    def send_command(self, command, expect_response=False, force_wait=None):
-        """Sends the command and makes sure it did not trigger errors,
-           in case of timeout checks if there was another underlying error
-           and raises that instead. The force_wait parameter is in seconds,
-           if we know the device is going to take a while processing the
-           request we can use this to avoid nasty race conditions"""
-        re_raise = None
-        try:
-            # PONDER: auto-add ";*WAI" ??
-            self.send_command_unchecked(command, expect_response, force_wait)
-        except TimeoutError as e:
-            re_raise = e
-        finally:
-            self.check_error(command)
-            if re_raise:
-                raise re_raise
+    def _guess_error_command(self, errstr, commands):
+        """Many devices append the offending header to the error string
+           (like 'Undefined header;CONF:FOO'), use it to find the command.
+           Headers match on whole nodes, VOLT is not found in SOUR:VOLTAGE"""
+        reported = [token.strip(':?').split(':')
+                    for token in re.split(r'[^A-Z0-9_:*?]+', errstr.upper()) if token.strip(':?')]
+        for command in reversed(commands):
+            headers = [command.split(' ', 1)[0]]
+            if self.compiler is not None:
+                # The device saw (and reports) the short form
+                headers.append(self.compiler.compile_header(headers[0]))
+            for header in headers:
+                nodes = header.strip(':?').upper().split(':')
+                if nodes != [''] and any(self._nodes_in(nodes, other) for other in reported):
+                    return command
+        return None
 
-    def check_error(self, command_was):
-        """Checks the last error code and raises CommandError if the code is
-           not 0 ("No error")"""
-        self.send_command_unchecked("SYST:ERR?", True)
-        code, errstr = self.parse_error(self.message_stack.pop())
-        if code != 0:
-            raise CommandError(command_was, code, errstr)
-        return code
+    @staticmethod
+    def _nodes_in(nodes, other):
+        """True when the header nodes are a contiguous run of the other header's nodes"""
+        return any(other[start:start + len(nodes)] == nodes for start in range(len(other) - len(nodes) + 1))
 
     def _parse_int(self, val):
         return None if val == "NAN" else int(val)
@@ -104,6 +192,222 @@ class scpi(object):
     def _parse_float_onoff(self, val):
         return None if val == "OFF" else float(val)
 
+    def _parse_bool(self, val):
+        return bool(int(val))
+
+    def set_command_compiler(self, enabled=True):
+        """Enables (or disables) sending commands through the command
+           compiler (see compiler.py): mnemonics are shortened to their
+           short forms and numbers to their shortest representation. If
+           the transport can send raw bytes the encoded commands are
+           memoized too"""
+        if not enabled:
+            self.compiler = None
+            return
+        line_terminator = None
+        if hasattr(self.transport, 'send_bytes'):
+            line_terminator = self.transport.line_terminator
+        self.compiler = command_compiler(line_terminator)
+
+    def set_parameter_cache(self, enabled=True, prefixes=None,
+                            invalidating_headers=()):
+        """Enables (or disables) the read-through cache for settings (see
+           cache.py), prefixes limits the cached headers (short forms, like
+           "CONF:"), invalidating_headers are the commands that clear the
+           whole cache in addition to *RST and friends"""
+        if not enabled:
+            self.parameter_cache = None
+            return
+        self.parameter_cache = parameter_cache(prefixes, invalidating_headers)
+
+    def enable_response_learning(self, enabled=True, path=None):
+        """Starts (or stops) learning the response times of the queries per
+           header, see learning.py. Once a header has been seen often enough
+           its queries time out after a few times the slowest response seen
+           instead of after command_timeout, so a hung device is noticed
+           quickly. The profile is keyed by the header only, the parameters
+           are not part of it: a query whose response time depends on its
+           parameters (like the frame count of a BER test) would get a
+           timeout learned from its quick calls, list such headers with
+           set_header_timeouts(), those are not learned. With path the profile learned earlier is loaded from
+           that JSON file (if it exists) and saved there on quit(), see
+           save_response_profile(). Read the profile with
+           response_profile.as_dict()"""
+        if not enabled:
+            self.response_profile = None
+            self.response_profile_path = None
+            return
+        self.response_profile = response_profile()
+        self.response_profile_path = path
+        if path is not None and os.path.exists(path):
+            self.response_profile.load(path)
+
+    def save_response_profile(self, path=None):
+        """Saves the learned response profile to a JSON file, by default the
+           one given to enable_response_learning()"""
+        if self.response_profile is None:
+            raise RuntimeError("Response learning is not enabled")
+        path = path or self.response_profile_path
+        if path is None:
+            raise ValueError("No path for the response profile")
+        self.response_profile.save(path)
+
+    def set_header_timeouts(self, timeouts):
+        """Sets the timeouts (seconds) of the commands by header, timeouts is
+           a sequence of (header prefix, seconds) tuples (or a dict), the
+           prefixes are in short form (like "READ:" or "CONF:"). The longest
+           matching prefix wins, commands matching none use
+           command_timeout"""
+        if isinstance(timeouts, dict):
+            timeouts = timeouts.items()
+        self.header_timeouts = tuple(sorted(
+            ((self._header_key(prefix), seconds)
+             for prefix, seconds in timeouts),
+            key=lambda item: len(item[0]), reverse=True))
+        self._header_timeout_cache = {}
+
+    def _header_key(self, header):
+        return short_header(header.strip().lstrip(':').rstrip('?')).upper()
+
+    def header_timeout(self, command):
+        """Returns the timeout of the command (the longest of its parts for
+           compound commands), see set_header_timeouts()"""
+        if not self.header_timeouts:
+            return self.command_timeout
+        timeout = 0
+        for part in command.split(';'):
+            part_timeout = self._listed_timeout(part)
+            if part_timeout is None:
+                # Not cached so changes of command_timeout apply
+                part_timeout = self.command_timeout
+            timeout = max(timeout, part_timeout)
+        return timeout
+
+    def header_timeout_listed(self, command):
+        """Tells whether (any part of) the command has its timeout set with
+           set_header_timeouts()"""
+        if not self.header_timeouts:
+            return False
+        return any(self._listed_timeout(part) is not None
+                   for part in command.split(';'))
+
+    def _listed_timeout(self, part):
+        """Returns the timeout set for the header of the command part with
+           set_header_timeouts(), None if there is none"""
+        header = part.strip().split(' ', 1)[0]
+        try:
+            return self._header_timeout_cache[header]
+        except KeyError:
+            pass
+        key = self._header_key(header)
+        part_timeout = None
+        for prefix, seconds in self.header_timeouts:
+            if key.startswith(prefix):
+                part_timeout = seconds
+                break
+        if len(self._header_timeout_cache) >= 1024:
+            self._header_timeout_cache = {}
+        self._header_timeout_cache[header] = part_timeout
+        return part_timeout
+
+    def set_error_check(self, method):
+        """Selects how send_command() checks for errors: "queue" (default)
+           asks SYST:ERR? after every command, "stb" asks the status byte
+           (*STB?) and "esr" the event status register (*ESR?, reading it
+           clears it) and only read the error queue if the error bits are
+           set. The status registers answer with a small integer instead of
+           a quoted string, which saves time on slow links (errors are rare)
+           but needs a device that sets the bits (the "stb" error/event
+           queue bit is from SCPI 1999, the "esr" bits from IEEE 488.2)"""
+        if method != 'queue' and method not in STATUS_QUERIES:
+            raise ValueError("Unknown error check method '%s'" % method)
+        self.error_check_method = method
+
+    def set_list_backend(self, backend):
+        """Selects what the numeric pop_*_list and ask_*_list methods return:
+           "list" (default) for lists, "array" for compact array.array
+           objects (8 bytes per value, they save memory but float replies
+           take about 1.5x as long to parse as with lists) or "numpy" for
+           numpy arrays (float replies parse about as fast as lists, int
+           replies several times faster). With "array" and "numpy" the NAN,
+           OFF and 9.91E37 values all become nan (and int lists containing
+           them become float arrays). Decimal lists are always returned as
+           lists"""
+        if backend not in ('list', 'array', 'numpy'):
+            raise ValueError("Unknown list backend '%s'" % backend)
+        if backend == 'numpy' and numpy is None:
+            raise RuntimeError("The numpy list backend requires numpy")
+        self.list_backend = backend
+
+    def _numpy_values(self, data, dtype):
+        """Parses comma separated values to a numpy array in one go.
+           numpy.fromstring() stops at a value it can't parse (raising or
+           warning, depending on the numpy version), so unless it got all of
+           them the values are converted one by one, which raises ValueError
+           for the bad one"""
+        try:
+            values = numpy.fromstring(data, dtype=dtype, sep=',')
+            if len(values) == data.count(',') + 1:
+                return values
+        except (ValueError, DeprecationWarning):
+            # DeprecationWarning when warnings are errors
+            pass
+        return numpy.array(data.split(','), dtype=dtype)
+
+    def _parse_float_array(self, data):
+        """Parses comma separated floats to array (see set_list_backend)"""
+        data = data.replace("OFF", "NAN")
+        if self.list_backend == 'numpy':
+            values = self._numpy_values(data, numpy.float64)
+            values[values == SCPI_NAN] = numpy.nan
+            return values
+        values = array('d', [float(val) for val in data.split(',')])
+        if SCPI_NAN in values:
+            for idx, val in enumerate(values):
+                if val == SCPI_NAN:
+                    values[idx] = float('nan')
+        return values
+
+    def _parse_int_array(self, data):
+        """Parses comma separated ints to array (see set_list_backend), falls
+           back to floats if there are NAN/OFF values"""
+        try:
+            if self.list_backend == 'numpy':
+                if 'N' in data or 'F' in data:
+                    # NAN, OFF and INF, no need to try ints first
+                    raise ValueError(data)
+                return self._numpy_values(data, numpy.int64)
+            return array('q', [int(val) for val in data.split(',')])
+        except ValueError:
+            return self._parse_float_array(data)
+
+    def _get_parser(self, parser):
+        """Maps the basic types to the matching _parse_* helper, any other
+           callable is used as-is"""
+        if parser is int:
+            return self._parse_int
+        if parser is bool:
+            return self._parse_bool
+        return parser
+
+    def _split_response(self, data):
+        """Splits a compound response on the ';' message unit separators,
+           ignoring any inside quoted strings"""
+        units = []
+        start = 0
+        quote = None
+        for pos, char in enumerate(data):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ('"', "'"):
+                quote = char
+            elif char == ';':
+                units.append(data[start:pos])
+                start = pos + 1
+        units.append(data[start:])
+        return units
+
     def pop_str(self):
         """Pops the last value from message stack and parses it as a string"""
         data = self.message_stack.pop()
@@ -139,7 +443,7 @@ class scpi(object):
     def pop_bool(self):
         """Pops the last value from message stack and parses it as a boolean"""
         data = self.message_stack.pop()
-        return bool(int(data))
+        return self._parse_bool(data)
 
     def pop_str_list(self):
         """Pops the last value from message stack and parses it as a list
@@ -157,12 +461,16 @@ class scpi(object):
         """Pops the last value from message stack and parses it as a list
            of int values"""
         data = self.message_stack.pop()
+        if self.list_backend != 'list':
+            return self._parse_int_array(data)
         return [self._parse_int(val) for val in data.split(',')]
 
     def pop_float_list(self):
         """Pops the last value from message stack and parses it as a list
            of float values"""
         data = self.message_stack.pop()
+        if self.list_backend != 'list':
+            return self._parse_float_array(data)
         return [float(val) for val in data.split(',')]
 
     def pop_bool_list(self):
@@ -171,144 +479,1055 @@ class scpi(object):
         data = self.message_stack.pop()
         return [bool(int(val)) for val in data.split(',')]
 
-    def _ask_no_pop(self, command, force_wait=None):
+    def pop_block(self):
+        """Pops the last value from message stack, it must be an IEEE 488.2
+           definite length block, returns memoryview of the payload"""
+        data = self.message_stack.pop()
+        if not isinstance(data, bytearray):
+            raise ValueError("message '%s' is not a binary block" % data)
+        return memoryview(data)
+
+    def pop_binary_list(self, typecode='d', big_endian=True):
+        """Pops the last value from message stack and parses it as a binary
+           block of values (see the array module for typecodes, 'd' for
+           REAL,64 and 'f' for REAL,32), returns an array. Data is in
+           big-endian order unless device has been told otherwise (with
+           FORMat:BORDer SWAPped)"""
+        values = array(typecode)
+        values.frombytes(self.pop_block())
+        if big_endian != (sys.byteorder == 'big'):
+            values.byteswap()
+        return values
+
+    def _join_queries(self, queries):
+        """Joins the commands of ask_many() style queries to a single line"""
+        commands = []
+        for command, parser in queries:
+            # Anything but the first command would be relative to the
+            # previous header path without the leading colon
+            if commands and not command.startswith((':', '*')):
+                command = ':' + command
+            commands.append(command)
+        return ';'.join(commands)
+
+    def _pop_many(self, queries, command):
+        """Pops the last value from message stack and parses it as the reply
+           to the ask_many() style queries sent as command"""
+        values = self._split_response(self.message_stack.pop())
+        if len(values) != len(queries):
+            raise ValueError("Expected %d values for '%s', got %d" %
+                             (len(queries), command, len(values)))
+        return [self._get_parser(parser)(val.strip())
+                for (_, parser), val in zip(queries, values)]
+
+    def abort_command(self):
+        """Shortcut to the transports abort_command call, returns True if
+           the device was sent device clear"""
+        return self.transport.abort_command()
+
+
+class scpi(scpi_base):
+    """Sends commands to the transport and parses return values"""
+
+    def __init__(self, transport, *args, **kwargs):
+        super(scpi, self).__init__(transport, *args, **kwargs)
+        # See start(), *OPC operations are polled first at
+        # operation_poll_interval, the interval grows up to
+        # operation_max_poll_interval. If the same header has completed
+        # before the first poll is made when it is about to complete again
+        self.operation_poll_interval = 0.01  # Seconds
+        self.operation_max_poll_interval = 0.5  # Seconds
+        self._operation_durations = {}
+        self._operation_lock = Lock()
+        # Set by the timeout recovery to fail the *OPC operation in progress
+        self._operation_aborted = Event()
+        # Counts the *OPC operations, the recovery only aborts the one
+        # that was in progress when the device was cleared
+        self._operation_number = 0
+        # See set_timeout_recovery()
+        self.timeout_recovery = False
+        self.recovery_timeout = 2.0  # Seconds
+        # (markers, reads_user_value) of the sentinels whose answers we are
+        # waiting for, oldest first. Everything received before the answer
+        # to the last one is discarded
+        self._recovery_sentinels = deque()
+        # The event status enable register value of the user and the one
+        # to set back once the answer to the last sentinel has been seen
+        self._ese_value = None
+        self._ese_restore = None
+        self._random = random.Random()
+        # The slots (and *OPC operation number) that were outstanding when
+        # the recovery cleared the device, they are aborted once the
+        # sentinel is answered. Without a device clear the responses to
+        # the first kept_responses slots still come before the answer
+        self._cleared_slots = []
+        self._cleared_operation = None
+        self._kept_responses = 0
+        self.recoveries = 0
+        self.failed_recoveries = 0
+        self.discarded_messages = 0
+        # See enable_stats()
+        self.stats = None
+        self._stats_framer = None
+        # See set_failure_callback()
+        self.failure_callback = None
+        # How often to re-check transport.incoming_data() while a partial
+        # message is still being received
+        self.incoming_data_poll = 0.01  # Seconds
+        self.transport_lock = Lock()
+        # Notified by message_received() whenever a message is completed
+        self.message_condition = Condition()
+        self.transport.set_message_callback(self.message_received)
+
+    def message_received(self, message):
+        """Hands the message to the oldest outstanding query, called from the
+           transport (possibly from its reader thread) so must never block"""
+        # print " *** Got message '%s' ***" % message
+        with self.message_condition:
+            if self._recovery_sentinels:
+                self._recovery_message(message)
+                self.message_condition.notify_all()
+                return
+            if self.pending_responses:
+                self._fill_slot(message)
+            else:
+                self.unsolicited.append(message)
+            self.message_condition.notify_all()
+
+    def _fill_slot(self, message):
+        """Hands the message to the oldest outstanding query, the caller
+           holds message_condition"""
+        slot = self.pending_responses.popleft()
+        if slot.abandoned:
+            self.discarded_messages += 1
+            return
+        slot.message = message
+        if self.stats is not None or self.response_profile is not None:
+            slot.received_time = time.time()
+            if self._stats_framer is not None:
+                slot.first_byte_time = self._stats_framer.message_started
+
+    def _recovery_message(self, message):
+        """Handles a message received while waiting for the answer to the
+           recovery sentinel (see _resynchronize()), the caller holds
+           message_condition"""
+        values = None
+        if not isinstance(message, bytearray):
+            values = [value.strip() for value in message.split(';')]
+        answered = None
+        if values is not None and len(values) == 3:
+            for index, (markers, reads_user_value) in enumerate(
+                    self._recovery_sentinels):
+                if tuple(values[1:]) == markers:
+                    answered = index
+                    break
+        if answered is None:
+            if self._kept_responses and self.pending_responses:
+                # Answer to a query sent before the sentinel, the device
+                # was not cleared
+                self._kept_responses -= 1
+                self._fill_slot(message)
+                return
+            # Late response to something that timed out
+            self.discarded_messages += 1
+            return
+        if self._recovery_sentinels[answered][1]:
+            try:
+                self._ese_value = int(float(values[0]))
+            except ValueError:
+                pass
+        # The answers to the sentinels before it were lost to device clear
+        for _ in range(answered + 1):
+            self._recovery_sentinels.popleft()
+        if not self._recovery_sentinels:
+            self._ese_restore = self._ese_value or 0
+            self._kept_responses = 0
+        self._abort_cleared()
+
+    def _abort_cleared(self):
+        """Fails the queries and the *OPC operation that were outstanding
+           when the device was cleared, the caller holds message_condition"""
+        for slot in self._cleared_slots:
+            if slot in self.pending_responses:
+                self.pending_responses.remove(slot)
+                slot.error = AbortedError(slot.command, "device cleared by "
+                                                        "the timeout recovery")
+                self.transport.response_abandoned(slot.token)
+        self._cleared_slots = []
+        if (self._cleared_operation == self._operation_number and
+                self._operation_lock.locked()):
+            self._operation_aborted.set()
+        self._cleared_operation = None
+
+    def pop_unsolicited(self):
+        """Pops the oldest unsolicited message, returns None if there are
+           none"""
+        with self.message_condition:
+            if not self.unsolicited:
+                return None
+            return self.unsolicited.popleft()
+
+    def send_command_unchecked(self, command, expect_response=True,
+                               force_wait=None, timeout=None):
+        """Sends the command, waits for all data to complete (and if response
+           is expected for the response to arrive). The response is pushed to
+           message_stack of the calling thread and also returned.
+           The force_wait parameter is in seconds, if we know the device is
+           going to take a while processing the request we can use this to
+           avoid nasty race conditions: commands without a response sleep
+           that long after sending, queries get that much more time before
+           timing out (the wait ends as soon as the response arrives).
+           The timeout (seconds) overrides the one from header_timeout() and
+           the learned one, inside a deadline() block the command also
+           times out at the deadline"""
+        stats = self.stats
+        profile = self.response_profile
+        if profile is not None and self.header_timeout_listed(command):
+            # Their response times depend on the parameters, not learned
+            profile = None
+        deadline = getattr(self._thread_local, 'deadline', None)
+        if deadline is not None and time.time() >= deadline:
+            raise TimeoutError(command, 0)
+        if stats is not None:
+            started = time.time()
+        self.transport_lock.acquire()
+        locked = True
+        try:
+            if force_wait is None:
+                force_wait = self.ask_default_wait
+            slot = None
+            behind_started = False
+            if expect_response:
+                slot = response_slot(command)
+                with self.message_condition:
+                    if len(self.pending_responses) >= self.max_pending_responses:
+                        raise RuntimeError(
+                            "Too many outstanding queries (%d)" %
+                            len(self.pending_responses))
+                    self.pending_responses.append(slot)
+            try:
+                token = self._send(command)
+                if slot is not None:
+                    slot.token = token
+                if stats is not None or profile is not None:
+                    written = time.time()
+                if getattr(self.transport, 'overlapped', False):
+                    # The transport keeps responses in order of the queries,
+                    # let other threads send while we wait for ours
+                    self.transport_lock.release()
+                    locked = False
+                overlapped = not locked
+                learned = False
+                if timeout is None:
+                    timeout = self.header_timeout(command)
+                    if profile is not None and slot is not None:
+                        timeout = profile.timeout(command, timeout)
+                        learned = True
+                if slot is not None:
+                    if force_wait:
+                        timeout += force_wait
+                elif force_wait:
+                    time.sleep(force_wait)
+                if deadline is not None:
+                    timeout = max(0, min(timeout, deadline - time.time()))
+                timeout_end = time.time() + timeout
+                with self.message_condition:
+                    while True:
+                        waiting_response = slot is not None and slot.message is None
+                        if not waiting_response and not self.transport.incoming_data():
+                            break
+                        was_behind_started = behind_started
+                        behind_started = (waiting_response and not overlapped and
+                                          self._behind_started_query(slot))
+                        if behind_started or was_behind_started:
+                            # The device answers us only after the query
+                            # started with start(), our time starts once
+                            # that one is answered (or given up on)
+                            timeout_end = time.time() + timeout
+                            if deadline is not None:
+                                timeout_end = min(timeout_end, deadline)
+                        remaining = timeout_end - time.time()
+                        if remaining <= 0:
+                            if stats is not None:
+                                stats.record_timeout(
+                                    command, self._bytes_sent(command))
+                            if learned:
+                                profile.record_timeout(command)
+                            raise TimeoutError(command, timeout)
+                        if not waiting_response:
+                            # Tail of some message is still coming in, we get
+                            # no notification when it's drained so re-check
+                            # soon
+                            remaining = min(remaining, self.incoming_data_poll)
+                        self.message_condition.wait(remaining)
+            finally:
+                if slot is not None:
+                    # If we gave up waiting a late response will go to the
+                    # next query (or the unsolicited channel if there is
+                    # none) unless the transport or the timeout recovery
+                    # drops it
+                    with self.message_condition:
+                        if slot not in self.pending_responses:
+                            pass
+                        elif behind_started:
+                            # Timed out (at the deadline) before the device
+                            # got to it, it answers after the started query
+                            slot.abandoned = True
+                        else:
+                            self.pending_responses.remove(slot)
+                            self.transport.response_abandoned(slot.token)
+        except TimeoutError:
+            # Overlapped transports match the responses to the queries and
+            # a query waiting behind a started one is not late
+            if self.timeout_recovery and locked and not behind_started:
+                self._recover()
+            raise
+        finally:
+            if locked:
+                self.transport_lock.release()
+        if stats is not None:
+            self._record_stats(stats, command, slot, started, written)
+        if slot is None:
+            return None
+        if profile is not None and slot.received_time is not None:
+            # The response may have arrived before we took the time
+            profile.record(command, max(0.0, slot.received_time - written))
+        self.message_stack.append(slot.message)
+        return slot.message
+
+    def _behind_started_query(self, slot):
+        """Tells whether a query started with start() is still waiting for
+           its response ahead of slot, the caller holds message_condition"""
+        for other in self.pending_responses:
+            if other is slot:
+                return False
+            if other.started:
+                return True
+        return False
+
+    def _send(self, command):
+        """Hands the command to the transport (through the compiler if
+           enabled), the caller holds transport_lock"""
+        if self._ese_restore is not None:
+            self._send_ese_restore()
+        return super(scpi, self)._send(command)
+
+    def _send_ese_restore(self):
+        """Sets the event status enable register back to the user's value
+           after a recovery, the caller holds transport_lock"""
+        with self.message_condition:
+            value = self._ese_restore
+            self._ese_restore = None
+        if value is not None:
+            self._send("*ESE %d" % value)
+
+    def start(self, command, pop=None, timeout=None):
+        """Starts a long running command without waiting for it to
+           complete, returns a concurrent.futures.Future. For queries the
+           future resolves to the response parsed by pop (one of the pop_*
+           methods, pop_str by default). Other commands are sent with
+           ";*OPC" appended and resolve to None once polling *ESR? (see
+           operation_poll_interval) finds the operation complete bit set.
+           Errors are checked when the command completes, the future raises
+           CommandError or TimeoutError (after timeout seconds,
+           header_timeout() of the command by default). Other threads can
+           use the device while the command runs, on transports that are
+           not overlapped their queries are answered after a started query
+           and their timeouts start once it is. Only one *OPC operation
+           can be in progress at a time, starting another one waits for the
+           previous one to complete. The timeout recovery (see
+           set_timeout_recovery()) clears the device, the commands in
+           progress then raise AbortedError"""
+        if timeout is None:
+            timeout = self.header_timeout(command)
+        if pop is None:
+            pop = self.pop_str
+        future = Future()
+        future.set_running_or_notify_cancel()
+        # Queries can have parameters, like "READ:BER:TRES? 100"
+        if any(part.strip().split(' ', 1)[0].endswith('?')
+               for part in command.split(';')):
+            slot = self._start_query(command)
+            waiter = Thread(target=self._wait_query,
+                            args=(future, command, slot, pop, timeout))
+        else:
+            self._operation_lock.acquire()
+            self._operation_aborted.clear()
+            self._operation_number += 1
+            try:
+                # A stale operation complete bit would end the wait at once
+                self.take_esr_bits(0x01)
+                self.send_command_unchecked(command + ";*OPC", False)
+            except Exception:
+                self._operation_lock.release()
+                raise
+            waiter = Thread(target=self._wait_operation,
+                            args=(future, command, timeout))
+        waiter.setDaemon(1)
+        waiter.start()
+        return future
+
+    def set_failure_callback(self, callback):
+        """Sets the function called with (command, error) when a command
+           sent with send_command(), a query sent with the ask_* methods
+           or a command started with start() fails with CommandError or
+           TimeoutError, before the error is raised. None removes it"""
+        self.failure_callback = callback
+
+    def _command_failed(self, command, error):
+        callback = self.failure_callback
+        if callback is not None:
+            callback(command, error)
+
+    def _start_failed(self, future, command, error):
+        """Fails the future of the command started with start(), the
+           failure callback runs before anyone waiting for it wakes up"""
+        if isinstance(error, (CommandError, TimeoutError)):
+            self._command_failed(command, error)
+        future.set_exception(error)
+
+    def _start_query(self, command):
+        """Sends the query, returns the slot its response will go to"""
+        slot = response_slot(command)
+        slot.started = True
+        with self.transport_lock:
+            with self.message_condition:
+                if len(self.pending_responses) >= self.max_pending_responses:
+                    raise RuntimeError("Too many outstanding queries (%d)" %
+                                       len(self.pending_responses))
+                self.pending_responses.append(slot)
+            try:
+                slot.token = self._send(command)
+            except Exception:
+                with self.message_condition:
+                    if slot in self.pending_responses:
+                        self.pending_responses.remove(slot)
+                raise
+        return slot
+
+    def _wait_query(self, future, command, slot, pop, timeout):
+        """Waits (in a thread of its own) for the response of a query
+           started with start()"""
+        timeout_end = time.time() + timeout
+        with self.message_condition:
+            while slot.message is None and slot.error is None:
+                remaining = timeout_end - time.time()
+                if remaining <= 0:
+                    if slot in self.pending_responses:
+                        self.pending_responses.remove(slot)
+                        self.transport.response_abandoned(slot.token)
+                        # The queries behind it start their timeouts now
+                        self.message_condition.notify_all()
+                    break
+                self.message_condition.wait(remaining)
+        if slot.error is not None:
+            future.set_exception(slot.error)
+            return
+        try:
+            self.check_error(command)
+            if slot.message is None:
+                raise TimeoutError(command, timeout)
+            self.message_stack.append(slot.message)
+            future.set_result(pop())
+        except Exception as e:
+            self._start_failed(future, command, e)
+
+    def _wait_operation(self, future, command, timeout):
+        """Polls (in a thread of its own) for the completion of an *OPC
+           operation started with start()"""
+        started = time.time()
+        timeout_end = started + timeout
+        header = command.split(' ', 1)[0]
+        interval = self.operation_poll_interval
+        delay = max(interval, 0.9 * self._operation_durations.get(header, 0))
+        try:
+            while True:
+                self._operation_aborted.wait(
+                    max(0, min(delay, timeout_end - time.time())))
+                # A device busy with the operation may not answer the poll
+                # before it completes
+                try:
+                    with self.deadline(max(timeout_end - time.time(),
+                                           self.operation_poll_interval)):
+                        done = self.take_esr_bits(0x01)
+                except TimeoutError:
+                    raise TimeoutError(command, timeout)
+                if self._operation_aborted.is_set():
+                    raise AbortedError(command, "device cleared by the "
+                                                "timeout recovery")
+                if done:
+                    break
+                if time.time() >= timeout_end:
+                    self.check_error(command)
+                    raise TimeoutError(command, timeout)
+                interval = min(interval * 2, self.operation_max_poll_interval)
+                delay = interval
+            self._operation_durations[header] = time.time() - started
+            self.check_error(command)
+            future.set_result(None)
+        except Exception as e:
+            self._start_failed(future, command, e)
+        finally:
+            self._operation_lock.release()
+
+    def take_esr_bits(self, mask, timeout=None):
+        """Reads the event status register (*ESR?) and returns the bits in
+           mask, reading clears the register on the device so the other
+           bits are kept until somebody takes them. Use this instead of
+           asking *ESR? directly if start() or the "esr" error check are
+           used"""
+        self.send_command_unchecked("*ESR?", True, None, timeout)
+        value = int(float(self.message_stack.pop()))
+        with self._esr_lock:
+            self._esr_bits |= value
+            taken = self._esr_bits & mask
+            self._esr_bits &= ~mask
+        return taken
+
+    def recover(self):
+        """Brings the responses back in step with the queries (see
+           set_timeout_recovery()), returns True if that succeeded"""
+        with self.transport_lock:
+            return self._recover()
+
+    def _recover(self):
+        """recover() for callers holding transport_lock"""
+        try:
+            recovered = self._resynchronize()
+        except Exception:
+            # The recovery must not hide the timeout that caused it
+            recovered = False
+        if recovered:
+            self.recoveries += 1
+        else:
+            self.failed_recoveries += 1
+        return recovered
+
+    def _resynchronize(self):
+        markers = self._random.sample(range(1, 256), 2)
+        recovery_end = time.time() + self.recovery_timeout
+        deadline = getattr(self._thread_local, 'deadline', None)
+        if deadline is not None:
+            # The late messages are discarded after we stop waiting too
+            recovery_end = min(recovery_end, deadline)
+        with self.message_condition:
+            # Messages nobody asked for are late responses too
+            self.discarded_messages += len(self.unsolicited)
+            self.unsolicited.clear()
+            # Unless an earlier sentinel is still unanswered the register
+            # has the user's value
+            sentinel = (tuple("%d" % marker for marker in markers),
+                        not self._recovery_sentinels)
+            self._recovery_sentinels.append(sentinel)
+            # Until the device is cleared the outstanding queries are still
+            # answered before the sentinel
+            self._kept_responses = len(self.pending_responses)
+            self.message_condition.notify_all()
+        try:
+            try:
+                cleared = self.transport.abort_command()
+            except NotImplementedError:
+                cleared = False
+            with self.message_condition:
+                if cleared:
+                    # The device clear aborts the commands started with
+                    # start(), their responses are discarded with the other
+                    # late ones. They fail once the sentinel is answered
+                    self._cleared_slots.extend(self.pending_responses)
+                    self._kept_responses = 0
+                    if self._operation_lock.locked():
+                        self._cleared_operation = self._operation_number
+            self._send(RECOVERY_SENTINEL % tuple(markers))
+        except Exception:
+            with self.message_condition:
+                self._recovery_sentinels.remove(sentinel)
+                if not self._recovery_sentinels:
+                    self._cleared_slots = []
+                    self._cleared_operation = None
+                    self._kept_responses = 0
+            raise
+        with self.message_condition:
+            while sentinel in self._recovery_sentinels:
+                remaining = recovery_end - time.time()
+                if remaining <= 0:
+                    # Messages keep being discarded until the answer to the
+                    # sentinel arrives, so a late one can not go to the
+                    # next query
+                    return False
+                self.message_condition.wait(remaining)
+        self._send_ese_restore()
+        return True
+
+    def _bytes_sent(self, command):
+        """Number of bytes sending the command takes (for statistics)"""
+        if self.compiler is not None:
+            if self.compiler.line_terminator is not None:
+                return len(self.compiler.encode(command))
+            command = self.compiler.compile(command)
+        terminator = getattr(self.transport, 'line_terminator', None) or "\n"
+        return len(command) + len(terminator)
+
+    def _record_stats(self, stats, command, slot, started, written):
+        first_byte = None
+        response = None
+        received = 0
+        if slot is not None:
+            # A response that arrived while the stats were off (toggled
+            # while the query was in flight) has no time taken, skip it
+            if slot.received_time is not None:
+                response = slot.received_time - started
+            if slot.first_byte_time is not None:
+                # The response may have started arriving before we got to
+                # take the start time
+                first_byte = max(0.0, slot.first_byte_time - started)
+            received = len(slot.message)
+            if not isinstance(slot.message, bytearray):
+                received += len(getattr(self.transport, 'line_terminator',
+                                        None) or "\n")
+        stats.record_command(command, written - started, first_byte,
+                             response, self._bytes_sent(command), received)
+
+    def send_command(self, command, expect_response=False, force_wait=None,
+                     timeout=None):
+        """Sends the command and makes sure it did not trigger errors,
+           in case of timeout checks if there was another underlying error
+           and raises that instead. The force_wait parameter is in seconds,
+           if we know the device is going to take a while processing the
+           request we can use this to avoid nasty race conditions. The
+           timeout (seconds) overrides header_timeout() for the command and
+           its error check"""
+        try:
+            self._send_command(command, expect_response, force_wait, timeout)
+        except (CommandError, TimeoutError) as e:
+            self._command_failed(command, e)
+            raise
+
+    def _send_command(self, command, expect_response, force_wait, timeout):
+        """send_command() without the failure callback"""
+        deferred = getattr(self._thread_local, 'deferred_commands', None)
+        if deferred is not None:
+            try:
+                self.send_command_unchecked(command, expect_response,
+                                            force_wait, timeout)
+            except TimeoutError:
+                # Raise the underlying error instead if there is one
+                self._check_error_after_timeout(command, timeout)
+                raise
+            deferred.append(command)
+            return
+        re_raise = None
+        try:
+            # PONDER: auto-add ";*WAI" ??
+            self.send_command_unchecked(command, expect_response, force_wait,
+                                        timeout)
+        except TimeoutError as e:
+            re_raise = e
+        finally:
+            if re_raise:
+                self._check_error_after_timeout(command, timeout)
+            elif self.stats is None:
+                self.check_error(command, timeout)
+            else:
+                self._timed_check_error(command, timeout)
+            if re_raise:
+                raise re_raise
+        if self.parameter_cache is not None and not expect_response:
+            self.parameter_cache.command_succeeded(command)
+
+    def check_error(self, command_was, timeout=None):
+        """Checks the last error code and raises CommandError if the code is
+           not 0 ("No error"), see set_error_check() for how. The device
+           answers once it is done with command_was so the check times out
+           like it (or after timeout seconds)"""
+        if timeout is None:
+            timeout = self.header_timeout(command_was)
+        if self.error_check_method != 'queue':
+            errors = self.pending_errors(timeout)
+            if errors:
+                raise CommandError(command_was, *errors[0])
+            return 0
+        self.send_command_unchecked("SYST:ERR?", True, None, timeout)
+        code, errstr = self.parse_error(self.message_stack.pop())
+        if code != 0:
+            raise CommandError(command_was, code, errstr)
+        return code
+
+    def pending_errors(self, timeout=None):
+        """Returns list of (code, errstr) tuples of the errors in the queue
+           (emptying it), with the status register fast path the queue is
+           only read if the register says there are errors. The timeout is
+           for the first query"""
+        if self.error_check_method == 'queue':
+            return self.drain_errors(timeout)
+        query, error_bits = STATUS_QUERIES[self.error_check_method]
+        if self.error_check_method == 'esr':
+            status = self.take_esr_bits(error_bits, timeout)
+        else:
+            self.send_command_unchecked(query, True, None, timeout)
+            status = int(float(self.message_stack.pop())) & error_bits
+        if not status:
+            return []
+        errors = self.drain_errors()
+        if not errors and self.error_check_method == 'esr':
+            # Somebody else read the queue, all we know is the error class
+            errors = [(code, errstr) for bit, code, errstr in ESR_ERRORS
+                      if status & bit][:1]
+        return errors
+
+    def _timed_check_error(self, command_was, timeout=None):
+        """check_error() that records the time it took in the statistics"""
+        stats = self.stats
+        check_started = time.time()
+        try:
+            return self.check_error(command_was, timeout)
+        finally:
+            if stats is not None:
+                stats.record_error_check(command_was,
+                                         time.time() - check_started)
+
+    def _check_error_after_timeout(self, command_was, timeout=None):
+        """Raises the error that caused the timeout of command_was if there
+           is one, returns if there is none or the check timed out too"""
+        try:
+            self.check_error(command_was, timeout)
+        except TimeoutError:
+            pass
+
+    def drain_errors(self, timeout=None):
+        """Reads the error queue until "No error" (or max_error_queue
+           entries), returns list of (code, errstr) tuples, oldest first.
+           The timeout is for the first query"""
+        errors = []
+        while len(errors) < self.max_error_queue:
+            self.send_command_unchecked("SYST:ERR?", True, None, timeout)
+            timeout = None
+            code, errstr = self.parse_error(self.message_stack.pop())
+            if code == 0:
+                break
+            errors.append((code, errstr))
+        return errors
+
+    @contextmanager
+    def deferred_errors(self, pinpoint=False):
+        """Context manager, send_command calls (from this thread) inside the
+           block skip the per-command error check. The error queue is read
+           once when the block exits and DeferredCommandError is raised if
+           any of the commands failed, errors are mapped to commands where
+           the error message makes it possible. With pinpoint=True
+           the commands are re-sent one by one with error checking to find
+           the culprit, so only use it for commands that are safe to repeat.
+           When the block raises, the queue is read all the same and the
+           errors are kept in the exception's deferred_errors attribute.
+           Nested blocks are merged into the outermost one."""
+        if getattr(self._thread_local, 'deferred_commands', None) is not None:
+            yield
+            return
+        commands = []
+        self._thread_local.deferred_commands = commands
+        try:
+            yield
+        except Exception as exc:
+            self._thread_local.deferred_commands = None
+            # Left in the queue the errors would be blamed on the next
+            # checked command
+            exc.deferred_errors = []
+            if commands:
+                try:
+                    exc.deferred_errors = [
+                        (self._guess_error_command(errstr, commands) or ';'.join(commands), code, errstr)
+                        for code, errstr in self.pending_errors()]
+                except Exception:
+                    pass
+            raise
+        finally:
+            self._thread_local.deferred_commands = None
+        if not commands:
+            return
+        errors = self.pending_errors()
+        if not errors:
+            return
+        if pinpoint:
+            # Raises CommandError for the first failing command
+            for command in commands:
+                self.send_command(command)
+        raise DeferredCommandError([
+            (self._guess_error_command(errstr, commands) or ';'.join(commands),
+             code, errstr) for code, errstr in errors])
+
+    @contextmanager
+    def deadline(self, seconds):
+        """Context manager, the commands sent (from this thread) inside the
+           block, their error checks included, time out at the latest when
+           seconds have passed from entering the block, later commands time
+           out at once. Use it to bound the time of a sequence of commands,
+           nested blocks keep the earlier deadline. None means no deadline"""
+        previous = getattr(self._thread_local, 'deadline', None)
+        if seconds is None:
+            yield
+            return
+        deadline = time.time() + seconds
+        if previous is not None:
+            deadline = min(deadline, previous)
+        self._thread_local.deadline = deadline
+        try:
+            yield
+        finally:
+            self._thread_local.deadline = previous
+
+    def enable_stats(self, enabled=True):
+        """Starts (or stops) collecting per-header statistics of the
+           commands sent: write time, time to first byte of the response
+           (transports with a message framer only), time to the complete
+           response, error check time, bytes sent and received and timeouts.
+           Read them with stats.as_dict(), clear with stats.reset(). Costs
+           nothing while disabled"""
+        framer = getattr(self.transport, 'framer', None)
+        if framer is not None:
+            framer.timestamps = enabled
+        if not enabled:
+            self.stats = None
+            self._stats_framer = None
+            return
+        self._stats_framer = framer
+        self.stats = scpi_stats()
+
+    def set_timeout_recovery(self, enabled=True, timeout=None):
+        """Enables (or disables) recovering from timeouts: a late response
+           would otherwise go to the next query and every answer after that
+           would be one behind. After a timeout the device is sent device
+           clear (see abort_command()) and a sentinel query that sets the
+           event status enable register (*ESE) to two random marker values
+           in turn and asks them back. Everything received before the
+           answer with exactly the old value and the two markers is
+           discarded, and the register is restored. The recovery stops
+           waiting after timeout seconds (recovery_timeout, or at the
+           deadline() of the thread) but the messages are discarded until
+           the answer arrives. If the transport did send device clear
+           (abort_command() returned True) the commands started with
+           start() were aborted by it, their futures raise AbortedError
+           once the sentinel is answered. Otherwise they keep running and
+           get their responses. A query that times out (at the deadline)
+           while waiting behind a started query is not recovered, its
+           response is discarded when it arrives. Counted in recoveries,
+           failed_recoveries and discarded_messages. Overlapped transports
+           match the responses to the queries themselves so they do not
+           need it, and messages nobody asked for are lost in the
+           recovery"""
+        self.timeout_recovery = enabled
+        if timeout is not None:
+            self.recovery_timeout = timeout
+
+    def _ask_no_pop(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), but does NOT pop the value
            The force_wait parameter is in seconds (or none to use instance
            default), if we know the device is going to take a while processing
-           the request we can use this to avoid nasty race conditions"""
+           the request we can use this to avoid nasty race conditions. The
+           timeout (seconds) overrides header_timeout() for the command"""
         # TODO: Maybe check error opnly if we do not get a response ??
-        re_raise = None
+        if self.parameter_cache is not None:
+            cached = self.parameter_cache.lookup(command)
+            if cached is not None:
+                self.message_stack.append(cached)
+                return
         try:
-            self.send_command_unchecked(command, True, force_wait)
+            self.send_command_unchecked(command, True, force_wait, timeout)
         except TimeoutError as e:
-            # This will raise the correct error in case we got a timeout
-            # waiting for the input
-            self.check_error(command)
+            try:
+                # This will raise the correct error in case we got a timeout
+                # waiting for the input
+                self._check_error_after_timeout(command, timeout)
+            except CommandError as error:
+                self._command_failed(command, error)
+                raise
+            self._command_failed(command, e)
             # If there was not error, re-raise the timeout
             raise e
             # PONDER: Before returning check if there are leftover messages
             # in the stack, that would not be a good thing...
+        if self.parameter_cache is not None:
+            self.parameter_cache.store(command, self.message_stack[-1])
 
-    def ask_str(self, command, force_wait=None):
+    def ask_str(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), returning reply as a string
            The force_wait parameter is in seconds (or none to use instance
            default), if we know the device is going to take a while processing
-           the request we can use this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           the request we can use this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_str()
 
-    def ask_decimal(self, command, force_wait=None):
+    def ask_decimal(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as Decimal. The force_wait parameter is in seconds
            (or none to use instance default), if we know the device is
             going to take a while processing the request we can use this to
-            avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+            avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_decimal()
 
-    def ask_int(self, command, force_wait=None):
+    def ask_int(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as int. The force_wait parameter is in seconds (or
            none to use instance default), if we know the device is going to
            take a while processing the request we can use this to avoid
-           nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_int()
 
-    def ask_int_onoff(self, command, force_wait=None):
+    def ask_int_onoff(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as int or an on/off value. The force_wait parameter
            is in seconds (or none to use instance default), if we know
            the device is going to take a while processing the request we
-           can use this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           can use this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_int_onoff()
 
-    def ask_float(self, command, force_wait=None):
+    def ask_float(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as float. The force_wait parameter is in seconds
            (or none to use instance default), if we know the device is
            going to take a while processing the request we can use this to
-           avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_float()
 
-    def ask_float_onoff(self, command, force_wait=None):
+    def ask_float_onoff(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as float. The force_wait parameter is in seconds
            (or none to use instance default), if we know the device is going
            to take a while processing the request we can use this to avoid
-           nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_float_onoff()
 
-    def ask_bool(self, command, force_wait=None):
+    def ask_bool(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as float. The force_wait parameter is in seconds (or
            none to use instance default), if we know the device is going to
            take a while processing the request we can use this to avoid
-           nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_bool()
 
-    def ask_str_list(self, command, force_wait=None):
+    def ask_str_list(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), returning reply as a
            list of string values. The force_wait parameter is in seconds (or
            none to use instance default), if we know the device is going to
            take a while processing the request we can use this to avoid
-           nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_str_list()
 
-    def ask_decimal_list(self, command, force_wait=None):
+    def ask_decimal_list(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as a list of Decimal values. The force_wait
            parameter is in seconds (or none to use instance default),
            if we know the device is going to take a while processing
-           the request we can use this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           the request we can use this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_decimal_list()
 
-    def ask_int_list(self, command, force_wait=None):
+    def ask_int_list(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as a list of int values. The force_wait parameter
            is in seconds (or none to use instance default), if we know the
            device is going to take a while processing the request we can use
-           this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_int_list()
 
-    def ask_float_list(self, command, force_wait=None):
+    def ask_float_list(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as a list of float values. The force_wait parameter
            is in seconds (or none to use instance default), if we know the
            device is going to take a while processing the request we can use
-           this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_float_list()
 
-    def ask_bool_list(self, command, force_wait=None):
+    def ask_bool_list(self, command, force_wait=None, timeout=None):
         """Sends the command (checking for errors), then pops and parses
            the last line as a list of float values. The force_wait parameter
            is in seconds (or none to use instance default), if we know the
            device is going to take a while processing the request we can use
-           this to avoid nasty race conditions"""
-        self._ask_no_pop(command, force_wait)
+           this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
         return self.pop_bool_list()
 
-    def abort_command(self):
-        """Shortcut to the transports abort_command call"""
-        self.transport.abort_command()
+    def ask_block(self, command, force_wait=None, timeout=None):
+        """Sends the command (checking for errors), returning the binary block
+           reply as a memoryview. The force_wait parameter is in seconds (or
+           none to use instance default), if we know the device is going to
+           take a while processing the request we can use this to avoid
+           nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_block()
+
+    def ask_binary_list(self, command, typecode='d', big_endian=True,
+                        force_wait=None, timeout=None):
+        """Sends the command (checking for errors), then pops and parses
+           the binary block reply as an array of values, see
+           pop_binary_list() for typecode and big_endian. The force_wait
+           parameter is in seconds (or none to use instance default), if we
+           know the device is going to take a while processing the request we
+           can use this to avoid nasty race conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        self._ask_no_pop(command, force_wait, timeout)
+        return self.pop_binary_list(typecode, big_endian)
+
+    def ask_many(self, queries, force_wait=None, timeout=None):
+        """Sends all the queries on a single line (checking for errors once
+           at the end) and returns the list of parsed values. The queries is
+           a list of (command, parser) tuples where parser is one of int,
+           float, str, bool, decimal.Decimal or any callable taking the raw
+           string. The force_wait parameter is in seconds (or none to use
+           instance default), if we know the device is going to take a while
+           processing the request we can use this to avoid nasty race
+           conditions.
+           Pass timeout (seconds) to override header_timeout()"""
+        command = self._join_queries(queries)
+        self._ask_no_pop(command, force_wait, timeout)
+        self.check_error(command, timeout)
+        return self._pop_many(queries, command)
 
 
 class scpi_device(object):
     """Implements nicer wrapper methods for the raw commands from the
        generic SCPI command set"""
 
+    # Settings cached by enable_parameter_cache(), short form header prefixes.
+    # Not OUTP:, the protection circuits turn the output off by themselves
+    cacheable_prefixes = ("SOUR:", "SENS:CURR:RANG", "FORM")
+    # Commands (in addition to *RST etc) that change many settings at once
+    cache_invalidating_headers = ()
+    # How send_command() checks for errors, see scpi.set_error_check()
+    error_check_method = 'queue'
+    # Timeouts of the commands by header, see scpi.set_header_timeouts()
+    header_timeouts = ()
+    # Resynchronize the responses after timeouts, see
+    # scpi.set_timeout_recovery()
+    timeout_recovery = False
+
     def __init__(self, transport, *args, **kwargs):
         """Initializes a device for the given transport"""
         super(scpi_device, self).__init__(*args, **kwargs)
         self.scpi = scpi(transport)
+        self.scpi.set_error_check(self.error_check_method)
+        self.scpi.set_header_timeouts(self.header_timeouts)
+        self.scpi.set_timeout_recovery(self.timeout_recovery)
         # always reset to known status on init
         self.reset()
 
@@ -316,6 +1535,27 @@ class scpi_device(object):
         """Shuts down any background threads that might be active"""
         self.scpi.quit()
 
+    def enable_parameter_cache(self, enabled=True):
+        """Answers the setting queries of this device from a cache after the
+           first time (see scpi.set_parameter_cache()), use only if nobody
+           else changes the settings (front panel, other processes)"""
+        self.scpi.set_parameter_cache(enabled, self.cacheable_prefixes,
+                                      self.cache_invalidating_headers)
+
+    def enable_response_learning(self, enabled=True, directory=None):
+        """Learns the response times of the queries (see
+           scpi.enable_response_learning()), with directory the profile is
+           kept there in a JSON file named after the manufacturer and model
+           (from *IDN?) so it is shared by all units of the model. Only the
+           headers in header_timeouts may have parameter dependent response
+           times"""
+        path = None
+        if enabled and directory is not None:
+            manufacturer, model = self.identify()[:2]
+            name = re.sub(r"[^\w.-]+", "_", "%s_%s" % (manufacturer, model))
+            path = os.path.join(directory, name + ".json")
+        self.scpi.enable_response_learning(enabled, path)
+
     def reset(self):
         """Resets the device to known state (with *RST) and clears the
            error log"""
@@ -329,12 +1569,12 @@ class scpi_device(object):
     def measure_voltage(self, extra_params=""):
         """Returns the measured (scalar) actual output voltage (in volts),
            pass extra_params string to append to the command (like ":ACDC")"""
-        return self.scpi.ask_number("MEAS:SCAL:VOLT%s?" % extra_params)
+        return self.scpi.ask_float("MEAS:SCAL:VOLT%s?" % extra_params)
 
     def measure_current(self, extra_params=""):
         """Returns the measured (scalar) actual output current (in amps),
            pass extra_params string to append to the command (like ":ACDC")"""
-        return self.scpi.ask_number("MEAS:SCAL:CURR%s?" % extra_params)
+        return self.scpi.ask_float("MEAS:SCAL:CURR%s?" % extra_params)
 
     def set_measure_current_max(self, amps):
         """Sets the upper bound (in amps) of current to measure, on some
@@ -344,7 +1584,7 @@ class scpi_device(object):
     def query_measure_current_max(self):
         """Returns the upper bound (in amps) of current to measure, this is
            not neccessarily same number as set with set_measure_current_max"""
-        return self.scpi.ask_number("SENS:CURR:RANG?")
+        return self.scpi.ask_float("SENS:CURR:RANG?")
 
     def set_voltage(self, millivolts, extra_params=""):
         """Sets the desired output voltage (but does not auto-enable
@@ -356,7 +1596,7 @@ class scpi_device(object):
     def query_voltage(self, extra_params=""):
         """Returns the set output voltage (in volts), pass extra_params
            string to append to the command (like ":PROT")"""
-        return self.scpi.ask_number("SOUR:VOLT%s?" % extra_params)
+        return self.scpi.ask_float("SOUR:VOLT%s?" % extra_params)
 
     def set_current(self, milliamps, extra_params=""):
         """Sets the desired output current (but does not auto-enable
@@ -368,7 +1608,7 @@ class scpi_device(object):
     def query_current(self, extra_params=""):
         """Returns the set output current (in amps), pass extra_params
            string to append to the command (like ":TRIG")"""
-        return self.scpi.ask_number("SOUR:CURR%s?" % extra_params)
+        return self.scpi.ask_float("SOUR:CURR%s?" % extra_params)
 
     def set_output(self, state):
         """Enables/disables output"""
@@ -378,6 +1618,18 @@ class scpi_device(object):
         """Returns the output state"""
         return self.scpi.ask_bool("OUTP:STAT?", True)
 
+    def set_data_format(self, data_format, byte_order=None):
+        """Sets the format used for array data, for example "ASCii" or
+           "REAL,64" (use ask_binary_list() to read the latter), byte_order
+           is "NORMal" (big-endian) or "SWAPped" """
+        self.scpi.send_command("FORM %s" % data_format, False)
+        if byte_order is not None:
+            self.scpi.send_command("FORM:BORD %s" % byte_order, False)
+
+    def query_data_format(self):
+        """Returns the format used for array data"""
+        return self.scpi.ask_str("FORM?")
+
     def identify(self):
         """Returns the identification data, standard order is Manufacturer,
            Model no, Serial no (or 0), Firmware version"""
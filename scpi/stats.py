@@ -0,0 +1,143 @@
+"""Per-command timing statistics, see scpi.enable_stats()
+
+   Times are collected into fixed-bucket histograms so recording is cheap
+   and memory use does not grow with the number of commands."""
+import bisect
+from threading import Lock
+
+# Bucket upper bounds in seconds, 1us to 100s with ten buckets per decade
+BUCKET_BOUNDS = [1e-6 * 10 ** (i / 10.0) for i in range(81)]
+
+
+class histogram(object):
+    """Fixed-bucket histogram of durations (seconds)"""
+
+    def __init__(self):
+        # The last bucket is for values over the largest bound
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket the percentile falls in
+           (capped to the largest value seen), None if there is no data"""
+        if not self.count:
+            return None
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if bucket_count and seen >= wanted:
+                if index == len(BUCKET_BOUNDS):
+                    return self.max
+                return min(BUCKET_BOUNDS[index], self.max)
+        return self.max
+
+    def as_dict(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class header_stats(object):
+    """Statistics of the commands with one header"""
+
+    def __init__(self):
+        # Sending the command to the transport
+        self.write = histogram()
+        # From starting to send to the first byte of the response (when the
+        # transport can tell)
+        self.first_byte = histogram()
+        # From starting to send to the complete response
+        self.response = histogram()
+        # Checking the error queue after the command
+        self.error_check = histogram()
+        self.commands = 0
+        self.timeouts = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def as_dict(self):
+        return {
+            'commands': self.commands,
+            'timeouts': self.timeouts,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'write': self.write.as_dict(),
+            'first_byte': self.first_byte.as_dict(),
+            'response': self.response.as_dict(),
+            'error_check': self.error_check.as_dict(),
+        }
+
+
+class scpi_stats(object):
+    """Statistics of all the commands sent, keyed by header (the command
+       up to the first space)"""
+
+    def __init__(self):
+        self.headers = {}
+        self.lock = Lock()
+
+    def _get(self, command):
+        header = command.split(' ', 1)[0]
+        stats = self.headers.get(header)
+        if stats is None:
+            stats = header_stats()
+            self.headers[header] = stats
+        return stats
+
+    def record_command(self, command, write_time, first_byte_time,
+                       response_time, bytes_sent, bytes_received):
+        """Records a completed command, times in seconds (None if not
+           known)"""
+        with self.lock:
+            stats = self._get(command)
+            stats.commands += 1
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.write.add(write_time)
+            if first_byte_time is not None:
+                stats.first_byte.add(first_byte_time)
+            if response_time is not None:
+                stats.response.add(response_time)
+
+    def record_timeout(self, command, bytes_sent):
+        with self.lock:
+            stats = self._get(command)
+            stats.commands += 1
+            stats.timeouts += 1
+            stats.bytes_sent += bytes_sent
+
+    def record_error_check(self, command, seconds):
+        with self.lock:
+            self._get(command).error_check.add(seconds)
+
+    def reset(self):
+        """Throws away everything recorded so far"""
+        with self.lock:
+            self.headers = {}
+
+    def as_dict(self):
+        """Returns {header: {...}} of everything recorded"""
+        with self.lock:
+            return dict((header, stats.as_dict())
+                        for header, stats in self.headers.items())
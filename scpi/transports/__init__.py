@@ -1,3 +1,8 @@
 """Transport layers for the SCPI module"""
 from .baseclass import transports_base as base
 from .rs232 import transports_rs232 as rs232
+from .aio_rs232 import transports_aio_rs232 as aio_rs232
+from .tcp import transports_tcp as tcp
+from .hislip import transports_hislip as hislip
+from .prologix import transports_prologix as prologix, prologix_adapter
+from .broker import transports_broker as broker
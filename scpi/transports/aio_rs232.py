@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Serial port transport layer for asyncio, the port is watched by the event loop instead of a reader thread"""
+import asyncio
+from .baseclass import transports_base
+from .framer import message_framer
+
+
+class transports_aio_rs232(transports_base):
+    def __init__(self, port, loop=None, *args, **kwargs):
+        """Initializes a serial transport, requires open (non-blocking, timeout=0) serial port as argument,
+           create it in the running loop (or pass loop)"""
+        super(transports_aio_rs232, self).__init__(*args, **kwargs)
+        self.line_terminator = "\r\n"
+        self.serial_port = port
+        self.loop = loop or asyncio.get_running_loop()
+        self.framer = message_framer(self._message_framed, self.line_terminator)
+        if self.serial_port.rtscts:
+            self.serial_port.setRTS(True)
+        self.loop.add_reader(self.serial_port.fileno(), self._read_ready)
+
+    def _read_ready(self):
+        """Called by the event loop when the port has data"""
+        try:
+            data = self.serial_port.read(self.serial_port.inWaiting() or 1)
+        except IOError as e:
+            print("Got exception %s" % e)
+            self.loop.remove_reader(self.serial_port.fileno())
+            return
+        if data:
+            self.framer.feed(data)
+
+    def _message_framed(self, message):
+        """Passes complete messages from the framer to the message callback"""
+        self.message_received(message)
+
+    def abort_command(self):
+        """Uses the break-command to issue "Device clear", see transports_rs232.abort_command"""
+        self.serial_port.sendBreak()
+        return True
+
+    def quit(self):
+        """Stops watching the port and closes it"""
+        self.loop.remove_reader(self.serial_port.fileno())
+        self.serial_port.close()
+
+    def incoming_data(self):
+        """Check whether we still have inbound data"""
+        return bool(self.serial_port.inWaiting())
+
+    def send_command(self, command):
+        """Adds the line terminator and writes the command out"""
+        send_str = command + self.line_terminator
+        self.serial_port.write(send_str.encode('utf-8'))
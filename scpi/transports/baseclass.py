@@ -10,6 +10,10 @@ All transports must define certain basic methods (check all the raise NotImpleme
 
 
 class transports_base(object):
+    # Overlapped transports keep the responses in order of the queries, the scpi class then lets several queries
+    # be in flight at once instead of holding the transport lock until the response arrives
+    overlapped = False
+
     def __init__(self):
         """Initializes a transport"""
         pass
@@ -22,9 +26,13 @@ class transports_base(object):
         self.message_received = callback
 
     def send_command(self, command):
-        """Sends a complete command to the device, line termination etc is handled by the transport"""
+        """Sends a complete command to the device, line termination etc is handled by the transport. May return a
+        token identifying the command, it is passed back to response_abandoned()"""
         raise NotImplementedError()
 
+    # Transports that write the commands out as they are may also define send_bytes(data) for sending commands
+    # already encoded and terminated with their line_terminator, see scpi.set_command_compiler()
+
     def message_received(self, message):
         """Default message callback raises error"""
         raise RuntimeError("Message callback not set")
@@ -34,5 +42,12 @@ class transports_base(object):
         raise NotImplementedError()
 
     def abort_command(self):
-        """Send the "device clear" command to abort a running command"""
+        """Send the "device clear" command to abort a running command, returns True if the device was sent device
+        clear (the timeout recovery only fails the commands in progress then)"""
         raise NotImplementedError()
+
+    def response_abandoned(self, token=None):
+        """Called when the response to a query is no longer waited for (timeout), token is what send_command()
+        (or send_bytes()) returned for the query. Transports that can correlate responses with queries should stop
+        expecting that one"""
+        pass
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""Client side of the instrument broker (see scpi.broker), talks to the broker over its Unix domain socket"""
+import socket
+import threading
+from collections import deque
+from .baseclass import transports_base
+from .framer import message_framer
+
+
+class pending_response(object):
+    """A query sent to the broker, the token send_command() returns for it"""
+
+    def __init__(self):
+        # The query timed out, its response is thrown away when it comes
+        self.abandoned = False
+
+
+class transports_broker(transports_base):
+    def __init__(self, path, *args, **kwargs):
+        """Initializes the transport and connects to the broker listening at path"""
+        super(transports_broker, self).__init__(*args, **kwargs)
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.framer = message_framer(self.message_framed, "\n")
+        # The broker answers every query exactly once and in order, these are the pending_responses of the
+        # queries sent, oldest first. Responses to the queries we gave up on are dropped
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+        # Keeps the order of pending the same as the order of the writes
+        self.send_lock = threading.Lock()
+        self.late_responses = 0
+        self.socket_alive = True
+        self.receiver_thread = threading.Thread(target=self.socket_reader)
+        self.receiver_thread.setDaemon(1)
+        self.receiver_thread.start()
+
+    def socket_reader(self):
+        try:
+            while self.socket_alive:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self.framer.feed(data)
+        except socket.error as e:
+            if self.socket_alive:
+                print("Got exception %s" % e)
+        self.socket_alive = False
+
+    def message_framed(self, message):
+        """Passes complete messages from the framer to the message callback"""
+        with self.pending_lock:
+            pending = self.pending.popleft() if self.pending else None
+        if pending is not None and pending.abandoned:
+            self.late_responses += 1
+            return
+        self.message_received(message)
+
+    def response_abandoned(self, token=None):
+        """The query timed out, drop its response when the broker gets to it"""
+        if token is not None:
+            token.abandoned = True
+
+    def send_command(self, command):
+        """Sends the command to the broker, returns the pending_response of queries"""
+        pending = None
+        with self.send_lock:
+            if '?' in command:
+                pending = pending_response()
+                with self.pending_lock:
+                    self.pending.append(pending)
+            self.sock.sendall((command + "\n").encode('utf-8'))
+        return pending
+
+    def abort_command(self):
+        """Asks the broker to send device clear with the instrument transport once no transaction is running, our
+        commands that have not been started yet fail (queries get an empty response). Returns False, whether the
+        device gets cleared depends on the broker's transport"""
+        with self.send_lock:
+            self.sock.sendall(b"!abort\n")
+        return False
+
+    def quit(self):
+        """Disconnects from the broker, the instrument stays connected to the broker"""
+        self.socket_alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.receiver_thread.join()
+        self.sock.close()
+
+    def incoming_data(self):
+        """Check whether we are in the middle of receiving a message"""
+        return bool(self.framer.input_buffer) or self.framer.receiving_block()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""Splits the inbound byte stream into messages
+
+Messages are normally lines ending with the line terminator, but IEEE 488.2 definite length arbitrary blocks
+(#<number of length digits><length><payload>) are read as-is into a preallocated buffer so binary payloads
+can contain anything, including the line terminator.
+"""
+import time
+
+
+class message_framer(object):
+    def __init__(self, callback, line_terminator="\r\n"):
+        """Initializes a framer, callback is called with a str for each line (sans the terminator) and
+        with a bytearray for each arbitrary block payload"""
+        self.callback = callback
+        self.line_terminator = line_terminator.encode('ascii')
+        # Leading NULLs and linebreaks are ignored
+        self._junk = b"\0\r\n"
+        # When set message_started is the time the first chunk of the message being framed arrived (it is valid
+        # during the callback), see scpi.enable_stats()
+        self.timestamps = False
+        self.message_started = None
+        self._chunk_time = None
+        self.reset()
+
+    def reset(self):
+        """Throws away any partially received message"""
+        self.input_buffer = bytearray()
+        # Where to continue looking for the terminator, None means leading junk has not been trimmed yet
+        self._scan_pos = None
+        self._block = None
+        self._block_view = None
+        self._block_pos = 0
+
+    def receiving_block(self):
+        """Returns boolean indicating whether we are in the middle of a block payload"""
+        return self._block is not None
+
+    def feed(self, data):
+        """Processes a chunk of received bytes, calling the callback for each completed message"""
+        data = memoryview(data)
+        if self.timestamps:
+            self._chunk_time = time.time()
+            if not self.input_buffer and self._block is None:
+                self.message_started = self._chunk_time
+        while len(data):
+            if self._block is not None:
+                data = data[self._feed_block(data):]
+                continue
+            self.input_buffer += data
+            data = self._frame_buffer()
+
+    def _frame_buffer(self):
+        """Emits all complete lines in the input buffer, if a block header is found the bytes after it are
+        removed from the buffer and returned (they belong to the payload)"""
+        buf = self.input_buffer
+        terminator = self.line_terminator
+        while buf:
+            if self._scan_pos is None:
+                # Trim prefix NULLs and linebreaks
+                junk = 0
+                while junk < len(buf) and buf[junk] in self._junk:
+                    junk += 1
+                if junk:
+                    del buf[:junk]
+                if not buf:
+                    break
+                if buf[0:1] == b"#":
+                    header_len = self._block_header_len()
+                    if header_len is None:
+                        # Need more data to decide
+                        break
+                    if header_len:
+                        self._start_block(int(buf[2:header_len]))
+                        leftover = memoryview(bytes(buf[header_len:]))
+                        del buf[:]
+                        return leftover
+                self._scan_pos = 0
+            end = buf.find(terminator, self._scan_pos)
+            if end < 0:
+                # The terminator might be split between chunks
+                self._scan_pos = max(0, len(buf) - len(terminator) + 1)
+                break
+            message = bytes(buf[:end])
+            del buf[:end + len(terminator)]
+            self._scan_pos = None
+            self.callback(message.decode('utf-8'))
+            # Anything left is from the latest chunk
+            self.message_started = self._chunk_time
+        return memoryview(b"")
+
+    def _block_header_len(self):
+        """Checks whether the buffer starts with a "#<n><length>" header, returns the header length, 0 if it's
+        not a definite length block header or None if we do not have enough data to tell"""
+        buffered = len(self.input_buffer)
+        if buffered < 2:
+            return None
+        digits = self.input_buffer[1:2]
+        # "#0" is the indefinite length form that's terminated by the linebreak and things like "#H1F" are
+        # non-decimal numbers, both get read as normal lines
+        if not digits.isdigit() or digits == b"0":
+            return 0
+        header_len = 2 + int(digits)
+        if buffered < header_len:
+            return None
+        return header_len
+
+    def _start_block(self, length):
+        """Allocates the buffer for a block payload of given length"""
+        self._block = bytearray(length)
+        self._block_view = memoryview(self._block)
+        self._block_pos = 0
+        if not length:
+            self._block_complete()
+
+    def _feed_block(self, data):
+        """Copies as much of the payload as available straight to the block buffer, returns number of bytes used"""
+        count = min(len(self._block) - self._block_pos, len(data))
+        self._block_view[self._block_pos:self._block_pos + count] = data[:count]
+        self._block_pos += count
+        if self._block_pos == len(self._block):
+            self._block_complete()
+        return count
+
+    def _block_complete(self):
+        block = self._block
+        self._block_view.release()
+        self._block = None
+        self._block_view = None
+        self._block_pos = 0
+        # The terminator following the block is dropped as leading junk of the next message
+        self.callback(block)
+        self.message_started = self._chunk_time
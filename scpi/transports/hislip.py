@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""HiSLIP (IVI-6.1 High-Speed LAN Instrument Protocol) transport layer
+
+Uses two TCP connections, the synchronous channel carries the commands and responses and the asynchronous channel
+is used for out-of-band things like device clear. In overlapped mode several queries may be in flight, responses
+carry the message ID of the query they answer.
+"""
+import socket
+import struct
+import threading
+from collections import deque
+from .baseclass import transports_base
+from .framer import message_framer
+
+# Message types
+INITIALIZE = 0
+INITIALIZE_RESPONSE = 1
+FATAL_ERROR = 2
+ERROR = 3
+DATA = 6
+DATA_END = 7
+DEVICE_CLEAR_COMPLETE = 8
+DEVICE_CLEAR_ACKNOWLEDGE = 9
+ASYNC_MAXIMUM_MESSAGE_SIZE = 15
+ASYNC_MAXIMUM_MESSAGE_SIZE_RESPONSE = 16
+ASYNC_INITIALIZE = 17
+ASYNC_INITIALIZE_RESPONSE = 18
+ASYNC_DEVICE_CLEAR = 19
+ASYNC_DEVICE_CLEAR_ACKNOWLEDGE = 23
+
+PROTOCOL_VERSION = 0x0100
+FIRST_MESSAGE_ID = 0xffffff00
+HEADER = struct.Struct(">2sBBIQ")
+
+
+def pack_message(message_type, control_code=0, parameter=0, payload=b""):
+    """Returns the bytes for a complete HiSLIP message"""
+    return HEADER.pack(b"HS", message_type, control_code, parameter, len(payload)) + payload
+
+
+def recv_exactly(sock, count):
+    """Reads exactly count bytes from the socket, raises EOFError if the connection is closed"""
+    buf = bytearray(count)
+    view = memoryview(buf)
+    pos = 0
+    while pos < count:
+        received = sock.recv_into(view[pos:])
+        if not received:
+            raise EOFError("Connection closed")
+        pos += received
+    return buf
+
+
+def recv_message(sock):
+    """Reads one message, returns (message_type, control_code, parameter, payload)"""
+    prologue, message_type, control_code, parameter, length = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    if prologue != b"HS":
+        raise IOError("Invalid HiSLIP prologue %r" % prologue)
+    payload = recv_exactly(sock, length) if length else bytearray()
+    return (message_type, control_code, parameter, payload)
+
+
+class transports_hislip(transports_base):
+    def __init__(self, host, port=4880, sub_address="hislip0", overlapped=False, connect_timeout=5.0,
+                 vendor_id=b"PS", *args, **kwargs):
+        """Initializes a HiSLIP transport and opens the session, the overlapped mode is negotiated with the
+        server (see the overlapped attribute for the result)"""
+        super(transports_hislip, self).__init__(*args, **kwargs)
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.send_lock = threading.Lock()
+        self.framer = message_framer(self._message_framed, "\n")
+        # Message IDs of the queries waiting for a response, oldest first
+        self.pending_ids = deque()
+        self.lost_responses = 0
+        # Responses dropped because their query was not waited for anymore
+        self.late_responses = 0
+        self._clear_acknowledged = threading.Event()
+        self._data_buffer = bytearray()
+
+        self.sync_sock = self._connect()
+        self.sync_sock.sendall(pack_message(INITIALIZE, 0, (PROTOCOL_VERSION << 16) | struct.unpack(">H", vendor_id)[0],
+                                            sub_address.encode('ascii')))
+        message_type, control_code, parameter, payload = recv_message(self.sync_sock)
+        if message_type != INITIALIZE_RESPONSE:
+            raise IOError("Expected InitializeResponse, got message type %d" % message_type)
+        self.session_id = parameter & 0xffff
+        self.overlapped = bool(control_code & 0x01)
+
+        self.async_sock = self._connect()
+        self.async_sock.sendall(pack_message(ASYNC_INITIALIZE, 0, self.session_id))
+        message_type, control_code, parameter, payload = recv_message(self.async_sock)
+        if message_type != ASYNC_INITIALIZE_RESPONSE:
+            raise IOError("Expected AsyncInitializeResponse, got message type %d" % message_type)
+        self.async_sock.sendall(pack_message(ASYNC_MAXIMUM_MESSAGE_SIZE, 0, 0, struct.pack(">Q", 1 << 20)))
+        message_type, control_code, parameter, payload = recv_message(self.async_sock)
+        self.max_message_size = struct.unpack(">Q", bytes(payload))[0]
+
+        self.message_id = FIRST_MESSAGE_ID
+        self.socket_alive = True
+        self.receiver_thread = threading.Thread(target=self.sync_reader)
+        self.receiver_thread.setDaemon(1)
+        self.receiver_thread.start()
+        if self.overlapped != overlapped:
+            # The mode is negotiated as part of device clear
+            self.device_clear(overlapped)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def sync_reader(self):
+        try:
+            while self.socket_alive:
+                message_type, control_code, parameter, payload = recv_message(self.sync_sock)
+                if message_type == DATA:
+                    self._data_buffer += payload
+                elif message_type == DATA_END:
+                    self._data_buffer += payload
+                    self._response_complete(parameter)
+                elif message_type == DEVICE_CLEAR_ACKNOWLEDGE:
+                    self.overlapped = bool(control_code & 0x01)
+                    self._clear_acknowledged.set()
+                elif message_type in (ERROR, FATAL_ERROR):
+                    print("Got HiSLIP error %d: %s" % (control_code, payload.decode('utf-8', 'replace')))
+        except (EOFError, socket.error) as e:
+            if self.socket_alive:
+                print("Got exception %s" % e)
+        self.socket_alive = False
+
+    def _response_complete(self, message_id):
+        """Matches the response to the query it answers and passes it on"""
+        data = self._data_buffer
+        self._data_buffer = bytearray()
+        lost = 0
+        with self.send_lock:
+            if message_id not in self.pending_ids:
+                # Late answer to a query that timed out (see response_abandoned()) or that was cleared, passing it
+                # on would hand it to the next query
+                self.late_responses += 1
+                return
+            # Queries before this one are not going to get an answer anymore (they failed)
+            while self.pending_ids[0] != message_id:
+                self.pending_ids.popleft()
+                lost += 1
+            self.pending_ids.popleft()
+            self.lost_responses += lost
+        for _ in range(lost):
+            # Empty responses keep the queries waiting in order aligned with their answers
+            self.message_received("")
+        if not data.endswith(b"\n"):
+            data += b"\n"
+        self.framer.feed(data)
+
+    def _message_framed(self, message):
+        """Passes complete messages from the framer to the message callback"""
+        self.message_received(message)
+
+    def send_command(self, command):
+        """Sends the command as a single DataEnd message, returns its message ID"""
+        with self.send_lock:
+            message_id = self.message_id
+            self.message_id = (self.message_id + 2) & 0xffffffff
+            if '?' in command:
+                self.pending_ids.append(message_id)
+            self.sync_sock.sendall(pack_message(DATA_END, 0, message_id, (command + "\n").encode('utf-8')))
+        return message_id
+
+    def response_abandoned(self, token=None):
+        """The query with message ID token timed out, its response must not be matched to another one"""
+        with self.send_lock:
+            if token in self.pending_ids:
+                self.pending_ids.remove(token)
+
+    def device_clear(self, overlapped=None):
+        """Runs the device clear procedure, also used to switch between overlapped and synchronized modes"""
+        if overlapped is None:
+            overlapped = self.overlapped
+        self._clear_acknowledged.clear()
+        self.async_sock.sendall(pack_message(ASYNC_DEVICE_CLEAR))
+        message_type, control_code, parameter, payload = recv_message(self.async_sock)
+        if message_type != ASYNC_DEVICE_CLEAR_ACKNOWLEDGE:
+            raise IOError("Expected AsyncDeviceClearAcknowledge, got message type %d" % message_type)
+        with self.send_lock:
+            self.pending_ids.clear()
+            self._data_buffer = bytearray()
+            self.framer.reset()
+            self.message_id = FIRST_MESSAGE_ID
+            self.sync_sock.sendall(pack_message(DEVICE_CLEAR_COMPLETE, int(bool(overlapped))))
+        if not self._clear_acknowledged.wait(self.connect_timeout):
+            raise IOError("Device clear was not acknowledged")
+
+    def abort_command(self):
+        """Sends "Device clear" over the asynchronous channel"""
+        self.device_clear()
+        return True
+
+    def quit(self):
+        """Shuts down any background threads that might be active and closes the connections"""
+        self.socket_alive = False
+        for sock in (self.sync_sock, self.async_sock):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.receiver_thread.join()
+        self.sync_sock.close()
+        self.async_sock.close()
+
+    def incoming_data(self):
+        """Check whether we are in the middle of receiving a response"""
+        return bool(self._data_buffer)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Prologix style GPIB adapter (GPIB-USB/GPIB-ETHERNET in serial mode) transport layer
+
+One prologix_adapter owns the serial port, each instrument on the bus gets a transports_prologix with its GPIB
+address. Commands queued by several devices at once are written grouped by address to save "++addr" switches.
+"""
+import re
+import threading
+from collections import deque
+from .baseclass import transports_base
+from .rs232 import transports_rs232
+
+# CR, LF, ESC and '+' in the data must be escaped with ESC so the adapter does not take them as its own
+escape_regex = re.compile(b"([\r\n\x1b+])")
+
+
+class pending_read(object):
+    """A "++read" of the adapter, the token transports_prologix returns for queries"""
+
+    def __init__(self, address):
+        self.address = address
+        # The query timed out, its response is thrown away when it comes
+        self.abandoned = False
+
+
+class prologix_adapter(object):
+    def __init__(self, port, reactor=None, read_timeout_ms=500, group_by_address=True):
+        """Initializes the adapter in controller mode, requires open serial port as argument. Responses are
+        read only when asked for ("++auto 0"), the adapter asserts EOI with the last byte and appends LF"""
+        self.group_by_address = group_by_address
+        self.queue_lock = threading.Lock()
+        # GPIB address -> deque of (sequence number, address, data, pending_read or None)
+        self.queues = {}
+        self.queued = 0
+        self.sequence = 0
+        self.writing = False
+        self.current_address = None
+        # The pending_reads we have sent "++read" for, responses come back in this order
+        self.reads = deque()
+        # GPIB address -> transports_prologix
+        self.transports = {}
+        self.address_switches = 0
+        self.stray_messages = 0
+        # Responses dropped because their query was not waited for anymore
+        self.late_responses = 0
+        self.link = transports_rs232(port, reactor, "\n")
+        self.link.set_message_callback(self._route_message)
+        self.write(b"++mode 1\n++auto 0\n++eoi 1\n++eos 2\n++eot_enable 0\n++read_tmo_ms %d\n" % read_timeout_ms)
+
+    def write(self, data):
+        """Writes raw bytes to the adapter"""
+        self.link.serial_port.write(data)
+
+    def attach(self, transport):
+        """Registers the transport for responses from its address"""
+        if transport.address in self.transports:
+            raise RuntimeError("GPIB address %d already in use" % transport.address)
+        self.transports[transport.address] = transport
+
+    def detach(self, transport):
+        """Stops routing responses to the transport"""
+        if self.transports.get(transport.address) is transport:
+            del self.transports[transport.address]
+
+    def _route_message(self, message):
+        """Passes the response to the transport whose "++read" it answers"""
+        if not isinstance(message, bytearray):
+            message = message.rstrip("\r")
+        with self.queue_lock:
+            read = self.reads.popleft() if self.reads else None
+        if read is not None and read.abandoned:
+            self.late_responses += 1
+            return
+        transport = self.transports.get(read.address if read is not None else None)
+        if transport is None:
+            self.stray_messages += 1
+            return
+        transport.message_received(message)
+
+    def abandon_read(self, read):
+        """The query of the pending_read timed out, its response is dropped when it comes. It keeps its place in
+        the order of the reads, if the adapter gave up on the read without returning a line clear() the address"""
+        read.abandoned = True
+
+    def send(self, address, data, read):
+        """Queues data (bytes) for the instrument at address, if read is set the response is read after it and
+        the pending_read for it is returned. None as data sends selected device clear"""
+        pending = pending_read(address) if read else None
+        with self.queue_lock:
+            self.queues.setdefault(address, deque()).append((self.sequence, address, data, pending))
+            self.sequence += 1
+            self.queued += 1
+        self._drain()
+        return pending
+
+    def _next_item(self):
+        """Picks the next queued item, staying on the current address while it has something queued"""
+        queue = self.queues.get(self.current_address)
+        if not self.group_by_address or not queue:
+            queue = None
+            for candidate in self.queues.values():
+                if candidate and (queue is None or candidate[0][0] < queue[0][0]):
+                    queue = candidate
+        sequence, address, data, pending = queue.popleft()
+        self.queued -= 1
+        return (address, data, pending)
+
+    def _drain(self):
+        """Whoever gets to write empties the queues for everyone, so a batch goes out in one write"""
+        while True:
+            with self.queue_lock:
+                if self.writing or not self.queued:
+                    return
+                self.writing = True
+            try:
+                with self.queue_lock:
+                    buf = bytearray()
+                    while self.queued:
+                        address, data, pending = self._next_item()
+                        if address != self.current_address:
+                            buf += b"++addr %d\n" % address
+                            self.current_address = address
+                            self.address_switches += 1
+                        if data is None:
+                            buf += b"++clr\n"
+                        else:
+                            buf += escape_regex.sub(b"\x1b\\1", data) + b"\n"
+                        if pending is not None:
+                            buf += b"++read eoi\n"
+                            self.reads.append(pending)
+                self.write(buf)
+            finally:
+                with self.queue_lock:
+                    self.writing = False
+
+    def clear(self, address):
+        """Sends selected device clear to the instrument"""
+        with self.queue_lock:
+            self.queues.pop(address, None)
+            self.queued = sum(len(queue) for queue in self.queues.values())
+            for read in [read for read in self.reads if read.address == address]:
+                self.reads.remove(read)
+        self.send(address, None, False)
+
+    def incoming_data(self):
+        """Check whether we are in the middle of receiving a response"""
+        return bool(self.link.framer.input_buffer) or self.link.framer.receiving_block()
+
+    def quit(self):
+        """Stops the reader and closes the serial port"""
+        self.link.quit()
+
+
+class transports_prologix(transports_base):
+    def __init__(self, adapter, address, *args, **kwargs):
+        """Initializes a transport for the instrument at GPIB address (primary) behind the adapter"""
+        super(transports_prologix, self).__init__(*args, **kwargs)
+        self.adapter = adapter
+        self.address = address
+        self.adapter.attach(self)
+
+    def send_command(self, command):
+        """Queues the command, queries get "++read eoi" after them and return its pending_read"""
+        return self.adapter.send(self.address, command.encode('utf-8'), '?' in command)
+
+    def response_abandoned(self, token=None):
+        """The query timed out, its response must not go to a later one"""
+        if token is not None:
+            self.adapter.abandon_read(token)
+
+    def incoming_data(self):
+        """Check whether the adapter is in the middle of receiving a response"""
+        return self.adapter.incoming_data()
+
+    def abort_command(self):
+        """Sends "++clr" (selected device clear) to our address"""
+        self.adapter.clear(self.address)
+        return True
+
+    def quit(self):
+        """Detaches from the adapter, the adapter (and the serial port) is shared so it stays open"""
+        self.adapter.detach(self)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""Single background thread that waits for inbound data on any number of transports
+
+Instead of every transport running its own reader thread they can register their file object and a callback
+with a reactor, the callback is called from the reactor thread when the file object becomes readable.
+"""
+import os
+import selectors
+import threading
+from collections import deque
+
+
+class reactor(object):
+    def __init__(self):
+        """Initializes a reactor, the thread is started on first register()"""
+        self.selector = selectors.DefaultSelector()
+        # The self-pipe is used to wake the select() up when registrations change or we need to stop
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self.selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+        # Registrations are changed only from the reactor thread, other threads queue the changes here
+        self._changes = deque()
+        self._lock = threading.Lock()
+        self.reactor_thread = None
+        self.reactor_alive = False
+
+    def register(self, fileobj, callback):
+        """Starts calling callback() whenever fileobj is readable"""
+        with self._lock:
+            if not self.reactor_alive:
+                self.reactor_alive = True
+                self.reactor_thread = threading.Thread(target=self.reactor_loop)
+                self.reactor_thread.setDaemon(1)
+                self.reactor_thread.start()
+        self._change(self.selector.register, fileobj, selectors.EVENT_READ, callback)
+
+    def unregister(self, fileobj):
+        """Stops watching fileobj, when this returns the callback will not be called anymore"""
+        self._change(self.selector.unregister, fileobj)
+
+    def _change(self, method, *args):
+        """Applies a registration change from the reactor thread and waits for it to be done"""
+        done = threading.Event()
+        with self._lock:
+            if threading.current_thread() is self.reactor_thread or not self.reactor_alive:
+                method(*args)
+                return
+            self._changes.append((method, args, done))
+        self.wakeup()
+        while not done.wait(0.5):
+            thread = self.reactor_thread
+            if thread is None or not thread.is_alive():
+                # The reactor thread is gone, nobody else is going to apply the change
+                self._apply_changes()
+
+    def wakeup(self):
+        """Makes the reactor thread return from select()"""
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            # Pipe is full so there is a wakeup pending anyway
+            pass
+
+    def _apply_changes(self):
+        while self._changes:
+            method, args, done = self._changes.popleft()
+            try:
+                method(*args)
+            except (KeyError, ValueError) as e:
+                print("Got exception %s" % e)
+            done.set()
+
+    def reactor_loop(self):
+        try:
+            while self.reactor_alive:
+                for key, events in self.selector.select():
+                    if key.data is None:
+                        try:
+                            os.read(self._wakeup_read, 512)
+                        except BlockingIOError:
+                            pass
+                        continue
+                    try:
+                        key.data()
+                    except Exception as e:
+                        # One misbehaving transport must not leave the others deaf
+                        print("Got exception %s" % e)
+                self._apply_changes()
+        finally:
+            with self._lock:
+                if self.reactor_thread is threading.current_thread():
+                    # Lets register() start a new thread if this one died
+                    self.reactor_alive = False
+            self._apply_changes()
+
+    def stop(self):
+        """Stops the reactor thread, returns immediately if called from a callback"""
+        with self._lock:
+            self.reactor_alive = False
+        self.wakeup()
+        if self.reactor_thread is not None and threading.current_thread() is not self.reactor_thread:
+            self.reactor_thread.join()
+        self.reactor_thread = None
+
+
+_default_reactor = None
+_default_reactor_lock = threading.Lock()
+
+
+def default_reactor():
+    """Returns the shared reactor instance"""
+    global _default_reactor
+    with _default_reactor_lock:
+        if _default_reactor is None:
+            _default_reactor = reactor()
+        return _default_reactor
@@ -7,87 +7,59 @@ import string
 import binascii
 import time
 import sys
+import os
 import select
+try:
+    import fcntl
+    import termios
+    import struct
+except ImportError:
+    fcntl = None
 from .baseclass import transports_base
+from .framer import message_framer
 
 # basically a wrapper for Serial
 
 
 class transports_rs232(transports_base):
-    def __init__(self, port, *args, **kwargs):
-        """Initializes a serial transport, requires open serial port and message callback as arguments"""
+    def __init__(self, port, reactor=None, line_terminator="\r\n", *args, **kwargs):
+        """Initializes a serial transport, requires open serial port as argument. If reactor (see
+        transports.reactor) is given the port is read from the reactor thread instead of a thread of our own"""
         super(transports_rs232, self).__init__(*args, **kwargs)
-        self.line_terminator = "\r\n"
+        self.line_terminator = line_terminator
         self._terminator_slice = -1 * len(self.line_terminator)
-        # For tracking state changes
-        self._previous_states = {
-            'getCTS': None,
-            'getDSR': None,
-            'getRI': None,
-            'getCD': None
-        }
-        self._current_states = {
-            'getCTS': None,
-            'getDSR': None,
-            'getRI': None,
-            'getCD': None
-        }
+        # See monitor_modem_lines()
+        self.modem_callback = None
+        self.modem_thread = None
+        self._modem_stop = None
         self.print_debug = False
         self.serial_port = port
+        self.reactor = reactor
         self.initialize_serial()
 
     def initialize_serial(self):
-        """Creates a background thread for reading the serial port"""
-        self.input_buffer = ""
+        """Creates a background thread for reading the serial port (or registers the port with the reactor)"""
+        self.framer = message_framer(self._message_framed, self.line_terminator)
+        self.serial_alive = True
+        if self.serial_port.rtscts:
+            self.serial_port.setRTS(True)
+        if self.reactor is not None:
+            self.reactor.register(self.serial_port, self._reactor_read_ready)
+            return
+        # Self-pipe for waking the reader thread up from select() when stopping
+        self._wakeup_read, self._wakeup_write = os.pipe()
         self.receiver_thread = threading.Thread(target=self.serial_reader)
         self.receiver_thread.setDaemon(1)
         self.receiver_thread.start()
 
     def serial_reader(self):
-        self.serial_alive = True
-        if self.serial_port.rtscts:
-            self.serial_port.setRTS(True)
         try:
             while self.serial_alive:
-                for method in self._current_states:
-                    self._current_states[method] = getattr(
-                        self.serial_port, method)()
-                    if self._current_states[method] != self._previous_states[method]:
-                        print(" *** %s changed to %d *** " %
-                              (method, self._current_states[method]))
-                        self._previous_states[method] = self._current_states[method]
-                rd, wd, ed = select.select([self.serial_port, ], [], [
+                rd, wd, ed = select.select([self.serial_port, self._wakeup_read], [], [
                                            self.serial_port, ], 5)  # Wait up to 5s for new data
-                if not self.serial_port.inWaiting():
-                    # Don't try to read if there is no data, instead sleep
-                    # (yield) a bit
-                    time.sleep(0)
-                    continue
-                data = self.serial_port.read(1)
-                if len(data) == 0:
-                    continue
-                if self.print_debug:
-                    # hex-encode unprintable characters
-                    # if data not in string.letters.join(string.digits).join(string.punctuation).join("\r\n"):
-                    #     sys.stdout.write("\\0x".join(binascii.hexlify(data)))
-                    # OTOH repr was better afterall
-                    if data not in self.line_terminator:
-                        sys.stdout.write(repr(data))
-                    else:
-                        sys.stdout.write(data)
-                # Put the data into inpit buffer and check for CRLF
-                self.input_buffer += data.decode('utf-8')
-                # Trim prefix NULLs and linebreaks
-                self.input_buffer = self.input_buffer.lstrip(
-                    chr(0x0) + self.line_terminator)
-                # print "input_buffer=%s" % repr(self.input_buffer)
-                if (len(self.input_buffer) > 0 and
-                        self.input_buffer[self._terminator_slice:] == self.line_terminator):
-                    # Got a message, parse it (sans the CRLF) and empty the buffer
-                    # print "DEBUG: calling self.message_received()"
-                    self.message_received(
-                        self.input_buffer[:self._terminator_slice])
-                    self.input_buffer = ""
+                if not self.serial_alive:
+                    break
+                self.serial_read_ready()
 
 #        except (IOError, pyserial.SerialException), e:
 # something overwrites the module when running I get <type
@@ -99,16 +71,127 @@ class transports_rs232(transports_base):
             # It seems we cannot really call this from here, how to detect the problem in main thread ??
             # self.launcher_instance.unload_device(self.object_name)
 
+    def _reactor_read_ready(self):
+        """Reactor callback, the reactor thread must survive port errors"""
+        try:
+            self.serial_read_ready()
+        except IOError as e:
+            print("Got exception %s" % e)
+            self.serial_alive = False
+            self.reactor.unregister(self.serial_port)
+
+    def serial_read_ready(self):
+        """Reads the data available in the serial port and passes it to the framer"""
+        read_size = self.serial_port.inWaiting()
+        if not read_size:
+            # Don't try to read if there is no data, instead sleep
+            # (yield) a bit
+            time.sleep(0)
+            return
+        data = self.serial_port.read(read_size)
+        if len(data) == 0:
+            return
+        if self.print_debug:
+            # hex-encode unprintable characters
+            # if data not in string.letters.join(string.digits).join(string.punctuation).join("\r\n"):
+            #     sys.stdout.write("\\0x".join(binascii.hexlify(data)))
+            # OTOH repr was better afterall
+            if data not in self.line_terminator:
+                sys.stdout.write(repr(data))
+            else:
+                sys.stdout.write(data)
+        # Let the framer check for CRLF (or binary blocks)
+        self.framer.feed(data)
+
+    def monitor_modem_lines(self, callback, interval=0.1):
+        """Starts watching the CTS, DSR, RI and CD lines in a background thread (off the data path),
+        callback(timestamp, line, state) is called for the initial states and every change after that. The lines are
+        sampled every interval seconds, so changes shorter than that can be missed"""
+        self.stop_modem_monitor()
+        self.modem_callback = callback
+        self._modem_stop = threading.Event()
+        self.modem_thread = threading.Thread(target=self.modem_monitor, args=(self._modem_stop, interval))
+        self.modem_thread.setDaemon(1)
+        self.modem_thread.start()
+
+    def stop_modem_monitor(self):
+        """Stops calling the modem line callback, the thread is woken up and joined (unless called from the
+        callback)"""
+        self.modem_callback = None
+        if self._modem_stop is not None:
+            self._modem_stop.set()
+        if self.modem_thread is not None and self.modem_thread is not threading.current_thread():
+            self.modem_thread.join()
+        self.modem_thread = None
+        self._modem_stop = None
+
+    def read_modem_lines(self):
+        """Returns dict of the modem line states, with one ioctl where possible"""
+        if fcntl is not None:
+            try:
+                bits = struct.unpack('I', fcntl.ioctl(self.serial_port.fileno(), termios.TIOCMGET,
+                                                      struct.pack('I', 0)))[0]
+                return {
+                    'CTS': bool(bits & termios.TIOCM_CTS),
+                    'DSR': bool(bits & termios.TIOCM_DSR),
+                    'RI': bool(bits & termios.TIOCM_RI),
+                    'CD': bool(bits & termios.TIOCM_CD),
+                }
+            except (IOError, AttributeError):
+                pass
+        return {
+            'CTS': self.serial_port.getCTS(),
+            'DSR': self.serial_port.getDSR(),
+            'RI': self.serial_port.getRI(),
+            'CD': self.serial_port.getCD(),
+        }
+
+    def modem_monitor(self, stop, interval):
+        previous_states = {}
+        callback = self.modem_callback
+        try:
+            while self.serial_alive and not stop.is_set():
+                current_states = self.read_modem_lines()
+                timestamp = time.time()
+                for line in sorted(current_states):
+                    if current_states[line] != previous_states.get(line):
+                        callback(timestamp, line, current_states[line])
+                previous_states = current_states
+                # TIOCMIWAIT would sleep until a line changes, but nothing can wake it up to stop
+                stop.wait(interval)
+        except (IOError, ValueError) as e:
+            # Port closed or failed
+            if self.serial_alive:
+                print("Got exception %s" % e)
+
+    def _message_framed(self, message):
+        """Passes complete messages from the framer to the message callback"""
+        # print "DEBUG: calling self.message_received()"
+        self.message_received(message)
+
     def abort_command(self):
         """Uses the break-command to issue "Device clear", from the SCPI documentation (for HP6632B): The status registers, the error queue, and all configuration states are left unchanged when a device clear message is received. Device clear performs the following actions:
  - The input and output buffers of the dc source are cleared.
- - The dc source is prepared to accept a new command string."""
+ - The dc source is prepared to accept a new command string.
+        Any partially received message is thrown away too."""
+        self.framer.reset()
         self.serial_port.sendBreak()
+        return True
 
     def stop_serial(self):
         """Stops the serial port thread and closes the port"""
+        was_alive = self.serial_alive
         self.serial_alive = False
-        self.receiver_thread.join()
+        self.stop_modem_monitor()
+        if self.reactor is not None:
+            # A read error has unregistered the port already
+            if was_alive:
+                self.reactor.unregister(self.serial_port)
+        else:
+            os.write(self._wakeup_write, b"\0")
+            self.receiver_thread.join()
+            os.close(self._wakeup_read)
+            os.close(self._wakeup_write)
         self.serial_port.close()
 
     def quit(self):
@@ -121,9 +204,13 @@ class transports_rs232(transports_base):
 
     def send_command(self, command):
         """Adds the line terminator and writes the command out"""
+        send_str = command + self.line_terminator
+        self.send_bytes(send_str.encode('utf-8'))
+
+    def send_bytes(self, data):
+        """Writes out an already encoded and terminated command"""
         if self.serial_port.rtscts:
             while not self.serial_port.getCTS():
                 # Yield while waiting for CTS
                 time.sleep(0)
-        send_str = command + self.line_terminator
-        self.serial_port.write(send_str.encode('utf-8'))
+        self.serial_port.write(data)
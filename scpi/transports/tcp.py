@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""Raw TCP socket transport layer (the "port 5025" SCPI-over-LAN most instruments offer)"""
+import socket
+import threading
+from .baseclass import transports_base
+from .framer import message_framer
+
+
+class transports_tcp(transports_base):
+    def __init__(self, host, port=5025, connect_timeout=5.0, keepalive=True, control_port=None, reactor=None,
+                 *args, **kwargs):
+        """Initializes a TCP transport and connects to the instrument. If control_port is given abort_command
+        sends "DCL" to it (Keysight style control connection). If reactor (see transports.reactor) is given the
+        socket is read from the reactor thread instead of a thread of our own"""
+        super(transports_tcp, self).__init__(*args, **kwargs)
+        self.line_terminator = "\n"
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.control_port = control_port
+        self.reactor = reactor
+        self.sock = socket.create_connection((host, port), connect_timeout)
+        self.sock.settimeout(None)
+        # Commands are short and we wait for the reply, do not let Nagle hold them back
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if keepalive:
+            self.set_keepalive()
+        self.framer = message_framer(self._message_framed, self.line_terminator)
+        self.socket_alive = True
+        if self.reactor is not None:
+            # recv() only gets called when there is data, the timeout keeps sendall() from hanging forever
+            self.sock.settimeout(self.connect_timeout)
+            self.reactor.register(self.sock, self._reactor_read_ready)
+            return
+        self.receiver_thread = threading.Thread(target=self.socket_reader)
+        self.receiver_thread.setDaemon(1)
+        self.receiver_thread.start()
+
+    def set_keepalive(self, idle=10, interval=5, count=3):
+        """Enables TCP keepalive so a dead instrument (or cable) is noticed, the timing options are set where
+        the platform supports them"""
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', count)):
+            if hasattr(socket, option):
+                self.sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def socket_reader(self):
+        try:
+            while self.socket_alive:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self.framer.feed(data)
+        except socket.error as e:
+            if self.socket_alive:
+                print("Got exception %s" % e)
+        self.socket_alive = False
+
+    def _reactor_read_ready(self):
+        """Reactor callback, the reactor thread must survive socket errors"""
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return
+        except socket.error as e:
+            print("Got exception %s" % e)
+            data = b""
+        if not data:
+            self.socket_alive = False
+            self.reactor.unregister(self.sock)
+            return
+        self.framer.feed(data)
+
+    def _message_framed(self, message):
+        """Passes complete messages from the framer to the message callback"""
+        if not isinstance(message, bytearray):
+            # Some instruments terminate with CRLF
+            message = message.rstrip("\r")
+        self.message_received(message)
+
+    def abort_command(self):
+        """Throws away any partially received message and if there is a control port sends device clear to it,
+        returns True if it did"""
+        self.framer.reset()
+        if self.control_port is None:
+            return False
+        control = socket.create_connection((self.host, self.control_port), self.connect_timeout)
+        try:
+            control.sendall(b"DCL\n")
+        finally:
+            control.close()
+        return True
+
+    def quit(self):
+        """Shuts down any background threads that might be active and closes the socket"""
+        was_alive = self.socket_alive
+        self.socket_alive = False
+        if self.reactor is not None and was_alive:
+            self.reactor.unregister(self.sock)
+        try:
+            # Wakes up the reader thread from recv()
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        if self.reactor is None:
+            self.receiver_thread.join()
+        self.sock.close()
+
+    def incoming_data(self):
+        """Check whether we are in the middle of receiving a message"""
+        return bool(self.framer.input_buffer) or self.framer.receiving_block()
+
+    def send_command(self, command):
+        """Adds the line terminator and writes the command out"""
+        send_str = command + self.line_terminator
+        self.sock.sendall(send_str.encode('utf-8'))
+
+    def send_bytes(self, data):
+        """Writes out an already encoded and terminated command"""
+        self.sock.sendall(data)
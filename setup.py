@@ -15,12 +15,16 @@ setup(
     # version='0.6.6',
     author='Eero "rambo" af Heurlin',
     author_email='rambo@iki.fi',
-    packages=['scpi', 'scpi.errors', 'scpi.transports', 'scpi.devices'],
+    packages=['scpi', 'scpi.errors', 'scpi.transports', 'scpi.devices', 'scpi.emulators'],
     license='GNU LGPL',
     long_description=open('README.md').read(),
     description='Implement SCPI in pure Python',
     install_requires=[
         'pyserial>=2.7',
     ],
+    extras_require={
+        # For scpi.set_list_backend('numpy')
+        'numpy': ['numpy>=1.17'],
+    },
     url='https://github.com/rambo/python-scpi',
 )
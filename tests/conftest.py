@@ -0,0 +1,39 @@
+"""Shared fixtures, the tests run against the emulated instruments in
+   scpi.emulators so no hardware is needed"""
+import os
+import sys
+import time
+
+import pytest
+
+# Make the tests runnable from a source checkout
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from scpi import scpi  # noqa: E402
+from scpi.transports import tcp  # noqa: E402
+from scpi.emulators import simulated_instrument, tcp_server  # noqa: E402
+
+
+@pytest.fixture
+def instrument():
+    """simulated_instrument with a few test commands served over TCP (address), the lines it gets are in
+    received_lines"""
+    instrument = simulated_instrument()
+    instrument.add_command("ECHO?", lambda args: args)
+    # Takes as long as asked and answers "1" late, like *OPC? would
+    instrument.add_command("SLOW?", lambda args: time.sleep(float(args)) or "1")
+    instrument.add_parameter("VALue", 5, int)
+    instrument.add_parameter("LEVel", 0.5, float)
+    instrument.record_lines()
+    server = tcp_server(instrument).start()
+    instrument.address = server.address
+    yield instrument
+    server.stop()
+
+
+@pytest.fixture
+def dev(instrument):
+    """scpi connected to the instrument fixture"""
+    dev = scpi(tcp(*instrument.address))
+    yield dev
+    dev.quit()
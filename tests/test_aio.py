@@ -0,0 +1,87 @@
+"""asyncio flavour of scpi against the emulated instrument, see aio.py"""
+import asyncio
+
+import pytest
+
+from scpi import scpi_async
+from scpi.errors import CommandError, TimeoutError
+from scpi.transports import tcp
+
+
+def run(instrument, test):
+    """Runs test(dev) in a new event loop"""
+    async def main():
+        dev = scpi_async(tcp(*instrument.address), asyncio.get_running_loop())
+        try:
+            return await test(dev)
+        finally:
+            dev.quit()
+    return asyncio.run(main())
+
+
+def test_ask_and_check_error(instrument):
+    async def test(dev):
+        assert (await dev.ask_str("*IDN?")).startswith("python-scpi")
+        await dev.send_command("LEV 2.5")
+        assert await dev.ask_float("LEV?") == 2.5
+        with pytest.raises(CommandError):
+            await dev.send_command("FOO:BAR")
+    run(instrument, test)
+
+
+def test_timeout(instrument):
+    async def test(dev):
+        with pytest.raises(TimeoutError):
+            await dev.send_command_unchecked("LEV 1", True, timeout=0.05)
+    run(instrument, test)
+
+
+def test_command_compiler(instrument):
+    async def test(dev):
+        dev.set_command_compiler()
+        await dev.send_command("LEVel 2.500000")
+        assert await dev.ask_float("LEVel?") == 2.5
+    run(instrument, test)
+    assert "LEV 2.5" in instrument.received_lines
+    assert "LEV?" in instrument.received_lines
+
+
+def test_parameter_cache(instrument):
+    async def test(dev):
+        dev.set_parameter_cache(prefixes=("LEV",))
+        assert await dev.ask_float("LEV?") == 0.5
+        assert await dev.ask_float("LEV?") == 0.5
+        await dev.send_command("LEV 3")
+        assert await dev.ask_float("LEV?") == 3.0
+        return dev.parameter_cache.hits, dev.parameter_cache.misses
+    hits, misses = run(instrument, test)
+    assert (hits, misses) == (2, 1)
+    assert instrument.received_lines.count("LEV?") == 1
+
+
+def test_thread_only_features_are_absent(instrument):
+    async def test(dev):
+        for name in ('start', 'deferred_errors', 'deadline', 'set_timeout_recovery', 'enable_stats', 'recover'):
+            assert not hasattr(dev, name)
+    run(instrument, test)
+
+
+def test_needs_a_running_loop(instrument):
+    transport = tcp(*instrument.address)
+    try:
+        with pytest.raises(RuntimeError):
+            scpi_async(transport)
+    finally:
+        transport.quit()
+
+
+def test_esr_error_check(instrument):
+    async def test(dev):
+        dev.set_error_check('esr')
+        await dev.send_command("*OPC")
+        await dev.send_command("LEV 2")
+        # The operation complete bit was kept for whoever takes it
+        assert await dev.take_esr_bits(0x01) == 0x01
+        with pytest.raises(CommandError):
+            await dev.send_command("FOO:BAR")
+    run(instrument, test)
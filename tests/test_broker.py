@@ -0,0 +1,105 @@
+"""Sharing one instrument between clients through the broker, see
+   scpi.broker"""
+import threading
+
+import pytest
+
+from scpi import scpi
+from scpi.broker import scpi_broker
+from scpi.errors import CommandError, TimeoutError
+from scpi.transports import tcp, broker
+
+
+@pytest.fixture
+def instrument_broker(instrument, tmp_path):
+    path = str(tmp_path / "broker.sock")
+    instrument_broker = scpi_broker(tcp(*instrument.address), path).start()
+    instrument_broker.instrument = instrument
+    yield instrument_broker
+    instrument_broker.stop()
+
+
+@pytest.fixture
+def clients(instrument_broker):
+    clients = [scpi(broker(instrument_broker.path)) for _ in range(2)]
+    yield clients
+    for client in clients:
+        client.quit()
+
+
+@pytest.mark.parametrize("method", ['queue', 'esr', 'stb'])
+def test_errors_go_to_the_client_that_caused_them(clients, method):
+    first, second = clients
+    for client in clients:
+        client.set_error_check(method)
+    second.send_command_unchecked("FOO:BAR", False)
+    # The error belongs to the second client
+    first.send_command("LEV 2")
+    assert first.ask_float("LEV?") == 2.0
+    with pytest.raises(CommandError) as error:
+        second.check_error("FOO:BAR")
+    assert error.value.code == -113
+    second.send_command("LEV 3")
+
+
+def test_cls_clears_the_client_status(clients):
+    first, second = clients
+    first.send_command_unchecked("FOO:BAR", False)
+    assert int(first.ask_str("*STB?")) & 0x04
+    first.send_command_unchecked("*CLS", False)
+    assert int(first.ask_str("*STB?")) & 0x04 == 0
+    assert int(first.ask_str("*ESR?")) == 0
+
+
+def test_operation_complete_is_seen_by_all(clients):
+    first, second = clients
+    # Checked, so the broker has run it before the second client asks
+    first.send_command("*OPC")
+    assert second.take_esr_bits(0x01) == 0x01
+    assert first.take_esr_bits(0x01) == 0x01
+
+
+def test_identical_queries_are_coalesced(instrument_broker, clients):
+    instrument_broker.instrument.processing_delay = 0.01
+    results = []
+
+    def worker(client):
+        for _ in range(10):
+            results.append(client.ask_float("LEV?"))
+
+    workers = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    assert results == [0.5] * 20
+    assert instrument_broker.transactions + instrument_broker.coalesced_queries == 20
+
+
+def test_late_response_is_dropped(clients):
+    first, second = clients
+    with pytest.raises(TimeoutError):
+        first.send_command_unchecked("SLOW? 0.3", True, timeout=0.1)
+    assert first.ask_float("LEV?", timeout=2) == 0.5
+    assert first.transport.late_responses == 1
+
+
+def test_abort_fails_only_the_clients_queued_queries(instrument_broker, clients):
+    first, second = clients
+    instrument = instrument_broker.instrument
+    cleared = []
+    instrument_broker.scpi.transport.abort_command = lambda: cleared.append(list(instrument.received_lines))
+    with pytest.raises(TimeoutError):
+        first.send_command_unchecked("SLOW? 0.3", True, timeout=0.1)
+    # Queued behind SLOW? in the broker
+    future = first.start("LEV?")
+    first.abort_command()
+    assert second.ask_int("VAL?", timeout=2) == 5
+    # Answered with no response and the error for it
+    with pytest.raises(CommandError) as excinfo:
+        future.result(2)
+    assert excinfo.value.code == -365
+    # The device clear waited for the transaction in progress
+    lines = cleared[0]
+    assert lines[lines.index("SLOW? 0.3") + 1] == "SYST:ERR?"
+    assert "LEV?" not in instrument.received_lines
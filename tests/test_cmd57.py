@@ -0,0 +1,101 @@
+"""devices.cmd57 against the simulated CMD57, see emulators.cmd57"""
+import pytest
+
+from scpi.devices.cmd57 import cmd57
+from scpi.errors import CommandError, TimeoutError
+from scpi.transports import tcp
+from scpi.emulators import cmd57_instrument, tcp_server
+
+
+@pytest.fixture
+def instrument():
+    instrument = cmd57_instrument(time_scale=0.0, seed=1)
+    server = tcp_server(instrument).start()
+    instrument.address = server.address
+    yield instrument
+    server.stop()
+
+
+@pytest.fixture
+def dev(instrument):
+    dev = cmd57(tcp(*instrument.address))
+    yield dev
+    dev.quit()
+
+
+def test_switch_to_man_btch(dev, instrument):
+    dev.switch_to_man_btch()
+    assert (instrument.test_mode, instrument.dev_state) == ("MAN", "BTCH")
+    switches = instrument.mode_switches
+    # Known state, nothing to do
+    dev.switch_to_man_btch()
+    assert instrument.mode_switches == switches
+    assert dev.resync_state() == ("MAN", "BTCH")
+
+
+def test_failed_state_change_forgets_the_state(dev, instrument):
+    dev.switch_to_man_bidl()
+    assert dev._dev_state == "BIDL"
+    # Not synchronized, the device refuses
+    with pytest.raises(CommandError):
+        dev.set_sync_state("BTCH")
+    assert dev._test_mode is None and dev._dev_state is None
+    dev.switch_to_man_bidl()
+    assert dev._dev_state == "BIDL"
+    with pytest.raises(TimeoutError):
+        with dev.scpi.deadline(0):
+            dev.ask_dev_state()
+    assert dev._test_mode is None and dev._dev_state is None
+    dev.switch_to_man_btch()
+    assert instrument.dev_state == "BTCH"
+
+
+def test_late_sync_completion_does_not_overwrite_the_state(dev, instrument):
+    instrument.time_scale = 0.1
+    dev.switch_to_man_bidl()
+    # Make the first *ESR? poll come after the set_sync_state() below
+    dev.scpi.operation_poll_interval = 0.5
+    future = dev.start_bcch_sync()
+    dev.set_sync_state("BIDL")
+    future.result(5)
+    assert instrument.dev_state == "BIDL"
+    assert dev._dev_state == "BIDL"
+
+
+def test_set_timeout_raises_the_listed_timeouts(dev):
+    assert dev.scpi.header_timeout("READ:BER:TRES?") == 60
+    old = dev.set_timeout(120)
+    assert dev.scpi.header_timeout("READ:BER:TRES?") == 120
+    assert dev.scpi.header_timeout("*IDN?") == 120
+    dev.set_timeout(old)
+    assert dev.scpi.header_timeout("READ:BER:TRES?") == 60
+    assert dev.scpi.header_timeout("FETC:BURS:POW:AVER?") == 2
+    assert dev.scpi.header_timeout("*IDN?") == old
+
+
+def test_arfcn_1000_through_the_compiler(dev, instrument):
+    # E-GSM channel, the compiler must not send it as 1E3
+    assert dev.scpi.compiler is not None
+    dev.set_bts_ccch_arfcn(1000)
+    assert dev.ask_bts_ccch_arfcn() == 1000
+
+
+def test_failed_measurement_forgets_the_state(dev, instrument):
+    dev.switch_to_man_btch()
+    # The state changes behind our back (front panel, another program)
+    instrument.dev_state = "BBCH"
+    with pytest.raises(CommandError):
+        dev.start_ber_test().result(5)
+    assert dev._test_mode is None and dev._dev_state is None
+    dev.switch_to_man_btch()
+    assert instrument.dev_state == "BTCH"
+    with pytest.raises(TimeoutError):
+        with dev.scpi.deadline(0):
+            dev.read_ber_test_result()
+    assert dev._test_mode is None and dev._dev_state is None
+    # Others keep it
+    dev.switch_to_man_btch()
+    with pytest.raises(TimeoutError):
+        with dev.scpi.deadline(0):
+            dev.ask_bts_tch_arfcn()
+    assert dev._dev_state == "BTCH"
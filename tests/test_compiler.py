@@ -0,0 +1,46 @@
+"""compiler.py mnemonic and number shortening"""
+import pytest
+
+from scpi.compiler import command_compiler, short_header, shortest_number
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("CONFigure:NETWork:TYPE", "CONF:NETW:TYPE"),
+    (":SENSe1:CURRent:RANGe?", ":SENS1:CURR:RANG?"),
+    ("*IDN?", "*IDN?"),
+    ("CONF:BTS", "CONF:BTS"),
+])
+def test_short_header(header, expected):
+    assert short_header(header) == expected
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("5.000000", "5"),
+    ("0.000", "0"),
+    ("-0.0200", "-0.02"),
+    ("1500000000.0", "1.5E9"),
+    ("+12.5", "12.5"),
+    ("1E3", "1E3"),
+    # Integer parameters must stay integers
+    ("1000", "1000"),
+    ("1500000000", "1500000000"),
+    ("+007", "7"),
+    ("-0", "0"),
+])
+def test_shortest_number(token, expected):
+    assert shortest_number(token) == expected
+    assert float(expected) == float(token)
+
+
+def test_compile():
+    compiler = command_compiler()
+    assert compiler.compile("SOURce:VOLTage 5.000000;:OUTPut:STATe 1") == "SOUR:VOLT 5;:OUTP:STAT 1"
+    # String data is left alone
+    assert compiler.compile('DISPlay:TEXT "A;1.000"') == 'DISP:TEXT "A;1.000"'
+
+
+def test_encode():
+    compiler = command_compiler("\r\n")
+    encoded = compiler.encode("SOURce:CURRent 0.500")
+    assert encoded == b"SOUR:CURR 0.5\r\n"
+    assert compiler.encode("SOURce:CURRent 0.500") is encoded
@@ -0,0 +1,52 @@
+"""transports.framer message splitting"""
+import pytest
+
+from scpi.transports.framer import message_framer
+
+
+@pytest.fixture
+def framed():
+    messages = []
+    framer = message_framer(messages.append)
+    framer.messages = messages
+    return framer
+
+
+def test_lines(framed):
+    framed.feed(b"\0\r\n1,2\r\nfoo\r\n")
+    assert framed.messages == ["1,2", "foo"]
+
+
+def test_terminator_split_between_chunks(framed):
+    for byte in b"+1.0E+00\r\n2\r\n":
+        framed.feed(bytes([byte]))
+    assert framed.messages == ["+1.0E+00", "2"]
+
+
+def test_block_containing_the_terminator(framed):
+    framed.feed(b"#15a\r\nb")
+    framed.feed(b"c\r\nnext\r\n")
+    assert framed.messages == [bytearray(b"a\r\nbc"), "next"]
+
+
+def test_block_split_in_the_header(framed):
+    framed.feed(b"#")
+    framed.feed(b"2")
+    framed.feed(b"1")
+    assert not framed.receiving_block()
+    framed.feed(b"0")
+    assert framed.receiving_block()
+    framed.feed(b"0123456789\r\n")
+    assert framed.messages == [bytearray(b"0123456789")]
+
+
+def test_non_block_hash_is_a_line(framed):
+    framed.feed(b"#H1F\r\n#0\r\n")
+    assert framed.messages == ["#H1F", "#0"]
+
+
+def test_reset_drops_partial_message(framed):
+    framed.feed(b"#15ab")
+    framed.reset()
+    framed.feed(b"ok\r\n")
+    assert framed.messages == ["ok"]
@@ -0,0 +1,76 @@
+"""HiSLIP transport against the loopback server, see transports.hislip"""
+import threading
+import time
+
+import pytest
+
+from scpi import scpi
+from scpi.errors import TimeoutError
+from scpi.transports import hislip
+from scpi.emulators import simulated_instrument, hislip_server
+
+
+@pytest.fixture(params=[False, True], ids=["synchronized", "overlapped"])
+def hislip_device(request):
+    instrument = simulated_instrument()
+    instrument.add_command("SLOW?", lambda args: time.sleep(0.3) or "slow")
+    instrument.add_command("FAST?", lambda args: "fast")
+    server = hislip_server(instrument, overlapped=request.param).start()
+    dev = scpi(hislip(server.address[0], server.address[1], overlapped=request.param))
+    yield dev
+    dev.quit()
+    server.stop()
+
+
+def test_queries(hislip_device):
+    assert hislip_device.transport.overlapped in (False, True)
+    assert hislip_device.ask_str("*IDN?").startswith("python-scpi")
+    assert hislip_device.ask_str("FAST?") == "fast"
+
+
+def test_late_response_is_dropped(hislip_device):
+    with pytest.raises(TimeoutError):
+        hislip_device.send_command_unchecked("SLOW?", True, timeout=0.1)
+    assert hislip_device.ask_str("FAST?", timeout=2) == "fast"
+    assert hislip_device.ask_str("SYST:ERR?", timeout=2) == '0,"No error"'
+    assert hislip_device.transport.late_responses == 1
+    assert hislip_device.pop_unsolicited() is None
+
+
+def test_overlapped_queries_from_many_threads():
+    instrument = simulated_instrument()
+    instrument.add_command("ECHO?", lambda args: args)
+    server = hislip_server(instrument, overlapped=True, response_latency=0.005).start()
+    dev = scpi(hislip(server.address[0], server.address[1], overlapped=True))
+    wrong = []
+
+    def worker(index):
+        for count in range(20):
+            value = "%d_%d" % (index, count)
+            if dev.ask_str("ECHO? %s" % value) != value:
+                wrong.append(value)
+
+    try:
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        assert wrong == []
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def test_timed_out_query_behind_a_started_one(hislip_device):
+    future = hislip_device.start("SLOW?")
+    if not hislip_device.transport.overlapped:
+        # The timeout starts once the started query is answered
+        assert hislip_device.ask_str("FAST?", timeout=0.1) == "fast"
+        assert future.result(2) == "slow"
+        return
+    with pytest.raises(TimeoutError):
+        hislip_device.ask_str("FAST?", timeout=0.1)
+    # The response of the query that timed out is dropped, not the started one
+    assert future.result(2) == "slow"
+    assert hislip_device.ask_str("FAST?", timeout=2) == "fast"
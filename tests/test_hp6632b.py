@@ -0,0 +1,77 @@
+"""devices.hp6632b over the rs232 transport against the serial instrument emulator (a pty)"""
+import threading
+
+import pytest
+
+from scpi.devices import hp6632b
+from scpi.errors import CommandError
+from scpi.emulators import hp6632b_instrument, serial_server
+
+
+@pytest.fixture
+def instrument():
+    instrument = hp6632b_instrument(load_resistance=10.0)
+    server = serial_server(instrument, seed=1).start()
+    instrument.server = server
+    yield instrument
+    server.stop()
+
+
+@pytest.fixture
+def dev(instrument):
+    dev = hp6632b.rs232(instrument.server.port_name)
+    yield dev
+    dev.quit()
+
+
+def test_output(dev):
+    dev.set_voltage(5000)
+    dev.set_current(200)
+    assert dev.query_voltage() == 5.0
+    assert dev.query_current() == 0.2
+    assert dev.measure_voltage() == 0.0
+    dev.set_output(True)
+    assert dev.query_output() is True
+    assert dev.measure_voltage() == 2.0
+    assert dev.measure_current() == 0.2
+
+
+def test_command_error(dev):
+    with pytest.raises(CommandError):
+        dev.set_data_format("FOO")
+    assert dev.query_data_format() == "ASC"
+
+
+def test_binary_array(dev):
+    dev.set_voltage(1000)
+    dev.set_output(True)
+    dev.scpi.send_command("SENS:SWE:POIN 64")
+    ascii_values = dev.scpi.ask_float_list("MEAS:ARR:VOLT?")
+    dev.set_data_format("REAL,64", "SWAP")
+    values = dev.scpi.ask_binary_list("MEAS:ARR:VOLT?", big_endian=False)
+    assert len(values) == 64
+    assert values.tolist() == pytest.approx(ascii_values)
+    # The block payload can contain the line terminator, the stream stays in sync
+    assert dev.query_voltage() == 1.0
+
+
+def test_queries_from_many_threads(dev):
+    dev.set_voltage(1500)
+    results = []
+
+    def worker():
+        results.append([dev.query_voltage() for _ in range(10)])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [[1.5] * 10] * 4
+
+
+def test_injected_errors(dev, instrument):
+    instrument.server.error_rate = 1.0
+    with pytest.raises(CommandError) as excinfo:
+        dev.set_voltage(1000)
+    assert excinfo.value.code == -310
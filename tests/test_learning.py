@@ -0,0 +1,52 @@
+"""Learned per-header response times, see scpi.enable_response_learning()"""
+import pytest
+
+
+@pytest.fixture
+def dev(dev):
+    dev.enable_response_learning()
+    return dev
+
+
+def test_learned_timeout(dev):
+    assert dev.response_profile.timeout("VAL?", 1.5) == 1.5
+    for _ in range(dev.response_profile.min_samples):
+        dev.ask_int("VAL?")
+    assert dev.response_profile.timeout("VAL?", 1.5) < 1.5
+    assert dev.response_profile.as_dict()["VAL?"]["count"] == dev.response_profile.min_samples
+
+
+def test_listed_headers_are_not_learned(dev):
+    dev.set_header_timeouts({"SLOW": 5})
+    for _ in range(dev.response_profile.min_samples):
+        dev.ask_int("SLOW? 0")
+    # A long call must get the listed timeout, not a few times the short ones
+    assert dev.ask_int("SLOW? 0.5") == 1
+    assert "SLOW?" not in dev.response_profile.as_dict()
+
+
+def test_save_and_load(dev, tmp_path):
+    for _ in range(dev.response_profile.min_samples):
+        dev.ask_int("VAL?")
+    path = str(tmp_path / "profile.json")
+    dev.save_response_profile(path)
+    learned = dev.response_profile.timeout("VAL?", 1.5)
+    dev.enable_response_learning(path=path)
+    assert dev.response_profile.timeout("VAL?", 1.5) == learned
+
+
+def test_timeout_doubles_the_estimates(dev):
+    for _ in range(dev.response_profile.min_samples):
+        dev.ask_int("VAL?")
+    before = dev.response_profile.expected("VAL?", 0.99)
+    dev.response_profile.record_timeout("VAL?")
+    assert dev.response_profile.expected("VAL?", 0.99) == pytest.approx(2 * before)
+
+
+def test_profile_is_keyed_by_header(dev):
+    for _ in range(dev.response_profile.min_samples):
+        dev.ask_int("SLOW? 0")
+    # Not listed, the parameters do not count and the quick calls set the timeout
+    assert dev.response_profile.timeout("SLOW? 0.5", 5) == dev.response_profile.timeout("SLOW? 0", 5) < 5
+    dev.set_header_timeouts({"SLOW": 5})
+    assert dev.ask_int("SLOW? 0.5") == 1
@@ -0,0 +1,67 @@
+"""Numeric list parsing with the list backends, see scpi.set_list_backend()"""
+import math
+
+import pytest
+
+from scpi import scpi
+from scpi.scpi import numpy
+from scpi.transports import base
+
+BACKENDS = ['array', pytest.param('numpy', marks=pytest.mark.skipif(numpy is None, reason="needs numpy"))]
+
+
+def pop(backend, method, reply):
+    dev = scpi(base())
+    dev.set_list_backend(backend)
+    dev.message_stack.append(reply)
+    return list(getattr(dev, method)())
+
+
+def same(values, expected):
+    assert len(values) == len(expected)
+    for value, want in zip(values, expected):
+        if math.isnan(want):
+            assert math.isnan(value)
+        else:
+            assert value == want
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_int_list(backend):
+    assert pop(backend, 'pop_int_list', "1,-2,3") == [1, -2, 3]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("reply, expected", [
+    ("5,9.91E37,6", [5.0, float('nan'), 6.0]),
+    ("1,NAN,3", [1.0, float('nan'), 3.0]),
+    ("1,OFF,3", [1.0, float('nan'), 3.0]),
+    ("1.5", [1.5]),
+])
+def test_int_list_falls_back_to_floats(backend, reply, expected):
+    # numpy 1.x fromstring() used to stop at the first of these without an error
+    same(pop(backend, 'pop_int_list', reply), expected)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_float_list_sentinels(backend):
+    same(pop(backend, 'pop_float_list', "0.5,OFF,9.91E37,NAN,-1E3"),
+         [0.5, float('nan'), float('nan'), float('nan'), -1000.0])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("method, reply", [
+    ('pop_float_list', "1,2,FOO"),
+    ('pop_float_list', "1,FOO,3"),
+    # numpy.fromstring() takes these for two values
+    ('pop_float_list', "1,2,"),
+    ('pop_int_list', "1,2,"),
+])
+def test_bad_value_raises(backend, method, reply):
+    with pytest.raises(ValueError):
+        pop(backend, method, reply)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        scpi(base()).set_list_backend('tuple')
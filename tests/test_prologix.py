@@ -0,0 +1,81 @@
+"""Several instruments behind one simulated Prologix GPIB adapter"""
+import threading
+import time
+
+import pytest
+import serial as pyserial
+
+from scpi import scpi
+from scpi.errors import CommandError, TimeoutError
+from scpi.transports import prologix, prologix_adapter
+from scpi.emulators import simulated_instrument, prologix_server
+
+
+@pytest.fixture
+def server():
+    instruments = {}
+    for address in (5, 7):
+        instrument = simulated_instrument(idn="python-scpi,gpib %d,0,0.1" % address)
+        instrument.add_parameter("VALue", address, int)
+        instrument.add_command("SLOW?", lambda args: time.sleep(float(args)) or "1")
+        instruments[address] = instrument
+    server = prologix_server(instruments).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def adapter(server):
+    adapter = prologix_adapter(pyserial.Serial(server.port_name, timeout=0))
+    yield adapter
+    adapter.quit()
+
+
+@pytest.fixture
+def devices(adapter):
+    devices = dict((address, scpi(prologix(adapter, address))) for address in (5, 7))
+    yield devices
+    for dev in devices.values():
+        dev.quit()
+
+
+def test_queries_go_to_the_right_address(devices, server):
+    instruments = server.instruments
+    assert devices[5].ask_int("VAL?") == 5
+    assert devices[7].ask_int("VAL?") == 7
+    devices[7].send_command("VAL 8")
+    assert instruments[7].parameters["VAL"] == 8
+    assert instruments[5].parameters["VAL"] == 5
+    with pytest.raises(CommandError):
+        devices[5].send_command("FOO 1")
+    assert devices[7].ask_int("VAL?") == 8
+
+
+def test_address_in_use(adapter, devices):
+    with pytest.raises(RuntimeError):
+        prologix(adapter, 5)
+
+
+def test_queries_from_many_threads(devices, adapter):
+    results = {}
+
+    def worker(address):
+        results[address] = [devices[address].ask_int("VAL?") for _ in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(address,)) for address in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {5: [5] * 20, 7: [7] * 20}
+    assert adapter.stray_messages == 0
+
+
+def test_late_response_is_not_routed_to_another_address(devices, adapter):
+    with pytest.raises(TimeoutError):
+        devices[5].send_command_unchecked("SLOW? 0.3", True, timeout=0.1)
+    # The late "1" comes back for the read of address 5, ahead of this one
+    assert devices[7].ask_int("VAL?", timeout=2) == 7
+    assert devices[5].ask_int("VAL?", timeout=2) == 5
+    assert adapter.late_responses == 1
+    assert adapter.stray_messages == 0
@@ -0,0 +1,131 @@
+"""The shared reader thread, see transports.reactor"""
+import os
+import threading
+
+import serial as pyserial
+
+from scpi import scpi
+from scpi.errors import TimeoutError
+from scpi.transports import rs232
+from scpi.transports.reactor import reactor
+from scpi.emulators import serial_server, simulated_instrument
+
+
+def test_callbacks():
+    shared = reactor()
+    read_fd, write_fd = os.pipe()
+    received = threading.Event()
+
+    def readable():
+        os.read(read_fd, 512)
+        received.set()
+
+    try:
+        shared.register(read_fd, readable)
+        os.write(write_fd, b"x")
+        assert received.wait(2)
+        shared.unregister(read_fd)
+    finally:
+        shared.stop()
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_failing_callback_does_not_stop_the_others():
+    shared = reactor()
+    bad_read, bad_write = os.pipe()
+    good_read, good_write = os.pipe()
+    received = threading.Event()
+
+    def failing():
+        os.read(bad_read, 512)
+        raise UnicodeDecodeError('utf-8', b"\xff", 0, 1, "invalid start byte")
+
+    def readable():
+        os.read(good_read, 512)
+        received.set()
+
+    try:
+        shared.register(bad_read, failing)
+        shared.register(good_read, readable)
+        os.write(bad_write, b"x")
+        os.write(good_write, b"x")
+        assert received.wait(2)
+        assert shared.reactor_thread.is_alive()
+        shared.unregister(bad_read)
+        shared.unregister(good_read)
+    finally:
+        shared.stop()
+        for fd in (bad_read, bad_write, good_read, good_write):
+            os.close(fd)
+
+
+def test_unregister_after_the_thread_died():
+    shared = reactor()
+    read_fd, write_fd = os.pipe()
+    try:
+        shared.register(read_fd, lambda: os.read(read_fd, 512))
+        # Simulates the thread dying without going through stop()
+        shared.reactor_alive = False
+        shared.wakeup()
+        shared.reactor_thread.join(2)
+        unregistered = threading.Event()
+
+        def unregister():
+            shared.unregister(read_fd)
+            unregistered.set()
+
+        thread = threading.Thread(target=unregister)
+        thread.daemon = True
+        thread.start()
+        assert unregistered.wait(2)
+    finally:
+        shared.stop()
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_undecodable_response_on_one_port():
+    shared = reactor()
+    bad_instrument = simulated_instrument()
+    bad_instrument.add_command("GARBage?", lambda args: b"\xff\xfe")
+    servers = [serial_server(bad_instrument).start(), serial_server(simulated_instrument()).start()]
+    devices = [scpi(rs232(pyserial.Serial(server.port_name, timeout=0), reactor=shared)) for server in servers]
+    try:
+        bad, good = devices
+        try:
+            bad.send_command_unchecked("GARB?", True, timeout=0.3)
+        except TimeoutError:
+            pass
+        assert shared.reactor_thread.is_alive()
+        assert good.send_command_unchecked("*IDN?", True, timeout=2).startswith("python-scpi")
+        assert bad.send_command_unchecked("*IDN?", True, timeout=2).startswith("python-scpi")
+    finally:
+        quitters = [threading.Thread(target=dev.quit) for dev in devices]
+        for thread in quitters:
+            thread.daemon = True
+            thread.start()
+        for thread in quitters:
+            thread.join(5)
+            assert not thread.is_alive()
+        shared.stop()
+        for server in servers:
+            server.stop()
+
+
+def test_quit_after_a_read_error(capsys):
+    shared = reactor()
+    server = serial_server(simulated_instrument()).start()
+    transport = rs232(pyserial.Serial(server.port_name, timeout=0), reactor=shared)
+    try:
+        def failing():
+            raise IOError("port gone")
+        transport.serial_read_ready = failing
+        transport._reactor_read_ready()
+        assert not transport.serial_alive
+        transport.quit()
+        # Unregistered once, by the read error
+        assert capsys.readouterr().out.count("Got exception") == 1
+    finally:
+        shared.stop()
+        server.stop()
@@ -0,0 +1,168 @@
+"""Resynchronizing after timeouts, see scpi.set_timeout_recovery()"""
+import time
+
+import pytest
+import serial as pyserial
+
+from scpi import scpi
+from scpi.devices.cmd57 import cmd57
+from scpi.errors import AbortedError, TimeoutError
+from scpi.transports import rs232, tcp
+from scpi.emulators import hp6632b_instrument, cmd57_instrument, tcp_server, serial_server
+
+
+@pytest.fixture
+def dev(dev):
+    dev.set_timeout_recovery(True)
+    return dev
+
+
+def test_late_reply_is_not_taken_for_the_sentinel(dev, instrument):
+    dev.send_command("*ESE 32")
+    # The late "1" matches the marker, it must still not pass for the answer
+    dev._random.sample = lambda population, count: [1, 2]
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.3", timeout=0.1)
+    assert dev.ask_int("VAL?") == 5
+    assert dev.recoveries == 1
+    assert dev.discarded_messages == 1
+    # The register is set back
+    assert dev.ask_int("*ESE?") == 32
+    assert instrument.ese == 32
+
+
+def test_failed_recovery_keeps_discarding(dev):
+    dev.recovery_timeout = 0.1
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.8", timeout=0.1)
+    # The error check after the timeout waits behind SLOW? as well
+    assert dev.failed_recoveries == 2
+    # The late "1", the answers to the sentinels and the error check come before this one
+    assert dev.ask_int("VAL?") == 5
+    assert dev.discarded_messages == 2
+    assert dev.ask_int("*ESE?") == 0
+
+
+def test_failed_recoveries_restore_ese(dev):
+    dev.send_command("*ESE 4")
+    dev.recovery_timeout = 0.1
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.8", timeout=0.1)
+    # Again after the error check, the device was busy the whole time
+    assert dev.failed_recoveries == 2
+    dev.recovery_timeout = 2.0
+    assert dev.ask_int("VAL?") == 5
+    # Only the first sentinel reads the user's value back
+    assert dev.ask_int("*ESE?") == 4
+
+
+def test_recovery_aborts_started_operation(instrument):
+    server = tcp_server(instrument, control_port=0).start()
+    dev = scpi(tcp(*server.address, control_port=server.control_address[1]))
+    dev.set_timeout_recovery(True)
+    try:
+        instrument.add_command("RUN", lambda args: None)
+        # The operation never completes on its own
+        instrument.operation_complete = lambda: None
+        future = dev.start("RUN", timeout=10)
+        with pytest.raises(TimeoutError):
+            dev.ask_int("SLOW? 0.3", timeout=0.1)
+        assert server.device_clears == 1
+        with pytest.raises(AbortedError):
+            future.result(5)
+        assert dev.ask_int("VAL?") == 5
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def test_recovery_without_device_clear_keeps_started_operation(dev, instrument):
+    instrument.add_command("RUN", lambda args: None)
+    instrument.operation_complete = lambda: None
+    future = dev.start("RUN", timeout=10)
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.3", timeout=0.1)
+    # No control port, the device was not cleared and the operation runs on
+    assert dev.recoveries == 1
+    assert not future.done()
+    instrument.esr |= 0x01
+    assert future.result(5) is None
+
+
+def test_failed_recovery_does_not_abort_started_operation(instrument):
+    server = tcp_server(instrument, control_port=0).start()
+    dev = scpi(tcp(*server.address, control_port=server.control_address[1]))
+    dev.set_timeout_recovery(True, 0.1)
+    try:
+        instrument.add_command("RUN", lambda args: None)
+        instrument.operation_complete = lambda: None
+        future = dev.start("RUN", timeout=10)
+        with pytest.raises(TimeoutError):
+            dev.ask_int("SLOW? 0.8", timeout=0.1)
+        assert dev.failed_recoveries >= 1
+        assert not dev._operation_aborted.is_set()
+        assert not future.done()
+        # The device was cleared, once the sentinel is answered it fails
+        dev.recovery_timeout = 2.0
+        assert dev.ask_int("VAL?") == 5
+        with pytest.raises(AbortedError):
+            future.result(5)
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def test_query_behind_started_query_is_not_recovered(dev):
+    future = dev.start("SLOW? 0.3")
+    with pytest.raises(TimeoutError):
+        with dev.deadline(0.1):
+            dev.ask_int("VAL?")
+    assert (dev.recoveries, dev.failed_recoveries) == (0, 0)
+    assert future.result(5) == "1"
+    # Its late answer is dropped
+    assert dev.ask_float("LEV?") == 0.5
+    assert dev.discarded_messages == 1
+
+
+def test_cmd57_query_waits_for_the_started_one():
+    instrument = cmd57_instrument(time_scale=0.0, seed=1)
+    server = tcp_server(instrument).start()
+    dev = cmd57(tcp(*server.address))
+    try:
+        dev.switch_to_man_btch()
+        instrument.time_scale = 0.5
+        future = dev.start_ber_test()
+        # Answered after the BER test, its timeout starts then
+        assert dev.scpi.ask_int("CONF:CHAN:BTS:TCH:ARFC?", timeout=0.2) == 1
+        assert future.result(5) == "PASS"
+        assert dev.scpi.recoveries == 0
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def test_hp6632b_serial_recovery():
+    instrument = hp6632b_instrument()
+    instrument.add_command("SLOW?", lambda args: time.sleep(float(args)) or "1")
+    server = serial_server(instrument).start()
+    dev = scpi(rs232(pyserial.Serial(server.port_name, timeout=0)))
+    dev.set_timeout_recovery(True)
+    try:
+        dev.send_command("SOUR:VOLT 1.5")
+        with pytest.raises(TimeoutError):
+            dev.ask_int("SLOW? 0.3", timeout=0.1)
+        assert dev.ask_float("SOUR:VOLT?") == 1.5
+        assert dev.recoveries == 1
+    finally:
+        dev.quit()
+        server.stop()
+
+
+def test_recovery_stops_waiting_at_the_deadline(dev):
+    started = time.time()
+    with dev.deadline(0.2):
+        with pytest.raises(TimeoutError):
+            dev.ask_int("SLOW? 0.5")
+    assert time.time() - started < 0.4
+    assert dev.failed_recoveries >= 1
+    assert dev.ask_int("VAL?") == 5
@@ -0,0 +1,66 @@
+"""transports.rs232 on the pty of the serial instrument emulator"""
+import time
+
+import pytest
+import serial as pyserial
+
+from scpi.transports import rs232
+from scpi.emulators import serial_server, simulated_instrument
+
+
+@pytest.fixture
+def transport():
+    server = serial_server(simulated_instrument()).start()
+    transport = rs232(pyserial.Serial(server.port_name, timeout=0))
+    # ptys have no modem lines, the test sets them
+    transport.lines = {'CTS': True, 'DSR': True, 'RI': False, 'CD': False}
+    transport.read_modem_lines = lambda: dict(transport.lines)
+    yield transport
+    if transport.serial_alive:
+        transport.quit()
+    server.stop()
+
+
+def monitor(transport, interval):
+    """Starts the modem line monitor, returns the list the (line, state) events go to"""
+    events = []
+    transport.monitor_modem_lines(lambda timestamp, line, state: events.append((line, state)), interval)
+    return events
+
+
+def wait_for(events, count):
+    started = time.time()
+    while len(events) < count and time.time() - started < 2:
+        time.sleep(0.01)
+    return events
+
+
+def test_initial_states_and_changes(transport):
+    events = monitor(transport, 0.01)
+    assert wait_for(events, 4) == [('CD', False), ('CTS', True), ('DSR', True), ('RI', False)]
+    transport.lines['CTS'] = False
+    assert wait_for(events, 5)[4:] == [('CTS', False)]
+    time.sleep(0.05)
+    # Only the changes are reported
+    assert len(events) == 5
+
+
+def test_stop_wakes_the_monitor(transport):
+    events = monitor(transport, 60)
+    wait_for(events, 4)
+    thread = transport.modem_thread
+    started = time.time()
+    transport.stop_modem_monitor()
+    assert time.time() - started < 0.5
+    assert not thread.is_alive()
+    transport.lines['CTS'] = False
+    time.sleep(0.05)
+    assert len(events) == 4
+
+
+def test_quit_stops_the_monitor(transport):
+    events = monitor(transport, 60)
+    wait_for(events, 4)
+    thread = transport.modem_thread
+    transport.quit()
+    assert not thread.is_alive()
@@ -0,0 +1,200 @@
+"""The scpi core against the simulated instrument over TCP"""
+import threading
+import time
+
+import pytest
+
+from scpi.cache import parameter_cache
+from scpi.errors import CommandError, DeferredCommandError, TimeoutError
+
+
+def test_ask(dev):
+    assert dev.ask_int("VAL?") == 5
+    assert dev.ask_float("LEV?") == 0.5
+    assert dev.ask_str("ECHO? foo") == "foo"
+    assert dev.ask_bool("ECHO? 1") is True
+    assert dev.ask_int_list("ECHO? 1,2,3") == [1, 2, 3]
+    assert dev.ask_int_onoff("ECHO? OFF") is None
+
+
+def test_command_error(dev):
+    dev.send_command("VAL 7")
+    with pytest.raises(CommandError) as excinfo:
+        dev.send_command("FOO 1")
+    assert excinfo.value.code == -113
+    assert dev.ask_int("VAL?") == 7
+
+
+def test_queries_from_many_threads(dev):
+    results = {}
+
+    def worker(index):
+        results[index] = [dev.ask_str("ECHO? %d-%d" % (index, count)) for count in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index in range(8):
+        assert results[index] == ["%d-%d" % (index, count) for count in range(20)]
+
+
+def test_ask_many(dev, instrument):
+    assert dev.ask_many([("VAL?", int), ("LEV?", float), ("ECHO? a", str)]) == [5, 0.5, "a"]
+    # One line for the queries, one for the error check
+    assert instrument.received_lines == ["VAL?;:LEV?;:ECHO? a", "SYST:ERR?"]
+
+
+def test_deferred_errors(dev, instrument):
+    with pytest.raises(DeferredCommandError) as excinfo:
+        with dev.deferred_errors():
+            dev.send_command("VAL 7")
+            dev.send_command("FOO 1")
+            dev.send_command("LEV 1.5")
+    assert excinfo.value.errors == [("FOO 1", -113, "Undefined header;FOO")]
+    assert instrument.received_lines.count("SYST:ERR?") == 2
+    assert dev.ask_float("LEV?") == 1.5
+
+
+def test_deferred_errors_are_read_when_the_block_raises(dev):
+    with pytest.raises(ZeroDivisionError) as excinfo:
+        with dev.deferred_errors():
+            dev.send_command("FOO 1")
+            1 / 0
+    assert excinfo.value.deferred_errors == [("FOO 1", -113, "Undefined header;FOO")]
+    # The error does not go to the next checked command
+    dev.send_command("VAL 7")
+
+
+def test_deferred_errors_match_whole_header_nodes(dev):
+    commands = ["VOLT 1", "SOUR:VOLTage:PROT 5", "OUTP 1"]
+    assert dev._guess_error_command("Undefined header;SOUR:VOLTAGE:PROT", commands) == "SOUR:VOLTage:PROT 5"
+    assert dev._guess_error_command("Undefined header;SOUR:VOLTAGE", commands) is None
+    assert dev._guess_error_command("Data out of range;OUTP", commands) == "OUTP 1"
+
+
+def test_block(dev, instrument):
+    instrument.add_command("BLOCk?", lambda args: b"#15a\r\nbc")
+    assert dev.ask_block("BLOC?").tobytes() == b"a\r\nbc"
+    assert dev.ask_int("VAL?") == 5
+
+
+def test_command_compiler(dev, instrument):
+    dev.set_command_compiler()
+    dev.send_command("VALue 7.000")
+    assert dev.ask_float("LEVel?") == 0.5
+    assert instrument.received_lines[0] == "VAL 7"
+    assert "LEV?" in instrument.received_lines
+    with pytest.raises(CommandError):
+        dev.send_command("FOO 1")
+
+
+def test_parameter_cache(dev, instrument):
+    dev.set_parameter_cache(prefixes=("VAL",))
+    assert dev.ask_int("VALue?") == 5
+    assert dev.ask_int("VAL?") == 5
+    assert instrument.received_lines.count("VAL?") + instrument.received_lines.count("VALue?") == 1
+    dev.send_command("VAL 7")
+    assert dev.ask_int("VAL?") == 7
+    assert instrument.parameters["VAL"] == 7
+    dev.send_command("*RST")
+    assert dev.ask_int("VAL?") == 5
+    assert dev.parameter_cache.hits == 2
+    # Not in the prefixes
+    dev.ask_float("LEV?")
+    dev.ask_float("LEV?")
+    assert instrument.received_lines.count("LEV?") == 2
+
+
+def test_parameter_cache_resolves_relative_headers():
+    cache = parameter_cache(prefixes=("SOUR:",))
+    cache.store("SOUR:VOLT?", "1")
+    cache.store("SOUR:CURR?", "2")
+    cache.store("SOUR:LIST:CURR?", "3")
+    # CURR is SOUR:CURR here
+    cache.command_sent("SOURce:VOLTage 1.5;CURRent 0.5")
+    assert cache.lookup("SOUR:CURR?") is None
+    assert cache.lookup("SOUR:LIST:CURR?") == "3"
+    cache.command_sent("SOUR:LIST:VOLT 1;*WAI;CURR 2")
+    assert cache.lookup("SOUR:LIST:CURR?") is None
+    # Back to the root
+    cache.store("SOUR:CURR?", "2")
+    cache.command_sent("SYST:BEEP;:SOUR:CURR 1")
+    assert cache.lookup("SOUR:CURR?") is None
+
+
+def test_stats(dev):
+    dev.enable_stats()
+    for _ in range(3):
+        dev.ask_int("VAL?")
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.3", timeout=0.05)
+    stats = dev.stats.as_dict()
+    assert stats["VAL?"]["commands"] == 3
+    assert stats["VAL?"]["bytes_sent"] == 3 * len("VAL?\n")
+    assert stats["VAL?"]["bytes_received"] == 3 * len("5\n")
+    assert stats["SLOW?"]["timeouts"] == 1
+    dev.stats.reset()
+    assert dev.stats.as_dict() == {}
+
+
+def test_stats_toggled_during_a_query(dev):
+    dev.enable_stats()
+    stats = dev.stats
+    results = []
+    thread = threading.Thread(target=lambda: results.append(dev.ask_int("SLOW? 0.2")))
+    thread.start()
+    time.sleep(0.1)
+    # The response arrives with the stats off, it has no response time
+    dev.enable_stats(False)
+    thread.join()
+    assert results == [1]
+    assert stats.as_dict()["SLOW?"]["commands"] == 1
+    assert dev.ask_int("VAL?") == 5
+
+
+@pytest.mark.parametrize("method", ['queue', 'stb', 'esr'])
+def test_error_check_methods(dev, instrument, method):
+    dev.set_error_check(method)
+    dev.send_command("VAL 7")
+    with pytest.raises(CommandError) as excinfo:
+        dev.send_command("FOO 1")
+    assert excinfo.value.code == -113
+    dev.send_command("VAL 8")
+    if method != 'queue':
+        # The error queue is only read when there are errors
+        assert instrument.received_lines.count("SYST:ERR?") == 2
+
+
+def test_unknown_error_check_method(dev):
+    with pytest.raises(ValueError):
+        dev.set_error_check('foo')
+
+
+
+def test_deadline(dev, instrument):
+    started = time.time()
+    with dev.deadline(0.2):
+        with dev.deadline(5):
+            with pytest.raises(TimeoutError):
+                dev.ask_int("SLOW? 0.5")
+        lines = len(instrument.received_lines)
+        # Later commands time out at once, without going to the device
+        with pytest.raises(TimeoutError):
+            dev.send_command("VAL 7")
+    assert time.time() - started < 0.4
+    assert len(instrument.received_lines) == lines
+
+
+def test_header_timeouts(dev):
+    dev.set_header_timeouts({"SLOW": 0.1, "SLOW:FOO": 3.0})
+    assert dev.header_timeout("SLOW? 1") == 0.1
+    assert dev.header_timeout("SLOW:FOO?") == 3.0
+    assert dev.header_timeout("VAL?") == dev.command_timeout
+    # The longest part wins
+    assert dev.header_timeout("SLOW? 1;:SLOW:FOO?") == 3.0
+    assert dev.header_timeout_listed("VAL?;:SLOW? 1")
+    assert not dev.header_timeout_listed("VAL?")
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.3", timeout=0.05)
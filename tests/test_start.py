@@ -0,0 +1,32 @@
+"""Long running commands started with scpi.start()"""
+import pytest
+
+from scpi.errors import CommandError
+
+
+def test_query(dev):
+    future = dev.start("SLOW? 0.2", dev.pop_int)
+    assert not future.done()
+    assert future.result(2) == 1
+    assert dev.ask_int("VAL?") == 5
+
+
+def test_compound_query(dev, instrument):
+    future = dev.start("VAL 7;:SLOW? 0.1", dev.pop_int)
+    assert future.result(2) == 1
+    assert "VAL 7;:SLOW? 0.1" in instrument.received_lines
+    assert dev.ask_int("VAL?") == 7
+
+
+def test_operation(dev, instrument):
+    instrument.add_command("RUN", lambda args: None)
+    future = dev.start("RUN")
+    assert future.result(2) is None
+    assert "RUN;*OPC" in instrument.received_lines
+    assert dev.ask_int("VAL?") == 5
+
+
+def test_failing_operation(dev):
+    future = dev.start("FOO 1")
+    with pytest.raises(CommandError):
+        future.result(2)
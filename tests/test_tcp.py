@@ -0,0 +1,72 @@
+"""transports.tcp against the loopback server, see emulators.tcp_server"""
+import socket
+import time
+
+import pytest
+
+from scpi import scpi
+from scpi.errors import TimeoutError
+from scpi.transports import tcp
+from scpi.transports.reactor import reactor
+from scpi.emulators import tcp_server
+
+
+@pytest.fixture
+def server(instrument):
+    server = tcp_server(instrument, control_port=0).start()
+    yield server
+    server.stop()
+
+
+def test_connect(dev):
+    sock = dev.transport.sock
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    assert dev.ask_str("*IDN?").startswith("python-scpi")
+
+
+def test_connection_refused():
+    # A free port nobody listens on
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    with pytest.raises(socket.error):
+        tcp("127.0.0.1", port, connect_timeout=1)
+
+
+def test_query_timeout(dev):
+    with pytest.raises(TimeoutError):
+        dev.ask_int("SLOW? 0.3", timeout=0.05)
+
+
+def test_abort_without_control_port(dev, instrument):
+    dev.transport.framer.feed(b"#15ab")
+    assert dev.transport.incoming_data()
+    dev.abort_command()
+    # The half-received message is gone
+    assert not dev.transport.incoming_data()
+    assert dev.ask_int("VAL?") == 5
+
+
+def test_abort_with_control_port(server):
+    dev = scpi(tcp(*server.address, control_port=server.control_address[1]))
+    try:
+        dev.abort_command()
+        started = time.time()
+        while server.device_clears < 1 and time.time() - started < 2:
+            time.sleep(0.01)
+        assert server.device_clears == 1
+        assert dev.ask_int("VAL?") == 5
+    finally:
+        dev.quit()
+
+
+def test_reactor(instrument):
+    shared = reactor()
+    dev = scpi(tcp(*instrument.address, reactor=shared))
+    try:
+        assert dev.ask_str("ECHO? foo") == "foo"
+    finally:
+        dev.quit()
+        shared.stop()